@@ -0,0 +1,231 @@
+"""
+Author: OnLogic
+For:    K800 Reference Documentation
+Title:  K800 CAN Utility Benchmark Suite
+
+Description:
+    Offline throughput benchmarks for k800_can_utility.py, so bitrate or configuration
+    changes can be compared across versions. No K800 is needed:
+
+        slcan       slcan ASCII encode (bus.send) and decode (bus.recv) speed over a loop:// port
+        message     can.Message construction cost as used in the send loop (generate_frames)
+        end_to_end  frames/s from TransmitEngine through k800_emulator.py, which paces frames
+                    at each bitrate in valid_bit_rates and loops them back to a Receiver
+        receive     receive path cost (Receiver + drain) with and without printing frames
+        filter, log, record, shm
+                    the utility's own --benchmark functions; shm feeds the shared memory ring
+                    at the 1000 kbps maximum frame rate to three reader processes
+
+    Results are written as JSON, to stdout or --output, together with the Python and
+    python-can versions for tracking across versions.
+
+Usage:
+    python benchmarks/benchmark_k800.py [-h] [--only NAME ...] [--duration SECONDS] [--output FILE]
+
+Examples:
+    python benchmarks/benchmark_k800.py --output results.json
+    python benchmarks/benchmark_k800.py --only slcan receive
+    python benchmarks/benchmark_k800.py --only end_to_end --duration 2
+"""
+import os
+import sys
+import time
+import json
+import platform
+import argparse
+import itertools
+import subprocess
+from datetime import datetime
+
+import can
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import k800_can as k800
+
+# generate_frames() state, normally initialised by k800_can.main()
+k800.number, k800.is_increment = 0, True
+
+
+'''---------------- Global Variables ----------------'''
+SLCAN_FRAMES   = 20000  # frames encoded and decoded by the slcan benchmark
+SLCAN_CHUNK    = 100    # frames encoded before decoding them again (fits the loop:// buffer)
+MESSAGE_FRAMES = 100000 # messages built by the construction benchmark
+RECEIVE_FRAMES = 200000 # frames drained by the receive path benchmark
+E2E_DURATION   = 1.0    # seconds of traffic per bitrate in the end-to-end benchmark
+E2E_TIMEOUT    = 0.5    # seconds to wait for frames still in flight after sending stops
+
+# MCU emulator serving the end-to-end benchmark
+EMULATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'k800_emulator.py')
+'''--------------------------------------------------'''
+
+
+def rate(count, elapsed):
+    return count / elapsed if elapsed > 0 else float('inf')
+
+
+def slcan_bus(channel, bit_rate=None):
+    """python-can slcan bus without the 2 s settle delay meant for real USB adapters."""
+    return can.Bus(interface='slcan', channel=channel, bitrate=bit_rate * 1000 if bit_rate else None,
+                   sleep_after_open=0)
+
+
+def benchmark_slcan(count=SLCAN_FRAMES):
+    """slcan ASCII encode (bus.send to the port) and decode (bus.recv from it) in frames/s."""
+    bus = slcan_bus('loop://')
+    bus.serialPortOrig.reset_input_buffer()
+    frames = list(itertools.islice(k800.generate_frames(), count))
+    results = {'frames': count}
+
+    # loop:// buffers at most 4 KiB, so alternate short encode and decode runs
+    encode = decode = 0.0
+    received = 0
+    for i in range(0, count, SLCAN_CHUNK):
+        start = time.perf_counter()
+        for msg in frames[i:i + SLCAN_CHUNK]:
+            bus.send(msg)
+        encode += time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in frames[i:i + SLCAN_CHUNK]:
+            if bus.recv(timeout=0.1) is not None:
+                received += 1
+        decode += time.perf_counter() - start
+    results['encode_fps'] = rate(count, encode)
+    results['decode_fps'] = rate(received, decode)
+    results['decoded'] = received
+    bus.shutdown()
+    return results
+
+
+def benchmark_message(count=MESSAGE_FRAMES):
+    """Messages/s built by the send loop's generate_frames() and by a bare can.Message call."""
+    frames = k800.generate_frames()
+    start = time.perf_counter()
+    for _ in range(count):
+        next(frames)
+    results = {'messages': count, 'generate_frames_per_s': rate(count, time.perf_counter() - start)}
+
+    data = b'K800_1'
+    start = time.perf_counter()
+    for _ in range(count):
+        can.Message(arbitration_id=0x123, is_extended_id=True, data=data)
+    results['can_message_per_s'] = rate(count, time.perf_counter() - start)
+    return results
+
+
+class EmulatorProcess:
+    """k800_emulator.py in its own process, so it does not compete with the utility for the GIL."""
+
+    def __init__(self, *options):
+        self._process = subprocess.Popen([sys.executable, EMULATOR, *options], stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL, text=True)
+        ports = dict(self._process.stdout.readline().strip().split(': ', 1) for _ in range(2))
+        self.mgmt_port = ports['Management port']
+        self.vcan_port = ports['VCAN port']
+
+    def close(self):
+        self._process.terminate()
+        self._process.wait()
+        self._process.stdout.close()
+
+
+def benchmark_end_to_end(duration=E2E_DURATION):
+    """
+    Frames/s sent by TransmitEngine at a 100 % bus load target and looped back by the
+    emulated K800 at every bitrate, against the theoretical maximum for the sent frames.
+    """
+    msg = next(k800.generate_frames())
+    bits = k800.frame_bit_length(len(msg.data), msg.is_extended_id) + k800.stuff_bit_count(msg)
+    results = {}
+    for bit_rate in k800.valid_bit_rates:
+        emulator = EmulatorProcess('--loopback', '-b', str(bit_rate))
+        try:
+            bus = slcan_bus(emulator.vcan_port, bit_rate)
+        except can.CanError as e:
+            emulator.close()
+            results[str(bit_rate)] = f"unavailable: {e}"
+            continue
+        receiver = k800.Receiver(bus).start()
+        engine = k800.TransmitEngine(bus, k800.generate_frames(), bus_load=100, bitrate=bit_rate)
+        start = time.perf_counter()
+        engine.run(duration=duration)
+        deadline = time.perf_counter() + E2E_TIMEOUT
+        while receiver.received < engine.stats.sent and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        receiver.stop()
+        bus.shutdown()
+        emulator.close()
+
+        received = receiver.received
+        results[str(bit_rate)] = {
+            'sent': engine.stats.sent,
+            'received': received,
+            'received_fps': rate(received, elapsed),
+            'max_fps': bit_rate * 1000 / bits,
+            'efficiency_pct': 100 * rate(received, elapsed) * bits / (bit_rate * 1000),
+        }
+    return results
+
+
+def benchmark_receive(count=RECEIVE_FRAMES):
+    """Receive path frames/s (synthetic bus, Receiver thread, drain) without and with printing."""
+    results = {'frames': count}
+    for name, consumers in (('quiet_fps', []), ('print_fps', [k800.print_frames])):
+        bus = k800.synthetic_bus(ids=range(0x100, 0x140))
+        receiver = k800.Receiver(bus).start()
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            start = time.perf_counter()
+            receiver.drain(consumers, count=count)
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            receiver.stop()
+            bus.shutdown()
+        results[name] = rate(count, elapsed)
+    results['print_cost_us'] = 1e6 / results['print_fps'] - 1e6 / results['quiet_fps']
+    return results
+
+
+BENCHMARKS = {
+    'slcan':      benchmark_slcan,
+    'message':    benchmark_message,
+    'end_to_end': benchmark_end_to_end,
+    'receive':    benchmark_receive,
+    **k800.BENCHMARKS,
+}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="K800 CAN Utility Benchmark Suite")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--duration', type=float, default=E2E_DURATION,
+                        help="seconds of traffic per bitrate in the end-to-end benchmark")
+    parser.add_argument('-o', '--output', metavar='FILE', help="write the JSON results to FILE instead of stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    report = {
+        'date':       datetime.now().isoformat(timespec='seconds'),
+        'python':     platform.python_version(),
+        'python_can': can.__version__,
+        'platform':   platform.platform(),
+        'results':    {},
+    }
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...", file=sys.stderr)
+        benchmark = BENCHMARKS[name]
+        report['results'][name] = benchmark(args.duration) if name == 'end_to_end' else benchmark()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4523 @@
+"""
+Author: OnLogic
+For:    K800 Reference Documentation
+Title:  K800 Example Python CAN Bus Utility (implementation)
+
+Description:
+    Implementation of k800_can_utility.py, kept in an importable module so Python caches
+    its bytecode between runs. The emulator, the benchmark suite and the tests import it
+    directly; see k800_can_utility.py for usage and examples.
+"""
+
+import time
+import sys
+import argparse
+import re
+import os
+import errno
+import json
+import glob
+import mmap
+import struct
+import bisect
+import queue
+import math
+import importlib
+import importlib.util
+import functools
+import select
+import signal
+from array import array
+import itertools
+import threading
+from collections import deque
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so `-h`, argument
+    errors and code paths that never touch the bus do not pay for importing python-can
+    (with its interface plugin scan), pyserial, numpy and friends.
+    """
+
+    def __init__(self, name, *submodules):
+        self._name       = name
+        self._submodules = submodules
+        self._module     = None
+
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            for submodule in self._submodules:
+                importlib.import_module(f'{self._name}.{submodule}')
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{' (loaded)' if self._module else ''}>"
+
+
+def optional_module(name, *submodules):
+    """LazyModule for an optional dependency, or None when it is not installed."""
+    try:
+        found = importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        found = False
+    return LazyModule(name, *submodules) if found else None
+
+
+def preload(*modules):
+    """Import lazy modules now, e.g. to time the import on its own."""
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
+
+
+serial       = LazyModule('serial')
+system_ports = LazyModule('serial.tools.list_ports')
+can          = LazyModule('can')
+asyncio      = LazyModule('asyncio')
+socket       = LazyModule('socket')
+shared_memory    = LazyModule('multiprocessing.shared_memory')
+resource_tracker = LazyModule('multiprocessing.resource_tracker')
+
+serial_asyncio = optional_module('serial_asyncio')                # optional, only needed by AsyncK800Session
+pyudev         = optional_module('pyudev')                        # optional, event-driven PortWatcher on Linux
+cantools       = optional_module('cantools')                      # optional, --dbc signal decoding
+np             = optional_module('numpy')                         # optional, batch signal decoding and CaptureStore
+pyarrow        = optional_module('pyarrow', 'ipc', 'parquet')     # optional, CaptureStore Arrow/Parquet export
+
+
+class StartupProfile:
+    """Time spent in each startup phase, from module import to the first frame (--profile-startup)."""
+
+    def __init__(self):
+        self.start  = time.perf_counter()
+        self.last   = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        lines = ["Startup profile:"]
+        for phase, seconds in self.phases:
+            lines.append(f"  {phase:<24} {seconds * 1000:9.1f} ms")
+        lines.append(f"  {'total':<24} {(self.last - self.start) * 1000:9.1f} ms")
+        return '\n'.join(lines)
+
+
+# Startup phases of this process, marked by main() and K800Device.open()
+STARTUP = StartupProfile()
+
+'''---------------- Global Variables ----------------'''
+# Vendor ID and Product ID assigned by MCU vendor
+MCU_VID_PID = '353F:A101'
+
+# USB interface numbers of the K800 CDC ports
+MGMT_INTERFACE = 0  # management shell (equivalent to Putty terminal)
+VCAN_INTERFACE = 2  # slcan virtual CAN port
+
+# Per-user cache of discovered ports and parsed databases
+CACHE_DIR  = os.path.join(os.path.expanduser('~'), '.cache', 'k800_can_utility')
+
+# Last discovered K800 ports, reused while the device paths still belong to the same unit
+PORT_CACHE = os.path.join(CACHE_DIR, 'ports.json')
+# CAN configuration last applied to each unit, by USB serial number
+CONFIG_CACHE = os.path.join(CACHE_DIR, 'config.json')
+
+# True for command-line, False to use regular variables in main
+USE_ARGPARSE = True  # default to CMD
+
+# Default values (used when USE_ARGPARSE is False)
+DEFAULT_MODE     = 's'   # 's', send or 'r', receive
+DEFAULT_BITRATE  = 1000  # baud in kbps
+valid_bit_rates  = [10, 20, 50, 100, 125, 250, 500, 750, 1000]
+LED_CHECK        = 'off' # whether to initialte led check or not,
+                         # 'off' or 'on'
+DEFAULT_FPS      = 10    # send mode frame rate when no --bus-load target is given
+DEFAULT_INTERFACE = 'slcan' # 'slcan' or 'socketcan' (Linux kernel slcan) for the K800,
+                            # 'virtual' or 'synthetic' for hardware-free testing
+DEFAULT_RING_SIZE = 4096 # receive mode ring buffer capacity in frames
+RECV_BATCH       = 256   # max frames handed to receive consumers per batch
+MCU_PROMPT       = b'uart:~$' # management shell prompt printed after every command
+MCU_TIMEOUT      = 1.0   # seconds to wait for the management shell to answer a command
+SLCAN_OPEN_DELAY = None  # settle time after opening the VCAN port, None for python-can's 2 s (--open-delay)
+                         # for USB-serial adapters that reset on open, the K800 MCU does not
+LED_COUNT        = 4     # on-board LEDs, LED0 0..3
+
+# LED blink patterns, each step the on/off state of LED0 0..3
+LED_PATTERNS = {
+    'on':        [(1, 1, 1, 1)],
+    'blink':     [(1, 1, 1, 1), (0, 0, 0, 0)],
+    'alternate': [(1, 0, 1, 0), (0, 1, 0, 1)],
+    'chase':     [(1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1)],
+}
+'''--------------------------------------------------'''
+
+def inc_dec_data_string(low=0, high=9):
+    """Generate oscillating data string for debugging."""
+    global number, is_increment
+    if number == low:
+        is_increment = True
+    elif number == high:
+        is_increment = False
+
+    number += 1 if is_increment else -1
+    return f'K800_{number}'
+
+
+def generate_frames():
+    """Endless stream of example frames carrying the oscillating data string on ID 0x123."""
+    while True:
+        # generate data string
+        data = inc_dec_data_string()
+
+        # Get the current time to add to can frame report
+        msg_time = time.time()
+
+        # encode as bytes, transmitting in specified frame format
+        yield can.Message(timestamp=msg_time, arbitration_id=0x123, is_extended_id=True, data=data.encode('utf-8'))
+
+
+'''---------------- Management Shell ----------------'''
+# VT100 escape sequences the MCU shell uses for colours and line editing
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+
+# Response lines reporting a failed management shell command
+MCU_ERROR = re.compile(r'^error\b|command not found|wrong parameter count|invalid (argument|parameter|value)',
+                       re.IGNORECASE)
+
+
+class McuError(RuntimeError):
+    """The management shell answered a command with an error."""
+
+
+def parse_mcu_response(command, raw):
+    """Strip echo, escape sequences and prompt from a shell response, raising McuError on failure."""
+    text  = ANSI_ESCAPE.sub('', raw.decode(errors='replace')).replace('\r', '')
+    if text.endswith(MCU_PROMPT.decode()):
+        text = text[:-len(MCU_PROMPT)]
+    lines = [line.strip() for line in text.split('\n')]
+    lines = [line for line in lines if line]
+    if command and lines and lines[0].endswith(command):
+        lines = lines[1:]
+    for line in lines:
+        if MCU_ERROR.search(line):
+            raise McuError(f"'{command}' failed: {line}")
+    return '\n'.join(lines)
+
+
+class McuShell:
+    """
+    Command/response client for the K800 management shell.
+
+    Every command reads until the shell prints its prompt again, so a command returns
+    as soon as the MCU has answered, and raises TimeoutError once its deadline passes
+    on an unresponsive MCU instead of reading whatever happened to arrive.
+    """
+
+    def __init__(self, port, timeout=MCU_TIMEOUT):
+        self.port    = port
+        self.timeout = timeout
+        self._lock   = threading.Lock()
+
+    def _read_prompt(self, command, deadline):
+        self.port.timeout = max(0.0, deadline - time.monotonic())
+        data = self.port.read_until(MCU_PROMPT)
+        if not data.endswith(MCU_PROMPT):
+            raise TimeoutError(f"No prompt from MCU after '{command}' within {self.timeout} s")
+        return data
+
+    def sync(self, timeout=None):
+        """Discard pending output and wait for a fresh prompt."""
+        with self._lock:
+            self.port.reset_input_buffer()
+            self.port.write(b'\r\n')
+            self._read_prompt('', time.monotonic() + (timeout or self.timeout))
+
+    def command(self, command, timeout=None):
+        """Run one command and return its output without echo or prompt."""
+        return self.batch([command], timeout)[0]
+
+    def batch(self, commands, timeout=None):
+        """
+        Pipeline several commands in a single write and collect one response per command.
+
+        Each response is matched to its command by the shell echo, so the whole batch costs
+        one round-trip; the deadline of `timeout` per command applies to the batch as a whole.
+        """
+        if not commands:
+            return []
+        deadline = time.monotonic() + (timeout or self.timeout) * len(commands)
+        with self._lock:
+            self.port.reset_input_buffer()
+            self.port.write(''.join(f'{command}\r\n' for command in commands).encode())
+            # read every response before checking any, so a failure leaves no stale output behind
+            raws = [self._read_prompt(command, deadline) for command in commands]
+        responses = []
+        for command, raw in zip(commands, raws):
+            echo = ANSI_ESCAPE.sub('', raw.decode(errors='replace')).strip()
+            if not echo.startswith(command):
+                raise McuError(f"Expected echo of '{command}', got '{echo.splitlines()[0] if echo else ''}'")
+            responses.append(parse_mcu_response(command, raw))
+        return responses
+
+    def close(self):
+        self.port.close()
+
+
+def led_command(index, status):
+    """Management shell command setting one on-board LED."""
+    return f'dio set LED0 {index} {str(bool(status)).lower()}'
+
+
+def set_led_status(shell, is_led=False, status=True):
+    """Turn the 4 on-board LEDs on or off in one pipelined batch, useful connection check."""
+    if is_led == 'off' or not shell:
+        return
+    shell.batch([led_command(i, status) for i in range(LED_COUNT)])
+
+
+class LedController:
+    """
+    Per-LED state and blink patterns on the on-board LEDs for status signalling.
+
+    Only LEDs whose state changes are written, as one pipelined batch per step;
+    patterns from LED_PATTERNS (or any sequence of steps) play on a background thread.
+    """
+
+    def __init__(self, shell):
+        self.shell   = shell
+        self.state   = [None] * LED_COUNT
+        self._stop   = threading.Event()
+        self._thread = None
+
+    def set(self, states):
+        """Set LEDs from a sequence of LED_COUNT states or a {index: state} mapping."""
+        items = states.items() if isinstance(states, dict) else enumerate(states)
+        changes = {i: bool(on) for i, on in items if self.state[i] != bool(on)}
+        self.shell.batch([led_command(i, on) for i, on in changes.items()])
+        for i, on in changes.items():
+            self.state[i] = on
+
+    def set_all(self, status):
+        self.set([status] * LED_COUNT)
+
+    def play(self, pattern, period=0.25, repeat=None):
+        """Cycle through a pattern (name or step sequence) every `period` s, forever or `repeat` times."""
+        steps = LED_PATTERNS[pattern] if isinstance(pattern, str) else list(pattern)
+        self.stop()
+        self._stop.clear()
+
+        def run():
+            cycles = itertools.repeat(steps) if repeat is None else itertools.repeat(steps, repeat)
+            due = time.monotonic()
+            for step in itertools.chain.from_iterable(cycles):
+                try:
+                    self.set(step)
+                except (McuError, TimeoutError) as e:
+                    print(f"LED pattern step failed: {e}")
+                due += period
+                if self._stop.wait(max(0.0, due - time.monotonic())):
+                    return
+
+        self._thread = threading.Thread(target=run, name='k800-leds', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop a playing pattern, leaving the LEDs in their current state."""
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+def query_commands(interface):
+    """Management shell commands reading back the mode and baudrate of a CAN interface."""
+    return [f'get can-mode {interface}', f'get can-baudrate {interface}']
+
+
+def parse_can_config(responses):
+    """(mode, baud) from the responses to query_commands(), as strings like the set commands take."""
+    return tuple(response.split()[-1] if response else None for response in responses)
+
+
+def config_commands(interface, mode, baud, current=None):
+    """Commands moving a CAN interface from its `current` (mode, baud) to mode/baud, all of them if unknown."""
+    mode_now, baud_now = current or (None, None)
+    commands = []
+    if mode_now != mode:
+        commands.append(f'set can-mode {interface} {mode}')
+    if baud_now != baud:
+        commands.append(f'set can-baudrate {interface} {baud}')
+    return commands
+
+
+def _load_config_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_config(unit, interface, mode, baud, cache_path):
+    cache = _load_config_cache(cache_path)
+    if cache.get(unit, {}).get(interface) == [mode, baud]:
+        return
+    cache.setdefault(unit, {})[interface] = [mode, baud]
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+
+def configure_can(shell, interface, mode, baud, unit=None, force=False, cache_path=CONFIG_CACHE):
+    """
+    Bring a CAN interface to mode/baud, sending only the commands for settings that differ.
+
+    The current settings are read back from the management shell; when that fails (firmware
+    without the 'get' commands) or with `force`, every command is sent. Settings that were
+    changed are read back again to confirm them. CONFIG_CACHE only keeps the configuration
+    last read back from `unit` (USB serial number), to notice when it changed in between,
+    e.g. after an MCU reset. Returns the commands sent.
+    """
+    current = None
+    if not force:
+        try:
+            current = parse_can_config(shell.batch(query_commands(interface)))
+        except McuError:
+            pass
+    if unit and current:
+        cached = _load_config_cache(cache_path).get(unit, {}).get(interface)
+        if cached and tuple(cached) != current:
+            print(f"{unit}: {interface} changed to {' '.join(map(str, current))} since it was last configured")
+    commands = config_commands(interface, mode, baud, current)
+    for response in shell.batch(commands):
+        if response:
+            print(response)
+    confirmed = current
+    if commands:
+        try:
+            confirmed = parse_can_config(shell.batch(query_commands(interface)))
+        except McuError:
+            confirmed = None
+        if confirmed and confirmed != (mode, baud):
+            raise McuError(f"{interface} reads back {' '.join(map(str, confirmed))} after configuring {mode} {baud}")
+    if unit and confirmed:
+        _store_config(unit, interface, *confirmed, cache_path)
+    return commands
+
+
+'''---------------- Port Discovery ----------------'''
+def usb_interface(location):
+    """USB interface number from a port location such as '1-4:1.2', or None."""
+    if not location or '.' not in location:
+        return None
+    try:
+        return int(location.rsplit('.', 1)[1])
+    except ValueError:
+        return None
+
+
+def scan_k800_ports(dev_id=MCU_VID_PID):
+    """
+    Single pass over the system serial ports, grouping every port of the target device
+    as {unit serial number (or USB path): {interface number: ListPortInfo}}, in port order.
+    """
+    units = {}
+    for port in sorted(system_ports.comports()):
+        if dev_id not in port.hwid:
+            continue
+        interface = usb_interface(port.location)
+        if interface is None:
+            continue
+        unit = port.serial_number or port.location.split(':')[0]
+        units.setdefault(unit, {})[interface] = port
+    return units
+
+
+def _sysfs_identity(device):
+    """(serial number, interface number) of a tty from sysfs, or None off Linux."""
+    link = f'/sys/class/tty/{os.path.basename(device)}/device'
+    if not os.path.exists(link):
+        return None
+    interface_path = os.path.realpath(link)
+    try:
+        with open(os.path.join(os.path.dirname(interface_path), 'serial')) as f:
+            serial_number = f.read().strip()
+    except OSError:
+        serial_number = None
+    return serial_number, usb_interface(os.path.basename(interface_path))
+
+
+def _cached_ports(dev_id, cache_path):
+    """Cached {interface: device} if every cached device still belongs to the cached unit."""
+    try:
+        with open(cache_path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get('dev_id') != dev_id:
+        return None
+    interfaces = {int(num): device for num, device in entry.get('interfaces', {}).items()}
+    for num, device in interfaces.items():
+        # device paths are reused by other devices after a replug, so check the unit behind them
+        identity = _sysfs_identity(device) if os.path.exists(device) else None
+        if identity is None or identity != (entry.get('serial_number'), num):
+            return None
+    return interfaces or None
+
+
+def discover_ports(dev_id=MCU_VID_PID, use_cache=True, cache_path=PORT_CACHE):
+    """
+    Return every port of the first K800 as {USB interface number: device}.
+
+    A single comports() scan finds all interfaces at once. The result is cached on disk
+    and reused without scanning while the cached device paths still resolve (via sysfs)
+    to the same unit serial number and interfaces; elsewhere the cache is never trusted.
+    """
+    if use_cache:
+        cached = _cached_ports(dev_id, cache_path)
+        if cached:
+            return cached
+    units = scan_k800_ports(dev_id)
+    if not units:
+        return {}
+    serial_number, ports = next(iter(units.items()))
+    interfaces = {num: port.device for num, port in sorted(ports.items())}
+    if use_cache:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w') as f:
+                json.dump({'dev_id': dev_id, 'serial_number': serial_number,
+                           'interfaces': interfaces}, f)
+        except OSError:
+            pass
+    return interfaces
+
+
+class PortWatcher:
+    """
+    Reports K800 ports attaching and detaching for reconnect logic.
+
+    callback(action, unit, interface, device) is called with action 'attach' or 'detach'.
+    Uses pyudev tty events when installed, otherwise polls comports() every `interval` s.
+    """
+
+    def __init__(self, callback, dev_id=MCU_VID_PID, interval=1.0):
+        self.callback = callback
+        self.dev_id   = dev_id
+        self.interval = interval
+        self._known   = {}
+        self._lock    = threading.Lock()
+        self._stop    = threading.Event()
+        self._thread  = None
+        self._observer = None
+
+    def _snapshot(self):
+        return {(unit, num): port.device
+                for unit, ports in scan_k800_ports(self.dev_id).items()
+                for num, port in ports.items()}
+
+    def check(self):
+        """Rescan now and report changes since the previous scan."""
+        with self._lock:
+            current = self._snapshot()
+            known, self._known = self._known, current
+        for key in known.keys() - current.keys():
+            self.callback('detach', *key, known[key])
+        for key in current.keys() - known.keys():
+            self.callback('attach', *key, current[key])
+
+    def start(self):
+        self._known = self._snapshot()
+        self._stop.clear()
+        if pyudev is not None:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            self._observer = pyudev.MonitorObserver(monitor, callback=lambda device: self.check(),
+                                                    name='k800-hotplug')
+            self._observer.start()
+        else:
+            def poll():
+                while not self._stop.wait(self.interval):
+                    self.check()
+            self._thread = threading.Thread(target=poll, name='k800-hotplug', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+'''---------------- Kernel slcan ----------------'''
+# Linux tty line disciplines and ioctls used to hand the VCAN port to the kernel slcan driver
+N_TTY          = 0
+N_SLCAN        = 17
+TIOCSETD       = 0x5423
+SIOCGIFNAME    = 0x8910
+SIOCGIFFLAGS   = 0x8913
+SIOCSIFFLAGS   = 0x8914
+SIOCSIFTXQLEN  = 0x8943
+IFF_UP         = 0x1
+IFREQ_SIZE     = 40
+SLCAN_TXQUEUELEN = 1000  # same as 'ifconfig can0 txqueuelen 1000' in k800_can_utility.sh
+
+# slcan bitrate commands, the same codes python-can's slcan interface sends
+SLCAN_SPEEDS = {10: 'S0', 20: 'S1', 50: 'S2', 100: 'S3', 125: 'S4', 250: 'S5', 500: 'S6', 750: 'S7', 1000: 'S8'}
+
+
+def _ifreq(name, fmt='', *values):
+    """struct ifreq: interface name followed by the union member, zero padded."""
+    data = struct.pack('16s' + fmt, name.encode(), *values)
+    return data + bytes(IFREQ_SIZE - len(data))
+
+
+class KernelSlcan:
+    """
+    The VCAN port attached to the Linux slcan driver, what `slcand -o -s<n>` does in
+    k800_can_utility.sh: the slcan ASCII is then parsed in the kernel, frames carry kernel
+    timestamps, and any number of processes can open the resulting SocketCAN interface.
+
+    The line discipline lasts as long as the port stays open, so the link is held for the
+    session and removed by detach(). attach() raises OSError when the kernel or the
+    permissions do not allow it (not Linux, slcan module missing, no CAP_NET_ADMIN).
+    """
+
+    def __init__(self, port, bit_rate, acceptance=None, txqueuelen=SLCAN_TXQUEUELEN):
+        self.port       = port
+        self.bit_rate   = bit_rate
+        self.acceptance = acceptance
+        self.txqueuelen = txqueuelen
+        self.name       = None
+        self._fd        = None
+
+    def attach(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("kernel slcan needs Linux")
+        import fcntl, socket, termios, tty
+        fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY)
+        try:
+            tty.setraw(fd)
+            # configure and open the channel in ASCII first, as slcand does
+            commands = ['C']
+            if self.bit_rate in SLCAN_SPEEDS:
+                commands.append(SLCAN_SPEEDS[self.bit_rate])
+            if self.acceptance:
+                code, mask = self.acceptance
+                commands += [f'M{code}', f'm{mask}']
+            commands.append('O')
+            os.write(fd, ''.join(f'{command}\r' for command in commands).encode())
+            termios.tcdrain(fd)
+            fcntl.ioctl(fd, TIOCSETD, struct.pack('i', N_SLCAN))
+            self._fd = fd
+            self.name = fcntl.ioctl(fd, SIOCGIFNAME, bytes(16)).split(b'\0', 1)[0].decode()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                fcntl.ioctl(sock, SIOCSIFTXQLEN, _ifreq(self.name, 'i', self.txqueuelen))
+                flags = struct.unpack_from('H', fcntl.ioctl(sock, SIOCGIFFLAGS, _ifreq(self.name)), 16)[0]
+                fcntl.ioctl(sock, SIOCSIFFLAGS, _ifreq(self.name, 'H', flags | IFF_UP))
+        except OSError:
+            self._fd = None
+            self._restore(fd)
+            raise
+        return self
+
+    @staticmethod
+    def _restore(fd):
+        import fcntl
+        # back to the normal tty discipline (removes the interface), then close the channel
+        try:
+            fcntl.ioctl(fd, TIOCSETD, struct.pack('i', N_TTY))
+            os.write(fd, b'C\r')
+        except OSError:
+            pass
+        os.close(fd)
+
+    def detach(self):
+        if self._fd is not None:
+            self._restore(self._fd)
+            self._fd = None
+
+
+'''---------------- Device Registry ----------------'''
+# python-can bus classes by interface name, imported directly instead of resolved by can.Bus();
+# 'slcan' opens the K800SlcanBus subclass
+BUS_CLASSES = {
+    'socketcan': ('can.interfaces.socketcan', 'SocketcanBus'),
+    'virtual':   ('can.interfaces.virtual', 'VirtualBus'),
+}
+
+
+def open_bus(interface, **kwargs):
+    """
+    Open a python-can bus. Known interfaces are instantiated from their module directly,
+    skipping can.Bus()'s config file lookup and plugin resolution; slcan ports wait
+    SLCAN_OPEN_DELAY after opening when it is set, python-can's settle delay otherwise.
+    """
+    if interface == 'slcan':
+        if SLCAN_OPEN_DELAY is not None:
+            kwargs.setdefault('sleep_after_open', SLCAN_OPEN_DELAY)
+        return _k800_slcan_class()(**kwargs)
+    if interface not in BUS_CLASSES:
+        return can.Bus(interface=interface, **kwargs)
+    module, name = BUS_CLASSES[interface]
+    return getattr(importlib.import_module(module), name)(**kwargs)
+
+
+# bits of the slcan 'F' status reply (Lawicel), bit 4 is unused
+SLCAN_STATUS_FLAGS = {0: 'rx_fifo_full', 1: 'tx_fifo_full', 2: 'error_warning', 3: 'data_overrun',
+                      5: 'error_passive', 6: 'arbitration_lost', 7: 'bus_error'}
+
+
+def slcan_status_flags(status):
+    """Names of the flags set in an slcan 'F' status byte."""
+    return [name for bit, name in SLCAN_STATUS_FLAGS.items() if status >> bit & 1]
+
+
+@functools.lru_cache(maxsize=None)
+def _k800_slcan_class():
+    # defined on first use like SyntheticBus
+    slcanBus = importlib.import_module('can.interfaces.slcan').slcanBus
+
+    class K800SlcanBus(slcanBus):
+        """
+        python-can's slcan bus with the K800 slcan commands it does not expose: the
+        acceptance filter and the 'F' status flags. python-can's slcan bus always reports
+        an ACTIVE state; here `state` follows the last 'F' reply (see poll_status()), and
+        stays ACTIVE until the first one.
+        """
+
+        def __init__(self, *args, **kwargs):
+            self.status = None  # flags of the last 'F' reply, None before the first one
+            super().__init__(*args, **kwargs)
+
+        @property
+        def state(self):
+            if self.status is None:
+                return super().state
+            if self.status & 0x80:
+                return can.BusState.ERROR
+            return can.BusState.PASSIVE if self.status & 0x20 else can.BusState.ACTIVE
+
+        def poll_status(self, timeout=None):
+            """
+            Ask for the status flags. The reply updates `status` when the receive path reads
+            it; with a `timeout`, for a bus nothing else reads (send mode), pending input is
+            discarded and the reply is awaited here for up to `timeout` s. Returns `status`.
+            """
+            if timeout is not None:
+                self.serialPortOrig.reset_input_buffer()
+            self._write('F')
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
+                while (remaining := deadline - time.monotonic()) > 0:
+                    string = self._read(remaining)
+                    if string is None or string[0] == 'F':
+                        break
+            return self.status
+
+        def _read(self, timeout):
+            string = super()._read(timeout)
+            if string and string[0] == 'F' and len(string) >= 3:
+                try:
+                    self.status = int(string[1:3], 16)
+                except ValueError:
+                    pass
+            return string
+
+        def set_acceptance(self, code, mask):
+            """
+            Program the SJA1000 acceptance code and mask ('M'/'m', 8 hex digits each). The
+            channel is closed while the registers change, like set_bitrate_reg() does.
+            """
+            self.close()
+            self._write(f'M{code}')
+            self._write(f'm{mask}')
+            self.open()
+
+    return K800SlcanBus
+
+
+class K800Device:
+    """One Karbon 800 unit: its serial ports and, once opened, its management shell and CAN bus."""
+
+    def __init__(self, unit, interfaces, location=None):
+        self.unit       = unit
+        self.interfaces = interfaces
+        self.location   = location
+        self.shell      = None
+        self.bus        = None
+        self.leds       = None
+        self.link       = None
+        self.bit_rate   = None  # kbps, set by open()
+
+    @property
+    def mgmt_port(self):
+        return self.interfaces.get(MGMT_INTERFACE)
+
+    @property
+    def vcan_port(self):
+        return self.interfaces.get(VCAN_INTERFACE)
+
+    @property
+    def name(self):
+        return self.unit or self.vcan_port
+
+    @property
+    def serial_number(self):
+        """USB serial number, also for devices found by discover_ports() (Linux), else None."""
+        if self.unit and self.unit != self.location:
+            return self.unit
+        identity = _sysfs_identity(self.mgmt_port) if self.mgmt_port else None
+        return identity[0] if identity else None
+
+    def __repr__(self):
+        return f"K800Device({self.unit!r}, location={self.location!r}, interfaces={self.interfaces})"
+
+    def open(self, bit_rate=DEFAULT_BITRATE, interface=DEFAULT_INTERFACE, is_led=LED_CHECK, led_pattern='on',
+             can_filters=None, hw_filter=False, force_config=False, open_delay=SLCAN_OPEN_DELAY):
+        """
+        Configure the MCU and open the CAN bus with optional python-can `can_filters`, also
+        pushed down to the slcan acceptance registers with `hw_filter`. Only settings the
+        MCU does not already have are sent, unless `force_config` (see configure_can). The
+        slcan bus waits `open_delay` s after opening, python-can's 2 s if None. With 'socketcan' the
+        VCAN port is attached to the kernel slcan driver (see KernelSlcan), falling back to
+        python-can's userspace slcan when that fails. With any other interface no hardware
+        is touched and a bus on channel `unit` of that python-can interface is opened.
+        """
+        self.bit_rate = bit_rate
+        if interface not in ('slcan', 'socketcan'):
+            self.bus = open_bus(interface, channel=self.name, bitrate=bit_rate*1000,
+                               can_filters=can_filters)
+            return self.bus
+        if not self.mgmt_port or not self.vcan_port:
+            raise OSError(f"K800 {self.name} is missing its management or VCAN port")
+        self.shell = McuShell(serial.Serial(self.mgmt_port))
+        try:
+            # Write NL to the serial terminal and wait for the prompt
+            self.shell.sync()
+            STARTUP.mark('management shell')
+            if not configure_can(self.shell, 'VCAN0', 'slcan', str(bit_rate), unit=self.serial_number,
+                                 force=force_config):
+                print(f"{self.name}: already configured for slcan at {bit_rate} kbps")
+            set_led_status(self.shell, is_led, status=True)
+            STARTUP.mark('MCU configuration')
+            if is_led == 'on' and led_pattern != 'on':
+                # signal an active session on the LEDs until close
+                self.leds = LedController(self.shell)
+                self.leds.play(led_pattern)
+            if interface == 'socketcan':
+                acceptance = sja1000_acceptance(can_filters) if hw_filter else None
+                try:
+                    self.link = KernelSlcan(self.vcan_port, bit_rate, acceptance).attach()
+                except OSError as e:
+                    print(f"{self.name}: kernel slcan unavailable ({e}), using userspace slcan")
+                else:
+                    print(f"{self.name}: attached as SocketCAN interface {self.link.name}")
+                    self.bus = open_bus('socketcan', channel=self.link.name, can_filters=can_filters)
+                    STARTUP.mark('bus open')
+                    return self.bus
+            options = {} if open_delay is None else {'sleep_after_open': open_delay}
+            self.bus = open_bus('slcan', channel=self.vcan_port, bitrate=bit_rate*1000,
+                               receive_own_messages=False, can_filters=can_filters, **options)
+            if hw_filter and can_filters:
+                if push_acceptance_filter(self.bus, can_filters) is None:
+                    print("Hardware filter skipped: filters mix standard and extended IDs")
+            STARTUP.mark('bus open')
+        except Exception:
+            self.close()
+            raise
+        return self.bus
+
+    def close(self, is_led=LED_CHECK, lost=False):
+        """Close the bus and the management shell; `lost` ports are released without talking to the MCU."""
+        if self.leds:
+            self.leds.stop()
+            self.leds = None
+        if self.bus:
+            try:
+                self.bus.shutdown()
+            except (OSError, can.CanError):
+                if not lost:
+                    raise
+            self.bus = None
+        if self.link:
+            self.link.detach()
+            self.link = None
+        if self.shell:
+            if not lost:
+                try:
+                    self.shell.port.reset_input_buffer()
+                    self.shell.port.reset_output_buffer()
+                    set_led_status(self.shell, is_led, status=False)
+                except Exception as e:
+                    # best effort: a port that vanished meanwhile raises termios.error, not OSError
+                    print(f"{self.name}: could not turn LEDs off: {e}")
+            try:
+                self.shell.close()
+            except OSError:
+                if not lost:
+                    raise
+            self.shell = None
+
+
+class DeviceRegistry:
+    """
+    Every K800 attached to the host, keyed by USB serial number (or USB path without one).
+
+    Devices can be selected by serial number or USB location, opened as a group and
+    driven concurrently: one reader thread per bus in receiver(), one sender thread
+    per bus in transmit().
+    """
+
+    def __init__(self, dev_id=MCU_VID_PID):
+        self.dev_id  = dev_id
+        self.devices = {}
+
+    def refresh(self):
+        """Rescan the serial ports, keeping already opened devices that are still present."""
+        devices = {}
+        for unit, ports in scan_k800_ports(self.dev_id).items():
+            device = self.devices.get(unit)
+            if device is None or device.bus is None:
+                location = next(iter(ports.values())).location.split(':')[0]
+                device = K800Device(unit, {num: port.device for num, port in sorted(ports.items())}, location)
+            devices[unit] = device
+        self.devices = devices
+        return list(devices.values())
+
+    def select(self, units=None):
+        """Devices matching the given serial numbers or USB locations, all devices if None."""
+        if units is None:
+            return list(self.devices.values())
+        selected = []
+        for unit in units:
+            matches = [d for d in self.devices.values() if unit in (d.unit, d.location)]
+            if not matches:
+                raise KeyError(f"K800 {unit} not found")
+            selected.extend(d for d in matches if d not in selected)
+        return selected
+
+    def open(self, units=None, **kwargs):
+        """Open the selected devices (see K800Device.open), closing them all if any fails."""
+        devices = self.select(units)
+        try:
+            for device in devices:
+                device.open(**kwargs)
+        except Exception:
+            for device in devices:
+                device.close()
+            raise
+        return devices
+
+    def close(self, is_led=LED_CHECK):
+        for device in self.devices.values():
+            device.close(is_led)
+
+    def receiver(self, units=None, capacity=DEFAULT_RING_SIZE):
+        """Receiver over the open buses of the selected devices, frames tagged with the unit."""
+        devices = [d for d in self.select(units) if d.bus]
+        return Receiver([d.bus for d in devices], capacity=capacity, channels=[d.name for d in devices])
+
+    def transmit(self, frames, units=None, count=None, duration=None, **engine_kwargs):
+        """
+        Send on every open bus of the selected devices concurrently. `frames` is called
+        with each device to build its frame source; the engines pace and report at the
+        bitrate each device was opened with. Returns {unit: TransmitStats}.
+        """
+        devices = [d for d in self.select(units) if d.bus]
+        engines = [TransmitEngine(d.bus, frames(d), **{'bitrate': d.bit_rate, **engine_kwargs}) for d in devices]
+        stats = run_transmitters(engines, count=count, duration=duration)
+        return {d.name: stat for d, stat in zip(devices, stats)}
+
+
+'''---------------- Reconnect ----------------'''
+RECONNECT_DELAY     = 0.1   # seconds before the first reconnect attempt, doubled after every failure
+RECONNECT_MAX_DELAY = 5.0   # longest wait between reconnect attempts
+TX_BACKLOG          = 1024  # frames queued for sending while the K800 is away, oldest dropped first
+
+
+def transient_error(error):
+    """True for send errors that leave the port usable: write timeouts and full transmit buffers."""
+    while error is not None:
+        if (isinstance(error, (TimeoutError, BlockingIOError, serial.SerialTimeoutException))
+                or errno.ENOBUFS in (getattr(error, 'errno', None), getattr(error, 'error_code', None))):
+            return True
+        error = error.__cause__
+    return False
+
+
+class FrameQueued(Exception):
+    """SupervisedBus.send() queued the frame while reconnecting; it is not sent (yet)."""
+
+
+class SupervisedBus:
+    """
+    Bus of a K800Device that survives USB disconnects and MCU resets (--reconnect).
+
+    A failing recv() or send() marks the connection lost and starts a supervisor thread.
+    It releases the dead ports, finds the unit again by serial number (the port paths can
+    change when they re-enumerate) and reopens it with the original K800Device.open()
+    arguments, retrying with exponential backoff; with `rediscover`, a PortWatcher cuts the
+    wait short as soon as a port of the unit attaches again. The configuration is always sent again
+    in full (force_config), since the MCU may have reset while it was away. Meanwhile recv()
+    returns None and send() queues up to `backlog` frames and raises FrameQueued; they are
+    sent in order once the bus is back and passed to `on_sent` then. A frame counts as
+    sent only once written to a live bus: frames pushed out of a full backlog and frames
+    whose write failed as the connection dropped are counted as lost.
+    """
+
+    def __init__(self, device, open_kwargs, rediscover=True, backlog=TX_BACKLOG, delay=RECONNECT_DELAY,
+                 max_delay=RECONNECT_MAX_DELAY, dev_id=MCU_VID_PID, on_sent=None):
+        self.device      = device
+        self.open_kwargs = open_kwargs
+        self.on_sent     = on_sent
+        self.rediscover  = rediscover
+        self.serial_number = device.serial_number
+        self.delay       = delay
+        self.max_delay   = max_delay
+        self.dev_id      = dev_id
+        self.bus         = device.bus
+        self.backlog     = deque(maxlen=backlog)
+        self.outages     = []  # (seconds down, attempts, queued frames sent, frames lost) per outage
+        self.lost        = 0
+        self.resent      = 0
+        self._down_since = None
+        self._lock       = threading.RLock()
+        self._up         = threading.Event()
+        self._up.set()
+        self._closed     = threading.Event()
+        self._attached   = threading.Event()
+        self._thread     = None
+
+    def __getattr__(self, attr):
+        # everything else (state, channel_info, ...) comes from the bus while connected
+        bus = self.__dict__.get('bus')
+        if bus is None:
+            raise AttributeError(attr)
+        return getattr(bus, attr)
+
+    def recv(self, timeout=None):
+        bus = self.bus
+        if bus is None:
+            self._up.wait(timeout)
+            return None
+        try:
+            return bus.recv(timeout)
+        except (can.CanError, OSError) as e:
+            self._connection_lost(bus, e)
+            return None
+
+    def send(self, msg, timeout=None):
+        with self._lock:
+            bus = self.bus
+            if bus is not None and not self.backlog:
+                try:
+                    bus.send(msg, timeout)
+                    return
+                except (can.CanError, OSError) as e:
+                    if transient_error(e):
+                        raise
+                    # the write may or may not have reached the MCU: lost, not queued
+                    self.lost += 1
+                    self._connection_lost(bus, e)
+                    raise can.CanOperationError(f"{self.device.name}: connection lost while sending") from e
+            if len(self.backlog) == self.backlog.maxlen:
+                self.lost += 1
+            self.backlog.append(msg)
+        raise FrameQueued(f"{self.device.name} is reconnecting, frame queued")
+
+    def _connection_lost(self, bus, error):
+        with self._lock:
+            if self.bus is not bus or self._closed.is_set():
+                return
+            self.bus = None
+            self._up.clear()
+            self._down_since = time.perf_counter()
+            print(f"{self.device.name}: connection lost ({error}), reconnecting...")
+            self._thread = threading.Thread(target=self._reconnect, name='k800-reconnect', daemon=True)
+            self._thread.start()
+
+    def _find_device(self):
+        """Point the device at the current ports of its unit, which may have re-enumerated."""
+        units = scan_k800_ports(self.dev_id)
+        if self.serial_number:
+            ports = units.get(self.serial_number)
+        else:
+            # without a serial number the unit can only be told apart when it is alone
+            ports = next(iter(units.values())) if len(units) == 1 else None
+        if not ports:
+            raise OSError(f"K800 {self.serial_number} not found" if self.serial_number else "K800 not found")
+        self.device.interfaces = {num: port.device for num, port in sorted(ports.items())}
+
+    def _flush(self, bus):
+        while self.backlog:
+            msg = self.backlog.popleft()
+            try:
+                bus.send(msg)
+            except (can.CanError, OSError):
+                self.lost += 1
+                raise
+            self.resent += 1
+            if self.on_sent:
+                self.on_sent(msg)
+
+    def _on_port(self, action, unit, interface, device):
+        if action == 'attach' and (unit == self.serial_number or not self.serial_number):
+            self._attached.set()
+
+    def _reconnect(self):
+        self.device.close(lost=True)
+        try:
+            watcher = PortWatcher(self._on_port, self.dev_id).start() if self.rediscover else None
+        except OSError:
+            watcher = None  # no hotplug monitoring here: the backoff alone paces the attempts
+        try:
+            self._retry()
+        finally:
+            if watcher:
+                watcher.stop()
+
+    def _retry(self):
+        delay, attempts = self.delay, 0
+        while True:
+            # back off, unless a port of the unit attaches (or close() is called) first
+            self._attached.wait(delay)
+            self._attached.clear()
+            if self._closed.is_set():
+                return
+            attempts += 1
+            delay = min(delay * 2, self.max_delay)
+            try:
+                if self.rediscover:
+                    self._find_device()
+                bus = self.device.open(**dict(self.open_kwargs, force_config=True))
+                with self._lock:
+                    self._flush(bus)
+                    seconds = time.perf_counter() - self._down_since
+                    self.outages.append((seconds, attempts, self.resent, self.lost))
+                    print(f"{self.device.name}: reconnected after {seconds:.2f} s ({attempts} attempts), "
+                          f"{self.resent} queued frames sent, {self.lost} lost")
+                    self.lost = self.resent = 0
+                    self.bus = bus
+                    self._up.set()
+                return
+            except Exception:
+                # retry whatever failed: a port vanishing mid-open raises termios.error, not OSError
+                self.device.close(lost=True)
+
+    def close(self):
+        """Stop reconnecting; the device itself is closed by its owner."""
+        self._closed.set()
+        self._attached.set()
+        self._up.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def report(self):
+        name = self.device.name
+        if not self.outages and self.bus is not None:
+            return f"{name}: no connection loss"
+        down = [outage[0] for outage in self.outages]
+        resent = sum(outage[2] for outage in self.outages) + self.resent
+        lost = sum(outage[3] for outage in self.outages) + self.lost
+        report = f"{name}: {len(self.outages)} reconnect(s)"
+        if down:
+            report += f", down {sum(down):.2f} s in total (longest {max(down):.2f} s)"
+        report += f", {resent} queued frames sent after reconnecting, {lost} lost (full queue or write failed)"
+        if self.bus is None:
+            report += (f"; still disconnected after {time.perf_counter() - self._down_since:.2f} s "
+                       f"with {len(self.backlog)} frames queued")
+        return report
+
+
+'''---------------- Transmit Engine ----------------'''
+# CAN 2.0 data frame length without data field or stuff bits: SOF, arbitration,
+# control, CRC, ACK, EOF and intermission, for standard (11 bit) and extended (29 bit) IDs
+FRAME_OVERHEAD_BITS = {False: 47, True: 67}
+
+# Bits at the end of a frame (CRC delimiter, ACK, EOF, intermission) never stuffed
+UNSTUFFED_TAIL_BITS = 13
+
+# Time before a deadline at which sleep_until() stops sleeping and starts spinning
+SPIN_THRESHOLD = 0.001
+
+# Scheduler lateness absorbed by the token bucket so oversleeping does not accumulate as drift
+DRIFT_WINDOW = 0.005
+
+
+def frame_bit_length(dlc, is_extended_id=False, stuffing=False):
+    """Bits a data frame occupies on the wire, optionally including worst-case stuff bits."""
+    bits = FRAME_OVERHEAD_BITS[bool(is_extended_id)] + 8 * dlc
+    if stuffing:
+        bits += (bits - UNSTUFFED_TAIL_BITS - 1) // 4
+    return bits
+
+
+def sleep_until(deadline):
+    """Sleep until the perf_counter deadline, spinning for the last SPIN_THRESHOLD for precision."""
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_THRESHOLD:
+        time.sleep(remaining - SPIN_THRESHOLD)
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TransmitStats:
+    """Counters collected by TransmitEngine, reported as achieved vs requested rate."""
+
+    def __init__(self, bitrate, fps=None, bus_load=None):
+        self.bitrate  = bitrate
+        self.fps      = fps
+        self.bus_load = bus_load
+        self.sent     = 0
+        self.failed   = 0
+        self.queued   = 0  # handed to a reconnecting SupervisedBus, see its report
+        self.bits     = 0
+        self.start    = time.perf_counter()
+        self.end      = self.start
+        self.first_sent = self.last_sent = None
+
+    def add(self, msg):
+        """Count a frame sent just now."""
+        now = time.perf_counter()
+        if self.first_sent is None:
+            self.first_sent = now
+        self.last_sent = now
+        self.sent += 1
+        self.bits += frame_bit_length(len(msg.data), msg.is_extended_id)
+
+    @property
+    def elapsed(self):
+        return self.end - self.start
+
+    @property
+    def achieved_fps(self):
+        """Frames per second over the sent - 1 intervals between the first and the last frame."""
+        span = self.last_sent - self.first_sent if self.sent > 1 else 0.0
+        return (self.sent - 1) / span if span > 0 else 0.0
+
+    @property
+    def achieved_load(self):
+        """Bus load in percent of the configured bitrate (kbps) at the achieved frame rate."""
+        return 100.0 * self.achieved_fps * self.bits / (self.sent * self.bitrate * 1000) if self.sent else 0.0
+
+    def report(self):
+        requested = (f"{self.fps:.1f} fps" if self.fps is not None
+                     else f"{self.bus_load:.1f}% bus load")
+        queued = f", {self.queued} queued while reconnecting" if self.queued else ''
+        report = f"Sent {self.sent} frames ({self.failed} failed{queued}) in {self.elapsed:.2f} s"
+        if self.sent < 2:
+            # a rate needs at least two frames
+            return f"{report} (requested {requested})"
+        return (f"{report}: {self.achieved_fps:.1f} fps, {self.achieved_load:.1f}% bus load "
+                f"at {self.bitrate} kbps (requested {requested})")
+
+
+class TransmitEngine:
+    """
+    Token-bucket paced transmitter.
+
+    Frames are pulled from an iterable in batches of `burst` and sent back-to-back once the
+    bucket holds enough tokens for the whole batch. Tokens are frames when pacing by `fps`,
+    and wire bits when pacing by `bus_load` percent of `bitrate` (kbps). The bucket refills
+    from measured elapsed time rather than from the requested sleep, so scheduler lateness
+    is paid back on the following frames instead of accumulating as drift.
+    """
+
+    def __init__(self, bus, frames, fps=None, bus_load=None, bitrate=DEFAULT_BITRATE,
+                 burst=1, timeout=0.2, on_sent=None, on_error=None):
+        if (fps is None) == (bus_load is None):
+            raise ValueError("Specify exactly one of fps or bus_load")
+        if (fps is not None and fps <= 0) or (bus_load is not None and not 0 < bus_load <= 100):
+            raise ValueError("fps must be positive and bus_load within (0, 100]")
+        self.bus      = bus
+        self.frames   = iter(frames)
+        self.burst    = max(1, int(burst))
+        self.timeout  = timeout
+        self.on_sent  = on_sent
+        self.on_error = on_error
+        self.stats    = TransmitStats(bitrate, fps, bus_load)
+        if fps is not None:
+            self.rate = float(fps)
+            self._cost = lambda msg: 1
+            unit = 1
+        else:
+            self.rate = bus_load / 100.0 * bitrate * 1000
+            self._cost = lambda msg: frame_bit_length(len(msg.data), msg.is_extended_id)
+            unit = frame_bit_length(8, is_extended_id=True)
+        self.capacity = self.burst * unit + self.rate * DRIFT_WINDOW
+        self._tokens  = self.burst * unit
+        self._last    = time.perf_counter()
+        self._stop    = threading.Event()
+
+    def stop(self):
+        """Make run() return after the batch in progress."""
+        self._stop.set()
+
+    def _acquire(self, cost):
+        """Block until `cost` tokens are available, then take them."""
+        while True:
+            now = time.perf_counter()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return
+            sleep_until(now + (cost - self._tokens) / self.rate)
+
+    def run(self, count=None, duration=None):
+        """Transmit until the source is exhausted, `count` frames are sent or `duration` s pass."""
+        stats = self.stats
+        stats.start = self._last = time.perf_counter()
+        deadline = stats.start + duration if duration is not None else None
+        total = 0
+        try:
+            while (count is None or total < count) and not self._stop.is_set():
+                size  = self.burst if count is None else min(self.burst, count - total)
+                batch = list(itertools.islice(self.frames, size))
+                if not batch:
+                    break
+                self._acquire(sum(self._cost(msg) for msg in batch))
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                for msg in batch:
+                    try:
+                        self.bus.send(msg, timeout=self.timeout)
+                    except FrameQueued:
+                        stats.queued += 1
+                        continue
+                    except can.CanError as e:
+                        stats.failed += 1
+                        if self.on_error:
+                            self.on_error(msg, e)
+                        continue
+                    stats.add(msg)
+                    if self.on_sent:
+                        self.on_sent(msg)
+                total += len(batch)
+        finally:
+            stats.end = time.perf_counter()
+        return stats
+
+
+def run_transmitters(engines, count=None, duration=None):
+    """Run several TransmitEngines (or ReplayEngines) concurrently, one thread each, until all finish."""
+    limits  = {name: value for name, value in (('count', count), ('duration', duration)) if value is not None}
+    threads = [threading.Thread(target=engine.run, kwargs=limits,
+                                name=f'k800-send-{i}', daemon=True)
+               for i, engine in enumerate(engines)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            # join with a timeout so Ctrl+C still reaches the main thread
+            while thread.is_alive():
+                thread.join(0.1)
+    finally:
+        for engine in engines:
+            engine.stop()
+        for thread in threads:
+            thread.join()
+    return [engine.stats for engine in engines]
+
+
+'''---------------- Receive Pipeline ----------------'''
+class FrameRing:
+    """
+    Fixed-capacity ring buffer of frames filled by bus reader threads and drained by one consumer.
+
+    Slots are preallocated; when the consumer falls behind the producers overwrite the
+    oldest frames and count them in `overruns` instead of blocking the bus readers.
+    """
+
+    def __init__(self, capacity=DEFAULT_RING_SIZE):
+        if capacity < 1:
+            raise ValueError("Ring capacity must be at least 1")
+        self.capacity = capacity
+        self.overruns = 0
+        self._slots   = [None] * capacity
+        self._head    = 0  # total frames written
+        self._tail    = 0  # total frames read
+        self._waiting = False
+        self._cond    = threading.Condition()
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def put(self, msg):
+        with self._cond:
+            if self._head - self._tail == self.capacity:
+                self._slots[self._tail % self.capacity] = None
+                self._tail += 1
+                self.overruns += 1
+            self._slots[self._head % self.capacity] = msg
+            self._head += 1
+            if self._waiting:
+                self._cond.notify()
+
+    def get_batch(self, max_batch=RECV_BATCH, timeout=None):
+        """Return up to max_batch frames in arrival order, waiting up to timeout if empty."""
+        with self._cond:
+            if self._head == self._tail:
+                self._waiting = True
+                self._cond.wait(timeout)
+                self._waiting = False
+            count = min(self._head - self._tail, max_batch)
+            start = self._tail % self.capacity
+            end   = start + count
+            if end <= self.capacity:
+                batch = self._slots[start:end]
+                self._slots[start:end] = [None] * count
+            else:
+                end -= self.capacity
+                batch = self._slots[start:] + self._slots[:end]
+                self._slots[start:] = [None] * (self.capacity - start)
+                self._slots[:end] = [None] * end
+            self._tail += count
+            return batch
+
+
+class Receiver:
+    """
+    Runs bus.recv() on a dedicated thread per bus feeding a FrameRing, so slow consumers
+    (terminal output, logging) never back up the bus readers.
+
+    `bus` is one bus or a list of buses; with `channels`, frames from each bus are tagged
+    with the matching channel name so consumers can tell the buses apart.
+    """
+
+    def __init__(self, bus, capacity=DEFAULT_RING_SIZE, poll=0.1, channels=None):
+        self.buses    = list(bus) if isinstance(bus, (list, tuple)) else [bus]
+        self.bus      = self.buses[0]
+        self.channels = channels
+        self.ring     = FrameRing(capacity)
+        self.poll     = poll
+        self.received_by = [0] * len(self.buses)
+        self.consumed = 0
+        self.error    = None
+        self.start_time = None
+        self.end_time   = None
+        self._stop    = threading.Event()
+        self._threads = [threading.Thread(target=self._run, args=(i,), name=f'k800-recv-{i}', daemon=True)
+                         for i in range(len(self.buses))]
+
+    @property
+    def received(self):
+        return sum(self.received_by)
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+    def _run(self, index):
+        recv, put = self.buses[index].recv, self.ring.put
+        channel   = self.channels[index] if self.channels else None
+        received  = self.received_by
+        try:
+            while not self._stop.is_set():
+                msg = recv(timeout=self.poll)
+                if msg is not None:
+                    if channel is not None:
+                        msg.channel = channel
+                    put(msg)
+                    received[index] += 1
+        except Exception as e:
+            self.error = e
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+        self.end_time = time.perf_counter()
+
+    def drain(self, consumers, count=None, batch_size=RECV_BATCH, on_tick=None):
+        """
+        Hand batches of frames to every consumer until `count` frames are consumed or the
+        reader fails. on_tick() runs after every batch and at least every `poll` s when idle.
+        """
+        get_batch = self.ring.get_batch
+        while count is None or self.consumed < count:
+            size  = batch_size if count is None else min(batch_size, count - self.consumed)
+            batch = get_batch(size, timeout=self.poll)
+            if batch:
+                for consumer in consumers:
+                    consumer(batch)
+                self.consumed += len(batch)
+            elif self.error is not None:
+                raise self.error
+            if on_tick is not None:
+                on_tick()
+
+    def report(self):
+        elapsed = (self.end_time or time.perf_counter()) - self.start_time
+        rate = self.received / elapsed if elapsed > 0 else 0.0
+        report = (f"Received {self.received} frames in {elapsed:.2f} s ({rate:.1f} fps), "
+                  f"consumed {self.consumed}, {self.overruns} overruns "
+                  f"(ring capacity {self.ring.capacity})")
+        if len(self.buses) > 1:
+            for i, received in enumerate(self.received_by):
+                name = self.channels[i] if self.channels else i
+                rate = received / elapsed if elapsed > 0 else 0.0
+                report += f"\n    {name}: {received} frames ({rate:.1f} fps)"
+        return report
+
+
+def print_frames(batch):
+    """Receive consumer printing a batch of frames with a single write."""
+    sys.stdout.write(''.join(f"Received: {msg}\n" for msg in batch))
+
+
+def filter_frames(predicate, consumer):
+    """Wrap a receive consumer so it only sees frames for which predicate(msg) is true."""
+    def filtered(batch):
+        batch = [msg for msg in batch if predicate(msg)]
+        if batch:
+            consumer(batch)
+    return filtered
+
+
+@functools.lru_cache(maxsize=None)
+def _synthetic_bus_class():
+    # defined on first use: subclassing can.BusABC at import would import python-can
+    class SyntheticBus(can.BusABC):
+        """
+        Frame source standing in for the K800 VCAN port when benchmarking the receive path.
+
+        Generates frames cycling through `ids` at `fps` frames per second, or as fast as
+        recv() is called when fps is None. send() discards frames.
+        """
+
+        def __init__(self, channel='synthetic', fps=None, ids=(0x123,), dlc=8, **kwargs):
+            super().__init__(channel=channel, **kwargs)
+            self.channel_info = 'K800 synthetic frame source'
+            self._ids      = itertools.cycle(ids)
+            self._data     = bytes(range(dlc))
+            self._interval = 1.0 / fps if fps else None
+            self._next_due = time.perf_counter()
+
+        def _recv_internal(self, timeout):
+            if self._interval is not None:
+                now = time.perf_counter()
+                if self._next_due - now > (timeout if timeout is not None else float('inf')):
+                    sleep_until(now + timeout)
+                    return None, False
+                sleep_until(self._next_due)
+                self._next_due = max(self._next_due + self._interval, now - 1.0)
+            msg = can.Message(timestamp=time.time(), arbitration_id=next(self._ids),
+                              is_extended_id=True, data=self._data)
+            return msg, False
+
+        def send(self, msg, timeout=None):
+            pass
+
+    return SyntheticBus
+
+
+def synthetic_bus(**kwargs):
+    """SyntheticBus instance, see its docstring for the arguments."""
+    return _synthetic_bus_class()(**kwargs)
+
+
+'''---------------- Acceptance Filters ----------------'''
+STANDARD_ID_MASK = 0x7FF
+EXTENDED_ID_MASK = 0x1FFFFFFF
+
+
+def parse_filter(value):
+    """
+    python-can filter dict from hex 'id:mask', optionally suffixed ':s' or ':x' to match
+    only standard or extended frames (IDs above 0x7FF are always extended).
+    """
+    parts = value.split(':')
+    kind  = parts.pop().lower() if len(parts) == 3 else None
+    try:
+        can_id, can_mask = (int(part, 16) for part in parts)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid filter '{value}', expected hex id:mask[:s|x] such as 123:7ff")
+    if kind not in (None, 's', 'x'):
+        raise argparse.ArgumentTypeError(f"invalid filter '{value}', frame type must be s or x")
+    can_filter = {'can_id': can_id, 'can_mask': can_mask}
+    if kind or can_id > STANDARD_ID_MASK:
+        can_filter['extended'] = kind == 'x' or can_id > STANDARD_ID_MASK
+    return can_filter
+
+
+def filter_matcher(can_filters):
+    """Predicate accepting the frames python-can `can_filters` accept, None when there are no filters."""
+    if not can_filters:
+        return None
+    rules = [(f['can_id'] & f['can_mask'], f['can_mask'], f.get('extended')) for f in can_filters]
+
+    def matches(msg):
+        for can_id, can_mask, extended in rules:
+            if msg.arbitration_id & can_mask == can_id and extended in (None, msg.is_extended_id):
+                return True
+        return False
+    return matches
+
+
+def sja1000_acceptance(can_filters):
+    """
+    slcan acceptance code and mask (the 'M' and 'm' commands, SJA1000 single filter
+    layout) admitting every frame any of the filters accepts, or None when the filters
+    mix standard and extended IDs. Several filters collapse to the bits they agree on,
+    so the hardware may pass extra frames that python-can's software filter drops.
+    """
+    if not can_filters:
+        return None
+    extended = {bool(f.get('extended', f['can_id'] > STANDARD_ID_MASK)) for f in can_filters}
+    if len(extended) != 1:
+        return None
+    extended = extended.pop()
+    id_mask  = EXTENDED_ID_MASK if extended else STANDARD_ID_MASK
+    care     = id_mask
+    first    = can_filters[0]['can_id'] & id_mask
+    for f in can_filters:
+        care &= f['can_mask'] & ~(first ^ f['can_id']) & id_mask
+    shift = 3 if extended else 21
+    code  = (first & care) << shift
+    # SJA1000 mask bits set to 1 are "don't care", including the bits below the ID
+    mask  = ((~care & id_mask) << shift) | ((1 << shift) - 1)
+    return f'{code:08X}', f'{mask:08X}'
+
+
+def push_acceptance_filter(bus, can_filters):
+    """
+    Program the slcan acceptance code/mask so filtered frames never cross USB. Requires
+    a bus opened by open_bus('slcan') and firmware supporting the 'M'/'m' commands; the
+    software filter stays in place either way. Returns the (code, mask) pushed, or None
+    if the filters cannot be expressed.
+    """
+    if not isinstance(bus, _k800_slcan_class()):
+        raise TypeError(f"Hardware filters need an slcan bus from open_bus('slcan'), not {type(bus).__name__}")
+    acceptance = sja1000_acceptance(can_filters)
+    if acceptance is None:
+        return None
+    bus.set_acceptance(*acceptance)
+    return acceptance
+
+
+def benchmark_filter(bus_load=50, bit_rate=DEFAULT_BITRATE, id_count=64, kept=1):
+    """
+    Receive-path CPU % for one second of bus traffic at `bus_load` with `id_count` IDs
+    of which `kept` pass the filter: unfiltered, python-can software filter, and
+    hardware filter (only matching frames reach Python), each printing to os.devnull.
+    """
+    fps    = int(bus_load / 100 * bit_rate * 1000 / frame_bit_length(8, is_extended_id=True))
+    ids    = list(range(0x100, 0x100 + id_count))
+    kept_ids = ids[:kept]
+    can_filters = [{'can_id': i, 'can_mask': EXTENDED_ID_MASK, 'extended': True} for i in kept_ids]
+    matching = fps * kept // id_count
+    results = {'bus_load': bus_load, 'bitrate': bit_rate, 'frames_per_s': fps, 'matching_per_s': matching}
+
+    def measure(bus, frames):
+        with open(os.devnull, 'w') as out:
+            start = time.process_time()
+            for _ in range(frames):
+                out.write(f"Received: {bus.recv()}\n")
+            cpu = time.process_time() - start
+        bus.shutdown()
+        return round(100.0 * cpu, 2)
+
+    results['unfiltered_cpu_pct'] = measure(synthetic_bus(ids=ids), fps)
+    results['software_cpu_pct']   = measure(synthetic_bus(ids=ids, can_filters=can_filters), matching)
+    results['hardware_cpu_pct']   = measure(synthetic_bus(ids=kept_ids), matching)
+    return results
+
+
+'''---------------- ID Dispatch ----------------'''
+class HandlerStats:
+    """Calls made to one dispatcher handler and the time spent in them."""
+
+    def __init__(self, handler, rule):
+        self.handler = handler
+        self.rule    = rule
+        self.calls   = 0
+        self.seconds = 0.0
+
+    def __repr__(self):
+        name = getattr(self.handler, '__name__', repr(self.handler))
+        mean = self.seconds / self.calls * 1e6 if self.calls else 0.0
+        return f"{name} [{self.rule}]: {self.calls} calls, {self.seconds:.3f} s ({mean:.1f} us/call)"
+
+
+class Dispatcher:
+    """
+    Routes frames to handlers registered for an exact arbitration ID, an inclusive ID
+    range, or an id/mask pair. Usable directly as a receive consumer:
+
+        dispatcher = Dispatcher()
+        dispatcher.add(on_engine, can_id=0x0CF00400)
+        dispatcher.add(on_diag, id_range=(0x7E0, 0x7EF))
+        dispatcher.add(on_j1939, can_id=0x00FEF100, mask=0x00FFFF00)
+        receiver.drain([dispatcher])
+
+    Registrations (add(), remove()) compile into a dict of exact IDs and a sorted interval index of
+    ranges; the handler tuple of every ID seen is then cached, so per-frame dispatch is
+    one dict lookup however many handlers are registered. Handlers of one ID run in
+    registration order, with per-handler call counts and time spent in `stats`.
+    """
+
+    def __init__(self, default=None, timing=True):
+        self.default  = default
+        self.timing   = timing
+        self.stats    = []
+        self._rules   = []
+        self._table   = None
+
+    def add(self, handler, can_id=None, id_range=None, mask=None):
+        if (can_id is None) == (id_range is None):
+            raise ValueError("Register a handler for exactly one of can_id or id_range")
+        if id_range is not None and mask is not None:
+            raise ValueError("mask applies to can_id, not to id_range")
+        if id_range is not None:
+            low, high = id_range
+            if low > high:
+                raise ValueError("id_range low bound is above its high bound")
+            rule = ('range', low, high)
+            text = f"{low:X}-{high:X}"
+        elif mask is not None:
+            rule = ('mask', can_id & mask, mask)
+            text = f"{can_id:X}/{mask:X}"
+        else:
+            rule = ('exact', can_id, None)
+            text = f"{can_id:X}"
+        stats = HandlerStats(handler, text)
+        self.stats.append(stats)
+        self._rules.append((rule, self._wrap(stats)))
+        self._table = None
+        return handler
+
+    def on(self, can_id=None, id_range=None, mask=None):
+        """Decorator form of add()."""
+        return lambda handler: self.add(handler, can_id, id_range, mask)
+
+    def remove(self, handler):
+        """Unregister every route of `handler`, ValueError if it has none."""
+        keep = [i for i, stats in enumerate(self.stats) if stats.handler != handler]
+        if len(keep) == len(self.stats):
+            raise ValueError(f"{handler!r} is not registered")
+        self.stats  = [self.stats[i] for i in keep]
+        self._rules = [self._rules[i] for i in keep]
+        self._table = None
+
+    def _wrap(self, stats):
+        handler = stats.handler
+        if not self.timing:
+            def call(msg):
+                stats.calls += 1
+                handler(msg)
+            return call
+        perf_counter = time.perf_counter
+
+        def timed(msg):
+            start = perf_counter()
+            try:
+                handler(msg)
+            finally:
+                stats.seconds += perf_counter() - start
+                stats.calls += 1
+        return timed
+
+    def compile(self):
+        """Build the lookup structures; called automatically after registrations change."""
+        self._exact = {}
+        self._masks = []
+        ranges = []
+        for order, (rule, call) in enumerate(self._rules):
+            kind, a, b = rule
+            if kind == 'exact':
+                self._exact.setdefault(a, []).append((order, call))
+            elif kind == 'range':
+                ranges.append((a, b, order, call))
+            else:
+                self._masks.append((a, b, order, call))
+        # interval index: segment i spans [bounds[i], bounds[i+1]) and holds every covering range
+        self._bounds = sorted({low for low, _, _, _ in ranges} | {high + 1 for _, high, _, _ in ranges})
+        self._segments = [[(order, call) for low, high, order, call in ranges if low <= start <= high]
+                          for start in self._bounds]
+        self._table = {}
+
+    def handlers(self, can_id):
+        """Handler tuple for an arbitration ID, cached after the first lookup."""
+        if self._table is None:
+            self.compile()
+        calls = self._table.get(can_id)
+        if calls is None:
+            matched = list(self._exact.get(can_id, ()))
+            segment = bisect.bisect_right(self._bounds, can_id) - 1
+            if segment >= 0:
+                matched.extend(self._segments[segment])
+            matched.extend((order, call) for value, mask, order, call in self._masks
+                           if can_id & mask == value)
+            calls = tuple(call for _, call in sorted(matched, key=lambda item: item[0]))
+            self._table[can_id] = calls
+        return calls
+
+    def dispatch(self, msg):
+        calls = self._table.get(msg.arbitration_id) if self._table is not None else None
+        if calls is None:
+            calls = self.handlers(msg.arbitration_id)
+        if calls:
+            for call in calls:
+                call(msg)
+        elif self.default is not None:
+            self.default(msg)
+
+    def __call__(self, batch):
+        dispatch = self.dispatch
+        for msg in batch:
+            dispatch(msg)
+
+    def report(self):
+        return '\n'.join(repr(stats) for stats in self.stats)
+
+
+'''---------------- Signal Decoding ----------------'''
+def load_database(path, cache_dir=CACHE_DIR):
+    """
+    Load a DBC/KCD/ARXML/SYM database with cantools, caching the parsed result as a
+    pickle keyed by the SHA-256 of the file so large databases parse only once.
+    """
+    if cantools is None:
+        raise ImportError("Signal decoding requires cantools: pip install cantools")
+    import hashlib, pickle
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    cache_path = os.path.join(cache_dir, f'db-{digest}.pickle')
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+    database = cantools.database.load_file(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump(database, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except (OSError, pickle.PicklingError):
+        pass
+    return database
+
+
+def _signal_layout(signal, size):
+    """(shift, mask, sign bit) of a signal within the frame read as a `size`-byte integer."""
+    if signal.byte_order == 'little_endian':
+        shift = signal.start
+    else:
+        # DBC big-endian start is the MSB in sawtooth numbering; convert to a linear bit index
+        msb = 8 * (signal.start // 8) + (7 - signal.start % 8)
+        shift = 8 * size - (msb + signal.length)
+    sign = 1 << (signal.length - 1) if signal.is_signed else 0
+    return shift, (1 << signal.length) - 1, sign
+
+
+class MessageDecoder:
+    """
+    Precompiled decoder of one database message: every signal becomes a shift, mask,
+    sign bit, scale and offset applied to the frame read once as a little- and/or
+    big-endian integer. Multiplexed messages and float signals use cantools' decoder.
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.name    = message.name
+        self.size    = message.length
+        self.signals = [signal.name for signal in message.signals]
+        self.generic = message.is_multiplexed() or any(signal.is_float for signal in message.signals)
+        self._little = []
+        self._big    = []
+        for signal in message.signals:
+            layout = (signal.name, *_signal_layout(signal, self.size), signal.scale, signal.offset)
+            (self._little if signal.byte_order == 'little_endian' else self._big).append(layout)
+
+    def __call__(self, data):
+        """{signal: physical value} of one frame's data."""
+        if len(data) < self.size:
+            data = bytes(data).ljust(self.size, b'\x00')
+        if self.generic:
+            return self.message.decode(bytes(data[:self.size]), decode_choices=False)
+        values = {}
+        for order, layouts in (('little', self._little), ('big', self._big)):
+            if not layouts:
+                continue
+            word = int.from_bytes(data[:self.size], order)
+            for name, shift, mask, sign, scale, offset in layouts:
+                raw = (word >> shift) & mask
+                if raw & sign:
+                    raw -= sign << 1
+                values[name] = raw * scale + offset
+        return values
+
+    def decode_columns(self, data):
+        """
+        {signal: NumPy column} for an (n, size) uint8 array of frame data. Frames up to
+        8 bytes decode vectorized on 64-bit words; longer or generic messages per frame.
+        """
+        if self.generic or self.size > 8:
+            rows = [self(bytes(row)) for row in data]
+            return {name: np.array([row.get(name, np.nan) for row in rows]) for name in self.signals}
+        padded = np.zeros((len(data), 8), dtype=np.uint8)
+        padded[:, :self.size] = data[:, :self.size]
+        columns = {}
+        for dtype, layouts in (('<u8', self._little), ('>u8', self._big)):
+            if not layouts:
+                continue
+            words = padded.view(dtype)[:, 0].astype(np.uint64)
+            if dtype == '>u8':
+                # big-endian layouts count bits from the end of a `size`-byte frame
+                words >>= np.uint64(8 * (8 - self.size))
+            for name, shift, mask, sign, scale, offset in layouts:
+                raw = ((words >> np.uint64(shift)) & np.uint64(mask)).astype(np.int64)
+                if sign:
+                    raw = np.where(raw & sign, raw - (sign << 1), raw)
+                columns[name] = raw * scale + offset
+        return columns
+
+
+class SignalDecoder:
+    """
+    Decodes frames with a cantools database through MessageDecoders compiled on first
+    use of each arbitration ID and cached. Usable as a receive consumer, printing the
+    decoded signals of every known frame.
+    """
+
+    def __init__(self, database):
+        self.database  = database
+        self._messages = {message.frame_id: message for message in database.messages}
+        self._decoders = {}
+
+    def decoder(self, can_id):
+        """MessageDecoder for an arbitration ID, or None when the database lacks it."""
+        try:
+            return self._decoders[can_id]
+        except KeyError:
+            message = self._messages.get(can_id)
+            decoder = self._decoders[can_id] = MessageDecoder(message) if message else None
+            return decoder
+
+    def decode(self, msg):
+        """(message name, {signal: value}) for a frame, or None for unknown IDs."""
+        decoder = self.decoder(msg.arbitration_id)
+        if decoder is None:
+            return None
+        return decoder.name, decoder(msg.data)
+
+    def decode_batch(self, batch):
+        """
+        Decode a block of frames into NumPy columns:
+        {message name: {'timestamp': float64 column, signal: column, ...}}.
+        """
+        if np is None:
+            raise ImportError("Batch decoding requires numpy: pip install numpy")
+        by_id = {}
+        for msg in batch:
+            by_id.setdefault(msg.arbitration_id, []).append(msg)
+        result = {}
+        for can_id, frames in by_id.items():
+            decoder = self.decoder(can_id)
+            if decoder is None:
+                continue
+            data = np.frombuffer(b''.join(bytes(msg.data[:decoder.size]).ljust(decoder.size, b'\x00')
+                                          for msg in frames), dtype=np.uint8).reshape(-1, decoder.size)
+            columns = {'timestamp': np.array([msg.timestamp for msg in frames])}
+            columns.update(decoder.decode_columns(data))
+            result[decoder.name] = columns
+        return result
+
+    def __call__(self, batch):
+        lines = []
+        for msg in batch:
+            decoded = self.decode(msg)
+            if decoded:
+                name, values = decoded
+                lines.append(f"Decoded: {msg.timestamp:.6f} {name} "
+                             + ' '.join(f"{signal}={value:g}" for signal, value in values.items()) + '\n')
+        sys.stdout.write(''.join(lines))
+
+
+'''---------------- Bus Monitor ----------------'''
+MONITOR_REFRESH = 10.0  # monitor mode redraws per second
+
+# Terminal control: cursor home + clear screen, and highlighting of changed data bytes
+ANSI_CLEAR   = '\x1b[H\x1b[J'
+ANSI_CHANGED = '\x1b[7m{}\x1b[0m'
+
+
+class IdStats:
+    """Incrementally updated statistics of one arbitration ID (Welford mean/variance of the period)."""
+
+    __slots__ = ('count', 'extended', 'last', 'data', 'changed', 'period_mean', 'period_m2',
+                 'period_min', 'period_max', 'drawn_count', 'rate')
+
+    def __init__(self, extended):
+        self.count       = 0
+        self.extended    = extended
+        self.last        = None
+        self.data        = b''
+        self.changed     = 0
+        self.period_mean = 0.0
+        self.period_m2   = 0.0
+        self.period_min  = math.inf
+        self.period_max  = 0.0
+        self.drawn_count = 0
+        self.rate        = 0.0
+
+    def update(self, timestamp, data):
+        if self.count:
+            period = timestamp - self.last
+            delta  = period - self.period_mean
+            self.period_mean += delta / self.count
+            self.period_m2   += delta * (period - self.period_mean)
+            if period < self.period_min:
+                self.period_min = period
+            if period > self.period_max:
+                self.period_max = period
+            if data != self.data:
+                old = self.data
+                for i in range(len(data)):
+                    if i >= len(old) or data[i] != old[i]:
+                        self.changed |= 1 << i
+        self.count += 1
+        self.last   = timestamp
+        self.data   = data
+
+    @property
+    def jitter(self):
+        """Standard deviation of the period in seconds."""
+        periods = self.count - 1
+        return math.sqrt(self.period_m2 / (periods - 1)) if periods > 1 else 0.0
+
+
+class BusMonitor:
+    """
+    cansniffer-style view: a table keyed by arbitration ID with count, rate, period
+    statistics, jitter and last data (bytes changed since the previous redraw are
+    highlighted). Fed as a receive consumer, redrawn by tick() at `refresh` Hz, so the
+    terminal cost is one write per redraw whatever the bus load.
+    """
+
+    def __init__(self, out=None, refresh=MONITOR_REFRESH, ansi=True):
+        self.out      = out or sys.stdout
+        self.interval = 1.0 / refresh
+        self.ansi     = ansi
+        self.table    = {}
+        self.frames   = 0
+        self._drawn   = time.perf_counter()
+        self._next    = self._drawn + self.interval
+
+    def __call__(self, batch):
+        table = self.table
+        for msg in batch:
+            stats = table.get(msg.arbitration_id)
+            if stats is None:
+                stats = table[msg.arbitration_id] = IdStats(msg.is_extended_id)
+            stats.update(msg.timestamp, bytes(msg.data))
+        self.frames += len(batch)
+
+    def tick(self):
+        if time.perf_counter() >= self._next:
+            self.draw()
+
+    def render(self):
+        now = time.perf_counter()
+        elapsed = now - self._drawn
+        self._drawn = now
+        self._next  = now + self.interval
+        lines = [f"{'ID':>8}  {'count':>9}  {'rate/s':>8}  {'period ms':>9}  {'min':>8}  {'max':>8}  "
+                 f"{'jitter':>8}  data",
+                 ]
+        for can_id in sorted(self.table):
+            stats = self.table[can_id]
+            if elapsed > 0:
+                stats.rate = (stats.count - stats.drawn_count) / elapsed
+            stats.drawn_count = stats.count
+            data = []
+            for i, byte in enumerate(stats.data):
+                text = f'{byte:02X}'
+                data.append(ANSI_CHANGED.format(text) if self.ansi and stats.changed >> i & 1 else text)
+            stats.changed = 0
+            periodic = stats.count > 1
+            lines.append(
+                f"{can_id:>8X}  {stats.count:>9}  {stats.rate:>8.1f}  "
+                + (f"{stats.period_mean * 1e3:>9.2f}  {stats.period_min * 1e3:>8.2f}  "
+                   f"{stats.period_max * 1e3:>8.2f}  {stats.jitter * 1e3:>8.3f}" if periodic
+                   else f"{'-':>9}  {'-':>8}  {'-':>8}  {'-':>8}")
+                + "  " + ' '.join(data))
+        lines.append(f"{len(self.table)} IDs, {self.frames} frames")
+        return '\n'.join(lines) + '\n'
+
+    def draw(self):
+        self.out.write((ANSI_CLEAR if self.ansi else '') + self.render())
+        self.out.flush()
+
+
+'''---------------- Bus Metrics ----------------'''
+CRC15_POLY    = 0x4599  # CAN 2.0 CRC-15 generator polynomial
+STUFF_SAMPLE  = 16      # every Nth frame has its stuff bits counted exactly
+METRICS_HOST  = '127.0.0.1'
+
+
+def _bits(value, width):
+    return [(value >> i) & 1 for i in range(width - 1, -1, -1)]
+
+
+def stuff_bit_count(msg):
+    """Exact number of stuff bits the controller inserts into a classic CAN frame."""
+    rtr  = int(msg.is_remote_frame)
+    dlc  = msg.dlc if msg.is_remote_frame else len(msg.data)
+    if msg.is_extended_id:
+        can_id = msg.arbitration_id
+        bits = [0] + _bits(can_id >> 18, 11) + [1, 1] + _bits(can_id & 0x3FFFF, 18) + [rtr, 0, 0]
+    else:
+        bits = [0] + _bits(msg.arbitration_id, 11) + [rtr, 0, 0]
+    bits += _bits(dlc, 4)
+    if not msg.is_remote_frame:
+        for byte in msg.data[:8]:
+            bits += _bits(byte, 8)
+    crc = 0
+    for bit in bits:
+        feedback = bit ^ (crc >> 14)
+        crc = (crc << 1) & 0x7FFF
+        if feedback:
+            crc ^= CRC15_POLY
+    bits += _bits(crc, 15)
+
+    stuffed, run, previous = 0, 1, bits[0]
+    for bit in bits[1:]:
+        if bit == previous:
+            run += 1
+            if run == 5:
+                # the inserted complement bit starts the next run
+                stuffed += 1
+                previous, run = 1 - bit, 1
+        else:
+            previous, run = bit, 1
+    return stuffed
+
+
+def send_timed_out(error):
+    """True for send errors caused by a write timeout, looking through the errors they were raised from."""
+    while error is not None:
+        if isinstance(error, (TimeoutError, serial.SerialTimeoutException, can.CanTimeoutError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+class BusMetrics:
+    """
+    Continuous bus instrumentation from received and sent frames: frames/s, bytes/s,
+    bus load at the configured bitrate (stuff bits estimated from an exactly counted
+    sample of every STUFF_SAMPLE-th frame), error frames, TX timeouts, receive ring
+    overruns and the bus state where the interface reports one: K800 slcan buses are
+    asked for their status flags on every sample.
+
+    Receive consumer and on_sent/on_error callback of the transmit engines. start()
+    samples windowed rates every `interval` s, optionally printing a summary line and
+    serving the Prometheus text format on http://127.0.0.1:<port>/metrics.
+
+    The status replies are read by whatever reads the buses (a Receiver, a LatencyProbe).
+    Only with `exclusive`, when nothing else reads them (send and playback modes), does
+    the metrics thread read the replies itself.
+    """
+
+    def __init__(self, bit_rate, buses=(), receiver=None, interval=1.0, exclusive=False):
+        self.bit_rate  = bit_rate
+        self.buses     = list(buses)
+        self.receiver  = receiver
+        self.interval  = interval
+        self.exclusive = exclusive
+        self.counters  = dict.fromkeys(('rx_frames', 'tx_frames', 'rx_bytes', 'tx_bytes', 'bits',
+                                        'error_frames', 'tx_errors', 'tx_timeouts'), 0)
+        self.window    = {'frames_per_s': 0.0, 'bytes_per_s': 0.0, 'bus_load': 0.0}
+        self._stuffed   = 0
+        self._stuffable = 0
+        self._sample    = 0
+        self._lock      = threading.Lock()
+        self._last      = (time.perf_counter(), dict(self.counters))
+        self._stop      = threading.Event()
+        self._thread    = None
+        self._server    = None
+
+    def _account(self, msg, direction):
+        counters = self.counters
+        if msg.is_error_frame:
+            counters['error_frames'] += 1
+            return
+        size = len(msg.data)
+        nominal = frame_bit_length(size, msg.is_extended_id)
+        self._sample += 1
+        if self._sample >= STUFF_SAMPLE:
+            self._sample = 0
+            self._stuffed   += stuff_bit_count(msg)
+            self._stuffable += nominal - UNSTUFFED_TAIL_BITS
+        ratio = self._stuffed / self._stuffable if self._stuffable else 0.0
+        counters[direction + '_frames'] += 1
+        counters[direction + '_bytes']  += size
+        counters['bits'] += nominal + ratio * (nominal - UNSTUFFED_TAIL_BITS)
+
+    def __call__(self, batch):
+        with self._lock:
+            for msg in batch:
+                self._account(msg, 'rx')
+
+    def on_sent(self, msg):
+        with self._lock:
+            self._account(msg, 'tx')
+
+    def on_error(self, msg, error):
+        with self._lock:
+            self.counters['tx_errors'] += 1
+            if send_timed_out(error):
+                self.counters['tx_timeouts'] += 1
+
+    @property
+    def overruns(self):
+        return self.receiver.overruns if self.receiver else 0
+
+    @property
+    def bus_state(self):
+        """python-can BusState name of the first bus reporting one (ACTIVE, PASSIVE, ERROR)."""
+        for bus in self.buses:
+            try:
+                return bus.state.name
+            except (AttributeError, NotImplementedError):
+                continue
+        return 'UNKNOWN'
+
+    @property
+    def bus_status(self):
+        """slcan 'F' status byte of the first bus that has one, or None."""
+        for bus in self.buses:
+            status = getattr(bus, 'status', None)
+            if status is not None:
+                return status
+        return None
+
+    def poll(self):
+        """Ask the K800 slcan buses for their status flags, see K800SlcanBus.poll_status()."""
+        for bus in self.buses:
+            poll_status = getattr(bus, 'poll_status', None)
+            if poll_status is None:
+                continue
+            try:
+                poll_status(self.interval / 2 if self.exclusive and not self.receiver else None)
+            except (can.CanError, OSError):
+                pass
+
+    def sample(self):
+        """Update the windowed rates from the counters accumulated since the previous sample."""
+        self.poll()
+        now = time.perf_counter()
+        with self._lock:
+            counters = dict(self.counters)
+        then, previous = self._last
+        self._last = (now, counters)
+        elapsed = now - then
+        if elapsed > 0:
+            frames = counters['rx_frames'] + counters['tx_frames'] - previous['rx_frames'] - previous['tx_frames']
+            data   = counters['rx_bytes'] + counters['tx_bytes'] - previous['rx_bytes'] - previous['tx_bytes']
+            self.window = {
+                'frames_per_s': frames / elapsed,
+                'bytes_per_s':  data / elapsed,
+                'bus_load':     100.0 * (counters['bits'] - previous['bits']) / (elapsed * self.bit_rate * 1000),
+            }
+        return self.window
+
+    def summary(self):
+        c, w = self.counters, self.window
+        return (f"[metrics] load {w['bus_load']:.1f}% @ {self.bit_rate} kbps, {w['frames_per_s']:.0f} frames/s, "
+                f"{w['bytes_per_s']:.0f} B/s, rx {c['rx_frames']} tx {c['tx_frames']}, "
+                f"errors {c['error_frames']}, tx timeouts {c['tx_timeouts']}, overruns {self.overruns}, "
+                f"state {self.bus_state}" + self._flags())
+
+    def _flags(self):
+        flags = slcan_status_flags(self.bus_status or 0)
+        return f" ({', '.join(flags)})" if flags else ''
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format."""
+        c, w = self.counters, self.window
+        metrics = [
+            ('k800_rx_frames_total', 'counter', 'Frames received', c['rx_frames']),
+            ('k800_tx_frames_total', 'counter', 'Frames sent', c['tx_frames']),
+            ('k800_rx_bytes_total', 'counter', 'Data bytes received', c['rx_bytes']),
+            ('k800_tx_bytes_total', 'counter', 'Data bytes sent', c['tx_bytes']),
+            ('k800_error_frames_total', 'counter', 'Error frames received', c['error_frames']),
+            ('k800_tx_errors_total', 'counter', 'Failed sends', c['tx_errors']),
+            ('k800_tx_timeouts_total', 'counter', 'Sends that timed out', c['tx_timeouts']),
+            ('k800_rx_overruns_total', 'counter', 'Frames overwritten in the receive ring', self.overruns),
+            ('k800_frames_per_second', 'gauge', 'Frames per second over the last interval', w['frames_per_s']),
+            ('k800_bytes_per_second', 'gauge', 'Data bytes per second over the last interval', w['bytes_per_s']),
+            ('k800_bus_load_percent', 'gauge', 'Bus load in percent of the bitrate, stuff bits included',
+             w['bus_load']),
+            ('k800_bitrate_bps', 'gauge', 'Configured bitrate', self.bit_rate * 1000),
+        ]
+        lines = []
+        for name, kind, text, value in metrics:
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}', f'{name} {value:g}']
+        lines += ['# HELP k800_bus_state Bus state reported by the interface', '# TYPE k800_bus_state gauge',
+                  f'k800_bus_state{{state="{self.bus_state}"}} 1']
+        status = self.bus_status
+        if status is not None:
+            lines += ['# HELP k800_slcan_status slcan status flags of the last F reply', '# TYPE k800_slcan_status gauge']
+            lines += [f'k800_slcan_status{{flag="{name}"}} {status >> bit & 1}'
+                      for bit, name in SLCAN_STATUS_FLAGS.items()]
+        return '\n'.join(lines) + '\n'
+
+    def start(self, summary_interval=None, port=None):
+        if port is not None:
+            import http.server
+            metrics = self
+
+            class Handler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = http.server.ThreadingHTTPServer((METRICS_HOST, port), Handler)
+            threading.Thread(target=self._server.serve_forever, name='k800-metrics-http', daemon=True).start()
+
+        def run():
+            next_summary = time.perf_counter() + (summary_interval or 0)
+            while not self._stop.wait(self.interval):
+                self.sample()
+                if summary_interval and time.perf_counter() >= next_summary:
+                    print(self.summary())
+                    next_summary += summary_interval
+
+        self._thread = threading.Thread(target=run, name='k800-metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+'''---------------- Latency ----------------'''
+LATENCY_PROBE_ID = 0x7F0  # probe frames; the loopback peer answers on LATENCY_PROBE_ID + 1
+LATENCY_FPS      = 100    # latency mode probes per second when --fps is not given
+LATENCY_TIMEOUT  = 0.1    # seconds to wait for a probe reply before counting it lost
+HISTOGRAM_BITS   = 8      # significant bits kept per sample: 2**(HISTOGRAM_BITS-1) buckets per power of two, under 1 % error
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram in microseconds: linear buckets up to 2**HISTOGRAM_BITS,
+    then every power of two split into 2**(HISTOGRAM_BITS-1) sub-buckets, so any value is
+    recorded with under 2**(1-HISTOGRAM_BITS) relative error (0.78 %, under 1 %) at constant
+    cost and memory.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total  = 0
+        self.max    = 0
+
+    @staticmethod
+    def _bucket(value):
+        shift = max(0, value.bit_length() - HISTOGRAM_BITS)
+        return shift, value >> shift
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        key = self._bucket(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Highest value equivalent to the bucket holding the given percentile, in microseconds."""
+        if not self.total:
+            return 0
+        target = math.ceil(self.total * percent / 100)
+        seen = 0
+        for shift, sub in sorted(self.counts):
+            seen += self.counts[shift, sub]
+            if seen >= target:
+                return min(((sub + 1) << shift) - 1, self.max)
+        return self.max
+
+    def distribution(self):
+        """Counts per power-of-two range as (low_us, high_us, count)."""
+        ranges = {}
+        for (shift, sub), n in self.counts.items():
+            value = sub << shift
+            low = 1 << (value.bit_length() - 1) if value else 0
+            ranges[low] = ranges.get(low, 0) + n
+        return [(low, 2 * low - 1 if low else 0, n) for low, n in sorted(ranges.items())]
+
+    def report(self, name):
+        lines = [f"{name}: {self.total} samples, p50 {self.percentile(50)} us, p90 {self.percentile(90)} us, "
+                 f"p99 {self.percentile(99)} us, max {self.max} us"]
+        for low, high, n in self.distribution():
+            lines.append(f"  {low:>8}-{high:<8} us {n:>7} {'#' * max(1, round(40 * n / self.total))}")
+        return '\n'.join(lines)
+
+
+def slcan_length(msg):
+    """Bytes of the slcan ASCII command carrying msg over the USB serial port."""
+    return 1 + (8 if msg.is_extended_id else 3) + 1 + 2 * len(msg.data) + 1
+
+
+def serialization_overhead(msg, rtt_us=None, bit_rate=None, on_wire=True):
+    """
+    Per bitrate: wire time of msg (stuff bits counted exactly) and its slcan size. Given the
+    measured median round trip at bit_rate, the host/USB/slcan share of it (round trip minus
+    two wire times, unless the bus had none, on_wire=False) and the round trip projected
+    for every other bitrate.
+    """
+    bits = frame_bit_length(len(msg.data), msg.is_extended_id) + stuff_bit_count(msg)
+    host_us = None
+    if rtt_us is not None:
+        host_us = rtt_us - 2 * bits * 1000 / bit_rate if on_wire else rtt_us
+    rows = []
+    for rate in valid_bit_rates:
+        wire_us = bits * 1000 / rate
+        row = {'bitrate': rate, 'frame_bits': bits, 'wire_us': round(wire_us, 1), 'slcan_bytes': slcan_length(msg)}
+        if host_us is not None:
+            row['host_us'] = round(host_us, 1)
+            row['rtt_us'] = round(host_us + 2 * wire_us, 1)
+        rows.append(row)
+    return rows
+
+
+class EchoPeer:
+    """
+    Local loopback peer: answers every probe frame received on its bus with the same data on
+    LATENCY_PROBE_ID + 1. Runs on a second K800 unit or a second virtual bus; on a single unit
+    any node on the bus answering probes the same way can stand in for it.
+    """
+
+    def __init__(self, bus, probe_id=LATENCY_PROBE_ID, on_probe=None):
+        self.bus      = bus
+        self.probe_id = probe_id
+        self.on_probe = on_probe
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                msg = self.bus.recv(timeout=0.1)
+            except can.CanError:
+                continue
+            if msg is None or msg.arbitration_id != self.probe_id:
+                continue
+            if self.on_probe:
+                self.on_probe(msg)
+            try:
+                self.bus.send(can.Message(arbitration_id=self.probe_id + 1, is_extended_id=msg.is_extended_id,
+                                          data=msg.data))
+            except (can.CanError, FrameQueued):
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='k800-echo', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+class LatencyProbe:
+    """
+    Sends sequence-numbered probes at a fixed rate, one outstanding at a time, and times the
+    reply from the loopback peer. Round trips go into one histogram; with a local peer the
+    host-to-bus leg (send call to the peer's receive timestamp) goes into a second one.
+    """
+
+    def __init__(self, bus, peer_bus=None, fps=LATENCY_FPS, probe_id=LATENCY_PROBE_ID, timeout=LATENCY_TIMEOUT):
+        self.bus      = bus
+        self.peer     = EchoPeer(peer_bus, probe_id, on_probe=self._outbound) if peer_bus else None
+        self.interval = 1.0 / fps
+        self.probe_id = probe_id
+        self.timeout  = timeout
+        self.rtt      = LatencyHistogram()
+        self.outbound = LatencyHistogram()
+        self.sent     = 0
+        self.lost     = 0
+        self._sent_at = {}
+        self._stop    = threading.Event()
+
+    def _outbound(self, msg):
+        sent_at = self._sent_at.get(int.from_bytes(msg.data[:4], 'little'))
+        if sent_at is not None:
+            self.outbound.record(msg.timestamp - sent_at)
+
+    def probe(self, seq):
+        """Send probe seq and wait for its reply, returns the round trip in seconds or None."""
+        msg = can.Message(arbitration_id=self.probe_id, is_extended_id=False,
+                          data=seq.to_bytes(4, 'little') + bytes(4))
+        self._sent_at = {seq: time.time()}
+        start = time.perf_counter()
+        try:
+            self.bus.send(msg, timeout=self.timeout)
+        except FrameQueued:
+            # sent only after a reconnect, far too late for its reply to be timed
+            self.sent += 1
+            self.lost += 1
+            return None
+        self.sent += 1
+        deadline = start + self.timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self.lost += 1
+                return None
+            reply = self.bus.recv(timeout=remaining)
+            if (reply is not None and reply.arbitration_id == self.probe_id + 1
+                    and int.from_bytes(reply.data[:4], 'little') == seq):
+                rtt = time.perf_counter() - start
+                self.rtt.record(rtt)
+                return rtt
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, count=None):
+        if self.peer:
+            self.peer.start()
+        try:
+            next_probe = time.perf_counter()
+            for seq in itertools.count() if count is None else range(count):
+                if self._stop.is_set():
+                    break
+                try:
+                    self.probe(seq)
+                except can.CanError:
+                    self.lost += 1
+                next_probe += self.interval
+                sleep_until(next_probe)
+        finally:
+            if self.peer:
+                self.peer.stop()
+        return self
+
+    def report(self, bit_rate, on_wire=True):
+        lines = [f"Sent {self.sent} probes, {self.lost} lost",
+                 self.rtt.report('Round trip')]
+        if self.outbound.total:
+            lines.append(self.outbound.report('Host to bus'))
+        msg = can.Message(arbitration_id=self.probe_id, is_extended_id=False, data=bytes(8))
+        rtt_us = self.rtt.percentile(50) if self.rtt.total else None
+        lines.append("Serialization per bitrate" + (f" (round trip projected from p50 at {bit_rate} kbps)"
+                                                    if rtt_us is not None else ""))
+        for row in serialization_overhead(msg, rtt_us, bit_rate, on_wire):
+            line = (f"  {row['bitrate']:>5} kbps: {row['frame_bits']} bits {row['wire_us']:>8} us on the wire, "
+                    f"{row['slcan_bytes']} slcan bytes")
+            if 'rtt_us' in row:
+                line += f", host/USB {row['host_us']} us, round trip {row['rtt_us']} us"
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+'''---------------- Binary Frame Log ----------------'''
+# Segment file header: magic, format version, record size, number of valid records
+LOG_HEADER   = struct.Struct('<8sIIQ')
+LOG_COUNT    = struct.Struct('<Q')
+LOG_COUNT_OFFSET = 16
+LOG_MAGIC    = b'K800LOG\x00'
+LOG_VERSION  = 1
+LOG_SUFFIX   = '.k8l'
+
+# Fixed-size frame record: timestamp, arbitration id, flags, dlc, padding, 8 data bytes
+FRAME_RECORD = struct.Struct('<dIBB2x8s')
+
+# FRAME_RECORD flag bits
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE   = 0x02
+FLAG_ERROR    = 0x04
+FLAG_TX       = 0x08
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024  # bytes per preallocated log segment
+
+
+def frame_flags(msg, tx=False):
+    """FRAME_RECORD flag byte of a can.Message."""
+    return ((FLAG_EXTENDED if msg.is_extended_id else 0) | (FLAG_REMOTE if msg.is_remote_frame else 0)
+            | (FLAG_ERROR if msg.is_error_frame else 0) | (FLAG_TX if tx else 0))
+
+
+def record_to_message(record):
+    """can.Message from an unpacked FRAME_RECORD tuple."""
+    timestamp, arbitration_id, flags, dlc, data = record
+    return can.Message(timestamp=timestamp, arbitration_id=arbitration_id,
+                       is_extended_id=bool(flags & FLAG_EXTENDED), is_remote_frame=bool(flags & FLAG_REMOTE),
+                       is_error_frame=bool(flags & FLAG_ERROR), is_rx=not flags & FLAG_TX,
+                       dlc=dlc, data=data[:dlc])
+
+
+class FrameLogWriter:
+    """
+    Writes frames as FRAME_RECORDs into preallocated, memory-mapped segment files.
+
+    A new segment `<prefix>_<n>.k8l` starts when the current one is full (`segment_size`
+    bytes) or `segment_seconds` old. Records are packed straight into the mapping and the
+    header count is updated after each one, so a reader sees every completed record;
+    closed segments are truncated to their used length. Callable as a receive consumer.
+    """
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, segment_seconds=None, prefix='k800'):
+        self.directory = directory
+        self.prefix    = prefix
+        self.segment_seconds = segment_seconds
+        self.capacity  = (segment_size - LOG_HEADER.size) // FRAME_RECORD.size
+        if self.capacity < 1:
+            raise ValueError("Segment size too small for a single record")
+        self.written   = 0
+        self.segments  = []
+        self._mm       = None
+        self._count    = 0
+        self._deadline = None
+        os.makedirs(directory, exist_ok=True)
+        # continue after the highest index on disk, which may have gaps when segments were deleted
+        indexes = [os.path.basename(path)[len(prefix) + 1:-len(LOG_SUFFIX)]
+                   for path in glob.glob(os.path.join(directory, f'{prefix}_*{LOG_SUFFIX}'))]
+        self._index = max((int(index) for index in indexes if index.isdigit()), default=-1) + 1
+        self._lock  = threading.Lock()
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f'{self.prefix}_{self._index:06d}{LOG_SUFFIX}')
+        self._index += 1
+        size = LOG_HEADER.size + self.capacity * FRAME_RECORD.size
+        self._file = open(path, 'x+b')  # never overwrite an existing segment
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        LOG_HEADER.pack_into(self._mm, 0, LOG_MAGIC, LOG_VERSION, FRAME_RECORD.size, 0)
+        self._count = 0
+        if self.segment_seconds:
+            self._deadline = time.monotonic() + self.segment_seconds
+        self.segments.append(path)
+
+    def _close_segment(self):
+        if self._mm is None:
+            return
+        self._mm.flush()
+        self._mm.close()
+        self._mm = None
+        self._file.truncate(LOG_HEADER.size + self._count * FRAME_RECORD.size)
+        self._file.close()
+
+    def write(self, msg, tx=False):
+        with self._lock:
+            if (self._mm is None or self._count == self.capacity
+                    or (self._deadline is not None and time.monotonic() >= self._deadline)):
+                self._close_segment()
+                self._open_segment()
+            dlc = min(len(msg.data), 8) if msg.data else (msg.dlc if msg.is_remote_frame else 0)
+            FRAME_RECORD.pack_into(self._mm, LOG_HEADER.size + self._count * FRAME_RECORD.size,
+                                   msg.timestamp, msg.arbitration_id, frame_flags(msg, tx), dlc,
+                                   bytes(msg.data[:8]))
+            self._count += 1
+            LOG_COUNT.pack_into(self._mm, LOG_COUNT_OFFSET, self._count)
+            self.written += 1
+
+    def __call__(self, batch):
+        for msg in batch:
+            self.write(msg)
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameLogReader:
+    """
+    Reads FrameLogWriter segments (a single .k8l file or a directory of them) through
+    read-only memory maps, unpacking records on demand without parsing text.
+
+    Supports len(), iteration, integer and slice indexing over the whole log and
+    between() for time windows (segments are assumed to be in timestamp order).
+    """
+
+    def __init__(self, path, prefix='k800'):
+        paths = sorted(glob.glob(os.path.join(path, f'{prefix}_*{LOG_SUFFIX}'))) if os.path.isdir(path) else [path]
+        self._maps   = []
+        self._views  = []
+        self._starts = []
+        total = 0
+        for segment in paths:
+            with open(segment, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, record_size, count = LOG_HEADER.unpack_from(mm, 0)
+            if magic != LOG_MAGIC or record_size != FRAME_RECORD.size:
+                mm.close()
+                raise ValueError(f"{segment} is not a K800 frame log")
+            count = min(count, (len(mm) - LOG_HEADER.size) // FRAME_RECORD.size)
+            self._maps.append(mm)
+            self._views.append(memoryview(mm)[LOG_HEADER.size:LOG_HEADER.size + count * FRAME_RECORD.size])
+            self._starts.append(total)
+            total += count
+        self._total = total
+
+    def __len__(self):
+        return self._total
+
+    def _locate(self, index):
+        segment = bisect.bisect_right(self._starts, index) - 1
+        return segment, index - self._starts[segment]
+
+    def records(self, start=0, stop=None):
+        """Iterate (timestamp, id, flags, dlc, data) tuples for records start..stop."""
+        stop = self._total if stop is None else min(stop, self._total)
+        while start < stop:
+            segment, offset = self._locate(start)
+            view = self._views[segment]
+            end  = min(len(view) // FRAME_RECORD.size, offset + stop - start)
+            yield from FRAME_RECORD.iter_unpack(view[offset * FRAME_RECORD.size:end * FRAME_RECORD.size])
+            start += end - offset
+
+    def __iter__(self):
+        return self.records()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._total)
+            return list(itertools.islice(self.records(start, stop), 0, None, step))
+        if index < 0:
+            index += self._total
+        if not 0 <= index < self._total:
+            raise IndexError("frame log index out of range")
+        segment, offset = self._locate(index)
+        return FRAME_RECORD.unpack_from(self._views[segment], offset * FRAME_RECORD.size)
+
+    def timestamp(self, index):
+        segment, offset = self._locate(index)
+        return struct.unpack_from('<d', self._views[segment], offset * FRAME_RECORD.size)[0]
+
+    def between(self, start_time, end_time):
+        """Records with start_time <= timestamp < end_time, located by binary search."""
+        lo, hi = 0, self._total
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < start_time:
+                lo = mid + 1
+            else:
+                hi = mid
+        for record in self.records(lo):
+            if record[0] >= end_time:
+                break
+            yield record
+
+    def messages(self, start=0, stop=None):
+        """Iterate records as can.Message objects."""
+        return map(record_to_message, self.records(start, stop))
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        for mm in self._maps:
+            mm.close()
+        self._views, self._maps = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark_log(count=200000):
+    """Frames/s of the text print path (to os.devnull) vs the binary frame log."""
+    import tempfile
+    bus = synthetic_bus(ids=range(0x100, 0x140))
+    frames = [bus.recv() for _ in range(count)]
+    bus.shutdown()
+    results = {'frames': count}
+
+    with open(os.devnull, 'w') as out:
+        start = time.perf_counter()
+        for i in range(0, count, RECV_BATCH):
+            out.write(''.join(f"Received: {msg}\n" for msg in frames[i:i + RECV_BATCH]))
+        results['print_fps'] = count / (time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        writer = FrameLogWriter(directory)
+        start = time.perf_counter()
+        for i in range(0, count, RECV_BATCH):
+            writer(frames[i:i + RECV_BATCH])
+        writer.close()
+        results['log_fps'] = count / (time.perf_counter() - start)
+
+        with FrameLogReader(directory) as reader:
+            start = time.perf_counter()
+            for _ in reader:
+                pass
+            results['read_fps'] = count / (time.perf_counter() - start)
+
+    results['speedup'] = results['log_fps'] / results['print_fps']
+    return results
+
+
+'''---------------- Capture Store ----------------'''
+@functools.lru_cache(maxsize=None)
+def capture_dtype():
+    """NumPy layout of a captured frame, byte-compatible with FRAME_RECORD (24 bytes per frame)."""
+    return np.dtype({
+        'names':    ['timestamp', 'id', 'flags', 'dlc', 'data'],
+        'formats':  ['<f8', '<u4', 'u1', 'u1', ('u1', 8)],
+        'offsets':  [0, 8, 12, 13, 16],
+        'itemsize': FRAME_RECORD.size,
+    })
+
+CAPTURE_CAPACITY = 65536  # initial CaptureStore capacity in frames, doubled as needed
+CAPTURE_FORMATS  = ['.arrow', '.feather', '.npy', '.parquet']  # CaptureStore.save() suffixes
+
+
+class CaptureStore:
+    """
+    Columnar in-memory capture: frames live in one preallocated NumPy structured array
+    (capture_dtype(), 24 bytes per frame) that doubles when full, instead of a list of
+    can.Message objects. Usable as a receive consumer, sent frames are added with
+    append(msg, tx=True); supports boolean-mask queries by ID and time window, per-ID
+    statistics and export to .npy, Arrow or Parquet.
+    """
+
+    def __init__(self, capacity=CAPTURE_CAPACITY):
+        if np is None:
+            raise ImportError("CaptureStore requires numpy: pip install numpy")
+        self._data = np.zeros(max(1, capacity), dtype=capture_dtype())
+        self._size = 0
+        self._lock = threading.Lock()  # sent frames arrive from the sender threads
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def frames(self):
+        """Structured array view of the captured frames."""
+        return self._data[:self._size]
+
+    @property
+    def nbytes(self):
+        return self._size * capture_dtype().itemsize
+
+    def _reserve(self, count):
+        needed = self._size + count
+        if needed > len(self._data):
+            capacity = len(self._data)
+            while capacity < needed:
+                capacity *= 2
+            data = np.zeros(capacity, dtype=capture_dtype())
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+    def extend(self, batch, tx=False):
+        """Append a batch of can.Messages."""
+        count = len(batch)
+        if not count:
+            return
+        with self._lock:
+            self._reserve(count)
+            view = self._data[self._size:self._size + count]
+            view['timestamp'] = [msg.timestamp for msg in batch]
+            view['id']        = [msg.arbitration_id for msg in batch]
+            view['flags']     = [frame_flags(msg, tx) for msg in batch]
+            view['dlc']       = [min(len(msg.data), 8) for msg in batch]
+            view['data']      = np.frombuffer(b''.join(bytes(msg.data[:8]).ljust(8, b'\x00') for msg in batch),
+                                              dtype=np.uint8).reshape(count, 8)
+            self._size += count
+
+    def append(self, msg, tx=False):
+        """Append one can.Message, such as a frame just sent (tx=True)."""
+        data = bytes(msg.data[:8])
+        with self._lock:
+            self._reserve(1)
+            self._data[self._size] = (msg.timestamp, msg.arbitration_id, frame_flags(msg, tx), len(data),
+                                      tuple(data.ljust(8, b'\x00')))
+            self._size += 1
+
+    def __call__(self, batch):
+        self.extend(batch)
+
+    def extend_records(self, records):
+        """Append a capture_dtype() array, e.g. one viewed straight from a frame log segment."""
+        with self._lock:
+            self._reserve(len(records))
+            self._data[self._size:self._size + len(records)] = records
+            self._size += len(records)
+
+    @classmethod
+    def from_log(cls, path):
+        """Load a FrameLogWriter log; each segment is viewed in place, then copied once into the store."""
+        with FrameLogReader(path) as reader:
+            store = cls(capacity=len(reader) or 1)
+            for view in reader._views:
+                store.extend_records(np.frombuffer(view, dtype=capture_dtype()))
+        return store
+
+    def mask(self, ids=None, start=None, end=None):
+        """Boolean mask of frames with an ID in `ids` and start <= timestamp < end."""
+        frames = self.frames
+        selected = np.ones(len(frames), dtype=bool)
+        if ids is not None:
+            selected &= np.isin(frames['id'], np.asarray(list(ids), dtype=np.uint32))
+        if start is not None:
+            selected &= frames['timestamp'] >= start
+        if end is not None:
+            selected &= frames['timestamp'] < end
+        return selected
+
+    def select(self, ids=None, start=None, end=None):
+        """Frames matching mask(), as a structured array."""
+        return self.frames[self.mask(ids, start, end)]
+
+    def id_stats(self):
+        """{id: {'count', 'first', 'last', 'rate', 'mean_period', 'min_period', 'max_period'}}."""
+        frames = self.frames
+        order  = np.lexsort((frames['timestamp'], frames['id']))
+        ids    = frames['id'][order]
+        times  = frames['timestamp'][order]
+        unique, starts, counts = np.unique(ids, return_index=True, return_counts=True)
+        stats = {}
+        for can_id, first, count in zip(unique.tolist(), starts.tolist(), counts.tolist()):
+            stamps  = times[first:first + count]
+            periods = np.diff(stamps)
+            span    = stamps[-1] - stamps[0]
+            stats[can_id] = {
+                'count': count,
+                'first': float(stamps[0]),
+                'last':  float(stamps[-1]),
+                'rate':  float((count - 1) / span) if span > 0 else 0.0,
+                'mean_period': float(periods.mean()) if count > 1 else None,
+                'min_period':  float(periods.min()) if count > 1 else None,
+                'max_period':  float(periods.max()) if count > 1 else None,
+            }
+        return stats
+
+    def to_arrow(self):
+        """
+        pyarrow.Table of the capture. Arrow needs contiguous columns, so each field is
+        gathered out of the interleaved records once; the Arrow arrays then wrap those
+        buffers without a further copy.
+        """
+        if pyarrow is None:
+            raise ImportError("Arrow export requires pyarrow: pip install pyarrow")
+        frames  = self.frames
+        columns = {name: pyarrow.array(np.ascontiguousarray(frames[name]))
+                   for name in ('timestamp', 'id', 'flags', 'dlc')}
+        columns['data'] = pyarrow.FixedSizeListArray.from_arrays(
+            pyarrow.array(np.ascontiguousarray(frames['data']).reshape(-1)), 8)
+        return pyarrow.table(columns)
+
+    def to_parquet(self, path):
+        pyarrow.parquet.write_table(self.to_arrow(), path)
+
+    def save(self, path):
+        """Write the capture as .parquet, .arrow/.feather (IPC file) or .npy (records as stored) by suffix."""
+        suffix = os.path.splitext(path)[1].lower()
+        if suffix not in CAPTURE_FORMATS:
+            raise ValueError(f"Unknown capture format '{suffix}' for {path}, use one of {CAPTURE_FORMATS}")
+        if suffix == '.npy':
+            np.save(path, self.frames)
+        elif suffix == '.parquet':
+            self.to_parquet(path)
+        else:
+            table = self.to_arrow()
+            with pyarrow.OSFile(path, 'wb') as sink, pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+'''---------------- Recording ----------------'''
+RECORD_QUEUE = 64    # frame batches buffered for the recording writer thread
+RECORD_FLUSH = 1.0   # seconds between recording file flushes
+
+# File suffixes can.Logger writes (.mf4 needs asammdf installed)
+RECORD_FORMATS = ['.asc', '.blf', '.csv', '.db', '.log', '.mf4', '.trc', '.txt']
+
+
+class RecordingWriter:
+    """
+    Streams frames to a standard capture file through python-can's can.Logger family,
+    chosen by suffix: .blf, .asc, .csv, .log (candump), .db (SQLite), .trc, .mf4.
+
+    Used as a receive consumer: batches are queued without blocking and written on a
+    background thread with flushes every `flush_interval` s; if the writer falls behind
+    a full queue drops the batch rather than stalling reception, with a warning on the
+    first drop and the count in report(). Sent frames passed to write() are collected
+    into batches of RECV_BATCH, written at the latest with the next flush.
+    """
+
+    def __init__(self, filename, queue_size=RECORD_QUEUE, flush_interval=RECORD_FLUSH):
+        self.filename = filename
+        self.writer   = can.Logger(filename)
+        self.flush_interval = flush_interval
+        self.written  = 0
+        self.dropped  = 0
+        self.flushes  = 0
+        self.busy     = 0.0
+        self._queue   = queue.Queue(queue_size)
+        self._pending = []
+        self._lock    = threading.Lock()
+        self._thread  = threading.Thread(target=self._run, name='k800-record', daemon=True)
+        self._thread.start()
+
+    def __call__(self, batch):
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            if not self.dropped:
+                print(f"Recording to {self.filename} is falling behind, dropping frames")
+            self.dropped += len(batch)
+
+    def write(self, msg):
+        """Record a sent frame, queued once RECV_BATCH of them are collected."""
+        with self._lock:
+            self._pending.append(msg)
+            if len(self._pending) < RECV_BATCH:
+                return
+            batch, self._pending = self._pending, []
+        self(batch)
+
+    def _take_pending(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _flush(self):
+        file = getattr(self.writer, 'file', None)
+        if file is not None and not file.closed:
+            file.flush()
+        self.flushes += 1
+
+    def _run(self):
+        on_message_received = self.writer.on_message_received
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                batch = []
+            if batch is None:
+                break
+            start = time.perf_counter()
+            flush = time.monotonic() >= next_flush
+            if flush:
+                # sent frames that have not filled a batch yet
+                batch = batch + self._take_pending()
+            for msg in batch:
+                on_message_received(msg)
+            self.written += len(batch)
+            if flush:
+                self._flush()
+                next_flush = time.monotonic() + self.flush_interval
+            self.busy += time.perf_counter() - start
+
+    def close(self):
+        """Write everything queued, then close the file."""
+        pending = self._take_pending()
+        if pending:
+            self._queue.put(pending)
+        self._queue.put(None)
+        self._thread.join()
+        self.writer.stop()
+
+    def report(self):
+        rate = self.written / self.busy if self.busy > 0 else 0.0
+        return (f"Recorded {self.written} frames to {self.filename} ({self.dropped} dropped, "
+                f"{self.flushes} flushes, writer capacity {rate:.0f} fps)")
+
+
+def benchmark_record(count=50000):
+    """Writer throughput of each capture format that can.Logger supports here, in frames/s."""
+    import tempfile
+    bus = synthetic_bus(ids=range(0x100, 0x140))
+    frames = [bus.recv() for _ in range(count)]
+    bus.shutdown()
+    results = {'frames': count}
+    with tempfile.TemporaryDirectory() as directory:
+        for suffix in RECORD_FORMATS:
+            try:
+                recorder = RecordingWriter(os.path.join(directory, f'capture{suffix}'),
+                                           queue_size=count // RECV_BATCH + 1)
+            except Exception as e:
+                results[suffix] = f"unavailable: {e}"
+                continue
+            start = time.perf_counter()
+            for i in range(0, count, RECV_BATCH):
+                recorder(frames[i:i + RECV_BATCH])
+            recorder.close()
+            results[suffix] = count / (time.perf_counter() - start)
+    return results
+
+
+'''---------------- Replay ----------------'''
+def open_capture(path):
+    """
+    Lazily iterate the frames of a recorded capture: the tool's own frame log (.k8l file
+    or log directory) or any format can.LogReader reads (candump .log, .asc, .blf, ...).
+    """
+    if os.path.isdir(path) or path.endswith(LOG_SUFFIX):
+        with FrameLogReader(path) as reader:
+            yield from reader.messages()
+    else:
+        yield from can.LogReader(path)
+
+
+class ReplayStats:
+    """Frames replayed and how late each was sent relative to its scheduled time."""
+
+    def __init__(self, speed):
+        self.speed   = speed
+        self.sent    = 0
+        self.failed  = 0
+        self.queued  = 0
+        self.skipped = 0
+        self.jitter  = array('d')
+        self.start   = time.perf_counter()
+        self.end     = self.start
+
+    def report(self):
+        elapsed = self.end - self.start
+        import statistics
+        queued = f", {self.queued} queued while reconnecting" if self.queued else ''
+        report = (f"Replayed {self.sent} frames ({self.failed} failed{queued}, {self.skipped} filtered) "
+                  f"in {elapsed:.2f} s at {'max rate' if not self.speed else f'{self.speed:g}x'}")
+        if len(self.jitter) > 1 and self.speed:
+            jitter = sorted(self.jitter)
+            p = lambda q: jitter[min(len(jitter) - 1, int(q * len(jitter)))] * 1e6
+            report += (f"\n    jitter us: mean {statistics.fmean(jitter) * 1e6:.1f}, "
+                       f"stdev {statistics.pstdev(jitter) * 1e6:.1f}, p50 {p(0.5):.1f}, "
+                       f"p99 {p(0.99):.1f}, max {jitter[-1] * 1e6:.1f}")
+        return report
+
+
+class ReplayEngine:
+    """
+    Plays a recorded capture back onto a bus with its original inter-frame timing.
+
+    Frame i is scheduled at start + (t_i - t_0) / speed and sent with sleep_until(), so
+    timing errors never accumulate across the capture; speed 0 (or None) sends as fast as
+    the bus accepts. `loops` plays the capture that many times (0 forever), `ids`
+    restricts replay to those arbitration IDs. Error frames are never replayed.
+    """
+
+    def __init__(self, bus, path, speed=1.0, loops=1, ids=None, timeout=0.2, on_sent=None, on_error=None):
+        self.bus     = bus
+        self.path    = path
+        self.speed   = speed
+        self.loops   = loops
+        self.ids     = set(ids) if ids else None
+        self.timeout = timeout
+        self.on_sent = on_sent
+        self.on_error = on_error
+        self.stats   = ReplayStats(speed)
+        self._stop   = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        stats = self.stats
+        stats.start = time.perf_counter()
+        origin = None  # set when the first frame has been read, after the capture is opened
+        jitter = stats.jitter
+        played = 0
+        try:
+            while not self._stop.is_set() and (not self.loops or played < self.loops):
+                first  = None
+                offset = 0.0
+                frames = 0
+                for msg in open_capture(self.path):
+                    if self._stop.is_set():
+                        break
+                    if msg.is_error_frame or (self.ids is not None and msg.arbitration_id not in self.ids):
+                        stats.skipped += 1
+                        continue
+                    if first is None:
+                        first = msg.timestamp
+                        if origin is None:
+                            origin = time.perf_counter()
+                    frames += 1
+                    if self.speed:
+                        offset = (msg.timestamp - first) / self.speed
+                        due = origin + offset
+                        sleep_until(due)
+                        jitter.append(time.perf_counter() - due)
+                    msg.is_rx = False
+                    try:
+                        self.bus.send(msg, timeout=self.timeout)
+                    except FrameQueued:
+                        stats.queued += 1
+                        continue
+                    except can.CanError as e:
+                        stats.failed += 1
+                        if self.on_error:
+                            self.on_error(msg, e)
+                        continue
+                    stats.sent += 1
+                    if self.on_sent:
+                        self.on_sent(msg)
+                played += 1
+                if first is None:
+                    break  # nothing left to replay after filtering
+                # next loop starts one mean frame interval after this one ended
+                origin += offset + offset / max(1, frames - 1)
+        finally:
+            stats.end = time.perf_counter()
+        return stats
+
+
+'''---------------- asyncio API ----------------'''
+class AsyncK800Session:
+    """
+    asyncio session owning the K800 management port and the CAN bus.
+
+    The management shell is driven through a pyserial-asyncio transport, received
+    frames are delivered by a can.Notifier into a can.AsyncBufferedReader, so no
+    call blocks the event loop. The ports are discovered unless `mgmt_port` and
+    `vcan_port` are given, such as those of the MCU emulator. Example:
+
+        async with AsyncK800Session(bit_rate=500) as session:
+            await session.send(can.Message(arbitration_id=0x123, data=b'K800'))
+            async for msg in session:
+                print(msg)
+    """
+
+    def __init__(self, bit_rate=DEFAULT_BITRATE, interface=DEFAULT_INTERFACE, is_led=LED_CHECK, force_config=False,
+                 mgmt_port=None, vcan_port=None, open_delay=SLCAN_OPEN_DELAY):
+        if bit_rate not in valid_bit_rates:
+            raise ValueError(f"Invalid bit_rate {bit_rate}, expected one of {valid_bit_rates}")
+        self.bit_rate  = bit_rate
+        self.interface = interface
+        self.is_led    = is_led
+        self.force_config = force_config
+        self.mgmt_port = mgmt_port
+        self.vcan_port = vcan_port
+        self.open_delay = open_delay
+        self.bus       = None
+        self.notifier  = None
+        self._buffer   = can.AsyncBufferedReader()
+        self._reader   = None
+        self._writer   = None
+        self._lock     = asyncio.Lock()
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        if self.interface == 'slcan':
+            if serial_asyncio is None:
+                raise ImportError("AsyncK800Session requires pyserial-asyncio: pip install pyserial-asyncio")
+            mgmt_port, vcan_port = self.mgmt_port, self.vcan_port
+            if not mgmt_port or not vcan_port:
+                ports     = await loop.run_in_executor(None, discover_ports, MCU_VID_PID)
+                mgmt_port = ports.get(MGMT_INTERFACE)
+                vcan_port = ports.get(VCAN_INTERFACE)
+            if not mgmt_port or not vcan_port:
+                raise OSError("K800 MCU not found. Please check configurations and connections.")
+            self._reader, self._writer = await serial_asyncio.open_serial_connection(url=mgmt_port)
+            await self.command('')
+            # the same read-back and confirmation as K800Device, run off the loop over this transport
+            identity = _sysfs_identity(mgmt_port)
+            await loop.run_in_executor(None, lambda: configure_can(
+                _BlockingShell(self, loop), 'VCAN0', 'slcan', str(self.bit_rate),
+                unit=identity[0] if identity else None, force=self.force_config))
+            await self.set_leds(True)
+            options = {} if self.open_delay is None else {'sleep_after_open': self.open_delay}
+            self.bus = await loop.run_in_executor(
+                None, lambda: open_bus('slcan', channel=vcan_port,
+                                      bitrate=self.bit_rate*1000, receive_own_messages=False, **options))
+        elif self.interface == 'synthetic':
+            self.bus = synthetic_bus()
+        else:
+            self.bus = open_bus(self.interface, channel='k800', bitrate=self.bit_rate*1000)
+        self.notifier = can.Notifier(self.bus, [self._buffer], loop=loop)
+        return self
+
+    async def command(self, command, timeout=MCU_TIMEOUT):
+        """Send one management shell command and return its output once the prompt comes back."""
+        return (await self.batch([command], timeout))[0]
+
+    async def batch(self, commands, timeout=MCU_TIMEOUT):
+        """Pipeline several commands in one write, returning one response per command."""
+        if self._writer is None:
+            raise RuntimeError("No management port open (virtual/synthetic session)")
+        if not commands:
+            return []
+        async with self._lock:
+            self._writer.write(''.join(f'{command}\r\n' for command in commands).encode())
+            await self._writer.drain()
+
+            async def read_all():
+                return [await self._reader.readuntil(MCU_PROMPT) for _ in commands]
+
+            responses = await asyncio.wait_for(read_all(), timeout * len(commands))
+        return [parse_mcu_response(command, raw) for command, raw in zip(commands, responses)]
+
+    async def set_leds(self, status=True):
+        """Async equivalent of set_led_status()."""
+        if self.is_led == 'off' or self._writer is None:
+            return
+        await self.batch([led_command(i, status) for i in range(LED_COUNT)])
+
+    async def send(self, msg):
+        """Queue a frame for transmission; slcan writes to the serial port without blocking on ACK."""
+        self.bus.send(msg, timeout=0)
+
+    async def recv(self):
+        return await self._buffer.get_message()
+
+    def __aiter__(self):
+        return self._buffer.__aiter__()
+
+    async def close(self):
+        if self.notifier:
+            self.notifier.stop()
+        if self._writer is not None:
+            try:
+                await self.set_leds(False)
+            finally:
+                self._writer.close()
+        if self.bus:
+            self.bus.shutdown()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class _BlockingShell:
+    """McuShell.batch() over an AsyncK800Session, for configure_can() on an executor thread."""
+
+    def __init__(self, session, loop):
+        self.session = session
+        self.loop    = loop
+
+    def batch(self, commands, timeout=MCU_TIMEOUT):
+        return asyncio.run_coroutine_threadsafe(self.session.batch(commands, timeout), self.loop).result()
+
+
+'''---------------- k800d Daemon ----------------'''
+# Unix socket of the k800d daemon (-m daemon) and its clients (-i k800d, K800Client): one fixed
+# path, the same with and without sudo; a daemon not run as root needs its own --socket
+DAEMON_SOCKET  = '/run/k800d.sock'
+DAEMON_GROUP   = 'dialout'  # group allowed to connect (socket mode 0660), None keeps the daemon's group
+DAEMON_MODE    = 0o660
+DAEMON_MAGIC   = b'K8D\x00'
+DAEMON_VERSION = 1
+DAEMON_QUEUE   = 256    # frame chunks buffered per client before frames are dropped for it
+DAEMON_READ    = 65536  # bytes read from a socket at once
+DAEMON_TIMEOUT = 1.0    # seconds a client waits for the daemon to connect and greet it
+
+# Every message: kind, payload size, payload
+DAEMON_HEADER = struct.Struct('<BH')
+MSG_HELLO  = 1  # daemon -> client on connect, DAEMON_HELLO
+MSG_FRAME  = 2  # both ways, one FRAME_RECORD
+MSG_FILTER = 3  # client -> daemon, FILTER_ENTRY per filter, none to receive everything
+
+DAEMON_HELLO = struct.Struct('<4sHH')  # magic, protocol version, bit rate in kbps
+FILTER_ENTRY = struct.Struct('<IIB')   # can_id, can_mask, frame type (FILTER_TYPES index)
+FILTER_TYPES = [None, False, True]     # 'extended' filter key: any, standard only, extended only
+
+# Header and FRAME_RECORD packed in one call
+DAEMON_FRAME = struct.Struct(DAEMON_HEADER.format + FRAME_RECORD.format[1:])
+
+
+def pack_frame(msg):
+    """MSG_FRAME message carrying a can.Message."""
+    return DAEMON_FRAME.pack(MSG_FRAME, FRAME_RECORD.size, msg.timestamp, msg.arbitration_id, frame_flags(msg),
+                             msg.dlc, bytes(msg.data[:8]))
+
+
+def unpack_frame(payload):
+    """can.Message from a MSG_FRAME payload, ValueError unless it holds a valid CAN frame."""
+    if len(payload) != FRAME_RECORD.size:
+        raise ValueError(f"frame of {len(payload)} bytes, expected {FRAME_RECORD.size}")
+    msg = record_to_message(FRAME_RECORD.unpack(payload))
+    if msg.dlc > 8 or msg.arbitration_id > (0x1FFFFFFF if msg.is_extended_id else 0x7FF):
+        raise ValueError(f"invalid frame id {msg.arbitration_id:#x} dlc {msg.dlc}")
+    return msg
+
+
+def pack_filters(can_filters):
+    """MSG_FILTER payload from python-can `can_filters`."""
+    return b''.join(FILTER_ENTRY.pack(f['can_id'], f['can_mask'], FILTER_TYPES.index(f.get('extended')))
+                    for f in can_filters or ())
+
+
+def unpack_filters(payload):
+    """python-can `can_filters` from a MSG_FILTER payload, ValueError if it is malformed."""
+    if len(payload) % FILTER_ENTRY.size:
+        raise ValueError(f"filter payload of {len(payload)} bytes, not a multiple of {FILTER_ENTRY.size}")
+    can_filters = []
+    for can_id, can_mask, kind in FILTER_ENTRY.iter_unpack(payload):
+        if kind >= len(FILTER_TYPES):
+            raise ValueError(f"unknown filter type {kind}")
+        can_filter = {'can_id': can_id, 'can_mask': can_mask}
+        if FILTER_TYPES[kind] is not None:
+            can_filter['extended'] = FILTER_TYPES[kind]
+        can_filters.append(can_filter)
+    return can_filters
+
+
+class DaemonStream:
+    """k800d message framing over a connected Unix socket."""
+
+    def __init__(self, sock):
+        self.sock    = sock
+        self._buffer = bytearray()
+
+    def read(self, timeout=None):
+        """
+        Messages (kind, payload) completed by the next read, [] if nothing arrives within
+        `timeout` s. Raises ConnectionError once the peer has closed the socket.
+        """
+        if timeout is not None and not select.select([self.sock], [], [], max(timeout, 0))[0]:
+            return []
+        data = self.sock.recv(DAEMON_READ)
+        if not data:
+            raise ConnectionError("k800d connection closed")
+        buffer = self._buffer
+        buffer += data
+        messages, offset = [], 0
+        while len(buffer) - offset >= DAEMON_HEADER.size:
+            kind, size = DAEMON_HEADER.unpack_from(buffer, offset)
+            end = offset + DAEMON_HEADER.size + size
+            if end > len(buffer):
+                break
+            messages.append((kind, bytes(buffer[offset + DAEMON_HEADER.size:end])))
+            offset = end
+        del buffer[:offset]
+        return messages
+
+    def write(self, kind, payload=b''):
+        self.sock.sendall(DAEMON_HEADER.pack(kind, len(payload)) + payload)
+
+    def close(self):
+        self.sock.close()
+
+
+class DaemonConnection:
+    """
+    One k800d client as seen by the daemon: its filters and a bounded queue of outgoing
+    frame chunks, written by its own thread so a slow client never stalls the others.
+    """
+
+    def __init__(self, sock, queue_size=DAEMON_QUEUE):
+        self.stream    = DaemonStream(sock)
+        self.matches   = None
+        self.queue     = queue.Queue(queue_size)
+        self.forwarded = 0
+        self.dropped   = 0
+        self.sent      = 0
+
+    def put(self, chunk, frames):
+        try:
+            self.queue.put_nowait(chunk)
+            self.forwarded += frames
+        except queue.Full:
+            self.dropped += frames
+
+    def write_loop(self):
+        try:
+            while True:
+                chunk = self.queue.get()
+                if chunk is None:
+                    break
+                self.stream.sock.sendall(chunk)
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.stream.close()
+
+
+class K800Daemon:
+    """
+    k800d: shares an open K800 bus with local clients over a Unix domain socket, so
+    short-lived tools connect to an already configured unit instead of reopening ports
+    and reconfiguring the MCU.
+
+    The daemon is a receive consumer: every batch handed to it is forwarded to each client
+    whose filters (python-can `can_filters`, set per client) accept the frame. Frames sent
+    by a client go out on the bus and are forwarded to the other clients, as the other
+    nodes on the bus would see them.
+
+    The socket is created with mode DAEMON_MODE and handed to `group`, so its members
+    connect without sudo. An existing `path` is only replaced when it is a stale socket of
+    the same user; anything else raises OSError. Example:
+
+        receiver = Receiver(device.bus).start()
+        daemon   = K800Daemon(device.bus, bit_rate=500).start()
+        receiver.drain([daemon])
+    """
+
+    def __init__(self, bus, path=DAEMON_SOCKET, bit_rate=DEFAULT_BITRATE, on_sent=None, poll=0.1,
+                 group=DAEMON_GROUP):
+        self.bus      = bus
+        self.path     = path
+        self.group    = group
+        self.bit_rate = bit_rate
+        self.on_sent  = on_sent
+        self.poll     = poll
+        self.clients  = []
+        self.served   = 0
+        self.forwarded = 0
+        self.dropped  = 0
+        self.sent     = 0
+        self.queued   = 0
+        self.send_errors = 0
+        self.server   = None
+        self._lock    = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target=self._accept, name='k800d-accept', daemon=True)
+
+    def start(self):
+        import grp, stat
+        gid = -1
+        if self.group is not None:
+            try:
+                gid = grp.getgrnam(self.group).gr_gid
+            except KeyError:
+                raise OSError(f"k800d socket group {self.group} does not exist") from None
+        try:
+            st = os.lstat(self.path)
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.geteuid():
+                raise OSError(f"{self.path} exists and is not a k800d socket of this user; remove it or use another --socket")
+            # a socket left behind by a daemon that did not exit cleanly is removed
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)
+            else:
+                raise OSError(f"k800d is already running on {self.path}")
+            finally:
+                probe.close()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.server.bind(self.path)
+            # permissions are set before listen(), so no client connects with the umask's
+            os.chown(self.path, -1, gid)
+            os.chmod(self.path, DAEMON_MODE)
+            self.server.listen()
+        except OSError:
+            self.server.close()
+            self.server = None
+            raise
+        self._thread.start()
+        return self
+
+    def _accept(self):
+        hello = DAEMON_HELLO.pack(DAEMON_MAGIC, DAEMON_VERSION, self.bit_rate)
+        while not self._stop.is_set():
+            if not select.select([self.server], [], [], self.poll)[0]:
+                continue
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                continue
+            client = DaemonConnection(sock)
+            try:
+                client.stream.write(MSG_HELLO, hello)
+            except OSError:
+                client.close()
+                continue
+            threading.Thread(target=client.write_loop, name='k800d-write', daemon=True).start()
+            threading.Thread(target=self._serve, args=(client,), name='k800d-client', daemon=True).start()
+
+    def _serve(self, client):
+        with self._lock:
+            # replaced rather than mutated so __call__ iterates without locking
+            self.clients = self.clients + [client]
+            self.served += 1
+        try:
+            while not self._stop.is_set():
+                for kind, payload in client.stream.read(self.poll):
+                    if kind == MSG_FRAME:
+                        self._send(client, payload)
+                    elif kind == MSG_FILTER:
+                        client.matches = filter_matcher(unpack_filters(payload))
+        except OSError:
+            pass
+        except ValueError as e:
+            # a client speaking the protocol wrongly is disconnected, the others are unaffected
+            print(f"k800d: dropping client: {e}")
+        finally:
+            with self._lock:
+                self.clients = [c for c in self.clients if c is not client]
+                self.forwarded += client.forwarded
+                self.dropped   += client.dropped
+            client.close()
+
+    def _send(self, client, payload):
+        msg = unpack_frame(payload)
+        msg.timestamp, msg.is_rx = time.time(), False
+        try:
+            with self._send_lock:
+                self.bus.send(msg)
+        except FrameQueued:
+            self.queued += 1
+            return
+        except can.CanError as e:
+            self.send_errors += 1
+            print(f"k800d: send failed: {e}")
+            return
+        client.sent += 1
+        self.sent   += 1
+        if self.on_sent:
+            self.on_sent(msg)
+        self._forward([msg], source=client)
+
+    def _forward(self, batch, source=None):
+        clients = self.clients
+        if not clients or (len(clients) == 1 and clients[0] is source):
+            return
+        frames = [pack_frame(msg) for msg in batch]
+        for client in clients:
+            if client is source:
+                continue
+            if client.matches is None:
+                client.put(b''.join(frames), len(frames))
+            else:
+                selected = [frame for frame, msg in zip(frames, batch) if client.matches(msg)]
+                if selected:
+                    client.put(b''.join(selected), len(selected))
+
+    def __call__(self, batch):
+        self._forward(batch)
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.server:
+            self.server.close()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        for client in self.clients:
+            client.close()
+
+    def report(self):
+        forwarded = self.forwarded + sum(c.forwarded for c in self.clients)
+        dropped   = self.dropped + sum(c.dropped for c in self.clients)
+        queued = f", {self.queued} queued while reconnecting" if self.queued else ''
+        return (f"k800d served {self.served} client(s): forwarded {forwarded} frames, {dropped} dropped "
+                f"for slow clients, sent {self.sent} frames for clients ({self.send_errors} failed{queued})")
+
+
+class K800Client:
+    """
+    Client of a k800d daemon: sends on the daemon's bus and receives the frames passing
+    its filters, without opening or configuring the K800. Example:
+
+        with K800Client() as client:
+            client.set_filters([{'can_id': 0x123, 'can_mask': 0x7FF}])
+            client.send(can.Message(arbitration_id=0x123, data=b'K800'))
+            msg = client.recv(timeout=1.0)
+    """
+
+    def __init__(self, path=DAEMON_SOCKET, timeout=DAEMON_TIMEOUT):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.settimeout(None)
+        except OSError:
+            sock.close()
+            raise
+        self.path     = path
+        self.stream   = DaemonStream(sock)
+        self._pending = deque()
+        hello = [payload for kind, payload in self.stream.read(timeout) if kind == MSG_HELLO]
+        if not hello or DAEMON_HELLO.unpack(hello[0])[:2] != (DAEMON_MAGIC, DAEMON_VERSION):
+            self.close()
+            raise OSError(f"{path} is not a k800d version {DAEMON_VERSION} socket")
+        self.bit_rate = DAEMON_HELLO.unpack(hello[0])[2]
+
+    def set_filters(self, can_filters=None):
+        """Receive only frames accepted by python-can `can_filters`, everything if None."""
+        self.stream.write(MSG_FILTER, pack_filters(can_filters))
+
+    def send(self, msg):
+        self.stream.sock.sendall(pack_frame(msg))
+
+    def recv(self, timeout=None):
+        """Next received frame as a can.Message, None if none arrives within `timeout` s."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self._pending:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining < 0:
+                return None
+            self._pending.extend(payload for kind, payload in self.stream.read(remaining) if kind == MSG_FRAME)
+        return record_to_message(FRAME_RECORD.unpack(self._pending.popleft()))
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@functools.lru_cache(maxsize=None)
+def _daemon_bus_class():
+    # defined on first use like SyntheticBus
+    class DaemonBus(can.BusABC):
+        """python-can bus on a k800d socket (-i k800d): filters are applied by the daemon."""
+
+        def __init__(self, channel=DAEMON_SOCKET, can_filters=None, **kwargs):
+            try:
+                self.client = K800Client(channel)
+            except OSError as e:
+                raise can.CanInitializationError(f"cannot connect to k800d on {channel}: {e}") from e
+            self.bit_rate     = self.client.bit_rate
+            self.channel_info = f'k800d {channel} ({self.bit_rate} kbps)'
+            super().__init__(channel=channel, can_filters=can_filters, **kwargs)
+
+        def _apply_filters(self, filters):
+            self.client.set_filters(filters)
+
+        def _recv_internal(self, timeout):
+            # frames queued before the daemon applied new filters are filtered again here
+            return self.client.recv(timeout), False
+
+        def send(self, msg, timeout=None):
+            self.client.send(msg)
+
+        def shutdown(self):
+            super().shutdown()
+            self.client.close()
+
+    return DaemonBus
+
+
+def daemon_bus(**kwargs):
+    """DaemonBus instance, see its docstring for the arguments."""
+    return _daemon_bus_class()(**kwargs)
+
+
+'''---------------- Shared Memory Ring ----------------'''
+SHM_NAME     = 'k800'  # shared memory segment (/dev/shm/k800 on Linux) of --shm
+SHM_CAPACITY = 65536   # frames held by the ring, about 3 s at the 1000 kbps maximum frame rate
+SHM_POLL     = 0.0005  # seconds a reader sleeps when it has caught up with the producer
+SHM_MAGIC    = b'K800SHM\x00'
+SHM_VERSION  = 1
+
+# Ring header: magic, format version, record size, capacity, guard, producer pid
+SHM_HEADER = struct.Struct('<8sIIQII')
+SHM_COUNT_OFFSET  = 32            # frames written so far (native uint64), published after the records
+SHM_CLOSED_OFFSET = 40            # one byte, set when the producer closes the ring
+SHM_DATA_OFFSET   = 64            # FRAME_RECORD slots
+
+
+def _attach_shared_memory(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    segment = shared_memory.SharedMemory(name)
+    if os.name != 'posix':
+        # no resource tracker: Windows frees a segment with its last handle
+        return segment
+    # before Python 3.13 every attaching process registers the segment and unlinks it on exit;
+    # the producer's own registration (same process) must stay for its unlink()
+    if segment.size < SHM_HEADER.size or SHM_HEADER.unpack_from(segment.buf, 0)[5] != os.getpid():
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def _count_view(buf):
+    # one aligned 8-byte store or load per access: struct's '<Q' is copied byte by byte and could be read torn
+    return buf[SHM_COUNT_OFFSET:SHM_COUNT_OFFSET + 8].cast('Q')
+
+
+def _process_alive(pid):
+    if os.name != 'posix':
+        # os.kill(pid, 0) sends CTRL_C_EVENT on Windows; a segment that still exists there
+        # is held open by a running process
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class SharedFrameRing:
+    """
+    Single producer side of a ring of FRAME_RECORD slots in shared memory, so any number of
+    local processes can follow the frames of the one process owning the VCAN port (--shm).
+
+    The producer never waits for readers: each reader keeps its own cursor and detects
+    being lapped itself (see SharedFrameReader). Frames are written in chunks of at most
+    `guard` records with the frame count published after each chunk, the slots a reader
+    may still use are the `capacity - guard` before the published count. Like the frame
+    log, the ring is a receive consumer:
+
+        ring = SharedFrameRing()
+        receiver.drain([ring])
+    """
+
+    def __init__(self, name=SHM_NAME, capacity=SHM_CAPACITY, guard=RECV_BATCH):
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        if capacity <= 2 * guard:
+            raise ValueError(f"capacity must exceed {2 * guard} frames")
+        size = SHM_DATA_OFFSET + capacity * FRAME_RECORD.size
+        try:
+            self.segment = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # a ring left behind by a producer that did not exit cleanly is replaced
+            stale = _attach_shared_memory(name)
+            pid = SHM_HEADER.unpack_from(stale.buf, 0)[5] if stale.size >= SHM_HEADER.size else 0
+            stale.close()
+            if pid and pid != os.getpid() and _process_alive(pid):
+                raise FileExistsError(f"shared memory ring {name} is published by process {pid}")
+            # attached tracked, as unlink() also ends the resource tracker's registration
+            stale = shared_memory.SharedMemory(name)
+            stale.unlink()
+            stale.close()
+            self.segment = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name     = name
+        self.capacity = capacity
+        self.guard    = guard
+        self.count    = 0
+        self._buf     = self.segment.buf
+        self._count   = _count_view(self._buf)
+        SHM_HEADER.pack_into(self._buf, 0, SHM_MAGIC, SHM_VERSION, FRAME_RECORD.size, capacity, guard, os.getpid())
+        self._count[0] = 0
+        self._buf[SHM_CLOSED_OFFSET] = 0
+
+    def write(self, batch, tx=False):
+        buf, mask, size = self._buf, self.capacity - 1, FRAME_RECORD.size
+        pack_into = FRAME_RECORD.pack_into
+        count = self.count
+        for start in range(0, len(batch), self.guard):
+            for msg in batch[start:start + self.guard]:
+                dlc = min(len(msg.data), 8) if msg.data else (msg.dlc if msg.is_remote_frame else 0)
+                pack_into(buf, SHM_DATA_OFFSET + (count & mask) * size, msg.timestamp, msg.arbitration_id,
+                          frame_flags(msg, tx), dlc, bytes(msg.data[:8]))
+                count += 1
+            self._count[0] = count
+        self.count = count
+
+    def __call__(self, batch):
+        self.write(batch)
+
+    def close(self):
+        """Tell readers the stream has ended and remove the segment; attached readers keep their mapping."""
+        if self.segment is None:
+            return
+        self._buf[SHM_CLOSED_OFFSET] = 1
+        self._count.release()
+        self._buf = None
+        self.segment.close()
+        self.segment.unlink()
+        self.segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedFrameReader:
+    """
+    Reader of a SharedFrameRing in another local process, with its own cursor.
+
+    read_view() hands out the next records as a memoryview of the shared memory itself
+    (np.frombuffer(view, capture_dtype()) gives columns without copying); confirm()
+    then tells whether the producer overwrote them meanwhile. A reader that falls more
+    than the ring behind skips ahead and counts the skipped frames in `lost`. Example:
+
+        with SharedFrameReader() as reader:
+            for msg in reader:
+                print(msg)
+    """
+
+    def __init__(self, name=SHM_NAME, from_start=False, poll=SHM_POLL):
+        self.segment = _attach_shared_memory(name)
+        self._buf = self.segment.buf
+        self._count = _count_view(self._buf)
+        magic, version, size, self.capacity, self.guard, self.pid = SHM_HEADER.unpack_from(self._buf, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION or size != FRAME_RECORD.size:
+            self.close()
+            raise ValueError(f"{name} is not a version {SHM_VERSION} K800 frame ring")
+        self.name    = name
+        self.poll    = poll
+        self.window  = self.capacity - self.guard
+        published    = self.published
+        self.cursor  = max(0, published - self.window) if from_start else published
+        self.read    = 0
+        self.lost    = 0
+        self._start  = self._size = 0
+
+    @property
+    def published(self):
+        return self._count[0]
+
+    @property
+    def closed(self):
+        return bool(self._buf[SHM_CLOSED_OFFSET])
+
+    def read_view(self, max_records=RECV_BATCH):
+        """Zero-copy view of up to `max_records` next records, empty when caught up; check with confirm()."""
+        published = self.published
+        behind = published - self.cursor
+        if behind > self.window:
+            # lapped: resume half a ring behind the producer so it does not lap us again at once
+            skip = behind - self.window // 2
+            self.cursor += skip
+            self.lost   += skip
+        index = self.cursor & (self.capacity - 1)
+        size  = min(max_records, published - self.cursor, self.capacity - index)
+        self._start, self._size = self.cursor, size
+        self.cursor += size
+        offset = SHM_DATA_OFFSET + index * FRAME_RECORD.size
+        return self._buf[offset:offset + size * FRAME_RECORD.size]
+
+    def confirm(self):
+        """True if the records of the last read_view() were intact until now, else they count as lost."""
+        if self.published - self._start <= self.window:
+            self.read += self._size
+            return True
+        self.lost += self._size
+        return False
+
+    def read_records(self, max_records=RECV_BATCH):
+        """Next FRAME_RECORD tuples unpacked straight from shared memory, [] when caught up."""
+        while True:
+            view = self.read_view(max_records)
+            records = list(FRAME_RECORD.iter_unpack(view))
+            view.release()
+            if self.confirm():
+                return records
+
+    def wait(self, timeout=None):
+        """Block until frames are available (True), the producer closed the ring or `timeout` s passed."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.published == self.cursor:
+            if self.closed or (deadline is not None and time.perf_counter() >= deadline):
+                return False
+            time.sleep(self.poll)
+        return True
+
+    def __iter__(self):
+        """can.Message per frame until the producer closes the ring."""
+        while self.wait():
+            for record in self.read_records():
+                yield record_to_message(record)
+
+    def close(self):
+        self._count.release()
+        self._buf = None
+        self.segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _shm_reader(name):
+    """benchmark_shm reader process: prints frames read, lost and the publish to read latency as JSON."""
+    histogram = LatencyHistogram()
+    with SharedFrameReader(name) as reader:
+        print('attached', flush=True)
+        while not reader.closed:
+            if reader.wait(timeout=0.1):
+                now = time.time()
+                for record in reader.read_records():
+                    histogram.record(now - record[0])
+        print(json.dumps({'read': reader.read, 'lost': reader.lost,
+                          'latency_p50_us': histogram.percentile(50), 'latency_p99_us': histogram.percentile(99),
+                          'latency_max_us': histogram.max}))
+
+
+def benchmark_shm(duration=2.0, readers=3, bit_rate=1000, batch_interval=0.001):
+    """
+    Shared memory ring at the maximum frame rate of `bit_rate` (back-to-back standard
+    frames without data) with `readers` independent reader processes, such as a logger,
+    a dashboard and a controller, plus the unpaced write rate.
+    """
+    import subprocess
+    name = f'{SHM_NAME}-benchmark-{os.getpid()}'
+    frames = [can.Message(timestamp=time.time(), arbitration_id=0x100 + i % 64, is_extended_id=False)
+              for i in range(1024)]
+    max_fps = bit_rate * 1000 / max(frame_bit_length(0) + stuff_bit_count(msg) for msg in frames)
+    results = {'readers': readers, 'max_fps': max_fps}
+
+    with SharedFrameRing(name) as ring:
+        start = time.perf_counter()
+        for i in range(0, len(frames) * 100, RECV_BATCH):
+            ring.write(frames[i % len(frames):i % len(frames) + RECV_BATCH])
+        results['write_fps'] = ring.count / (time.perf_counter() - start)
+
+        processes = [subprocess.Popen([sys.executable, '-c', f'import k800_can; '
+                                       f'k800_can._shm_reader({name!r})'],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stdout=subprocess.PIPE, text=True)
+                     for _ in range(readers)]
+        for process in processes:
+            process.stdout.readline()
+        # frames become due at the wire rate and are written in receive-sized batches
+        written, cycle, start = 0, itertools.cycle(frames), time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            due = int((now - start) * max_fps) - written
+            if due:
+                batch = list(itertools.islice(cycle, due))
+                stamp = time.time()
+                for msg in batch:
+                    msg.timestamp = stamp
+                ring.write(batch)
+                written += due
+            sleep_until(now + batch_interval)
+        results['written'] = written
+        results['written_fps'] = written / (time.perf_counter() - start)
+    # closing the ring ends the readers
+    results['reader_results'] = [json.loads(process.communicate()[0]) for process in processes]
+    return results
+
+
+# Offline benchmarks selectable with --benchmark
+BENCHMARKS = {
+    'filter': benchmark_filter,
+    'log':    benchmark_log,
+    'record': benchmark_record,
+    'shm':    benchmark_shm,
+}
+
+
+def parse_arguments():
+    """Receive and parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="K800 CAN Bus Utility")
+    parser.add_argument('-m', '--mode', choices=['s', 'r', 'p', 'monitor', 'latency', 'daemon'],
+                        help="send (s), receive (r), play back (p), monitor, latency or daemon: send generated data, "
+                        "continually receive, replay a recorded capture (--replay), show live per-ID statistics, "
+                        "measure probe round trips through a loopback peer (second unit with -d, or a node "
+                        f"echoing ID {LATENCY_PROBE_ID:#x} on {LATENCY_PROBE_ID + 1:#x}), or run k800d, keeping the "
+                        "bus open and sharing it with local clients (-i k800d) on --socket")
+    parser.add_argument('-b', '--bitrate', choices=valid_bit_rates, 
+                        help=f"CAN bus baudrate in kbps (ranges allowed by slcan: \
+                        {valid_bit_rates}", type=int, default=DEFAULT_BITRATE)
+    parser.add_argument('-l', '--leds', choices=['off', 'on'], help="Incorporate LED check functionality in program", default=LED_CHECK)
+    parser.add_argument('--led-pattern', choices=list(LED_PATTERNS), default='on',
+                        help="LED pattern played for the session when the LED check is on")
+    parser.add_argument('-f', '--filter', action='append', type=parse_filter, metavar='ID:MASK',
+                        help="receive only frames with (id & mask) == (ID & mask), hex, optionally :s or :x for "
+                        "standard/extended frames only; repeat for several filters")
+    parser.add_argument('--hw-filter', action='store_true',
+                        help="also program the filters into the slcan acceptance code/mask (firmware support required)")
+    parser.add_argument('-d', '--device', action='append', metavar='UNIT',
+                        help="K800 USB serial number or location to use; repeat to drive several units at once")
+    parser.add_argument('--list-devices', action='store_true', help="list attached K800 units and exit")
+    parser.add_argument('--mgmt-port', metavar='PORT',
+                        help="management shell port, skipping discovery (e.g. a k800_emulator.py pty)")
+    parser.add_argument('--vcan-port', metavar='PORT', help="slcan VCAN port, used together with --mgmt-port")
+    parser.add_argument('--open-delay', type=float, metavar='SECONDS',
+                        help="settle time after opening the VCAN port instead of python-can's 2 s, "
+                        "e.g. 0 with k800_emulator.py")
+    parser.add_argument('--force-config', action='store_true',
+                        help="send the CAN mode and baudrate to the MCU even when it reports them already set")
+    parser.add_argument('--reconnect', action='store_true',
+                        help="reopen and reconfigure the K800 after a USB disconnect or MCU reset, "
+                        f"queueing up to {TX_BACKLOG} frames to send meanwhile")
+    parser.add_argument('--no-port-cache', action='store_true',
+                        help=f"always rescan serial ports instead of reusing {PORT_CACHE}")
+    parser.add_argument('-i', '--interface', choices=['slcan', 'socketcan', 'virtual', 'synthetic', 'k800d'],
+                        default=DEFAULT_INTERFACE,
+                        help="slcan on the K800 VCAN port, the VCAN port attached to the Linux kernel slcan driver "
+                        "(socketcan, falls back to slcan), python-can virtual bus, a synthetic frame source "
+                        "(no hardware required for virtual/synthetic), or the bus of a running k800d (-m daemon)")
+    parser.add_argument('--socket', default=DAEMON_SOCKET, metavar='PATH',
+                        help="Unix socket k800d listens on (-m daemon) or -i k800d connects to "
+                        f"(default {DAEMON_SOCKET}, writable by root only)")
+    parser.add_argument('--socket-group', default=DAEMON_GROUP, metavar='GROUP',
+                        help=f"group whose members may connect to the k800d socket (default {DAEMON_GROUP})")
+    rate = parser.add_mutually_exclusive_group()
+    rate.add_argument('--fps', type=float, help=f"send mode target frames per second (default {DEFAULT_FPS}); "
+                      "with -i synthetic, the generated frame rate (default unlimited)")
+    rate.add_argument('--bus-load', type=float, help="send mode target bus load in percent of the bitrate")
+    parser.add_argument('--burst', type=int, default=1, help="send mode frames sent back-to-back per token bucket batch")
+    parser.add_argument('-n', '--count', type=int, help="number of frames to send or receive before exiting")
+    parser.add_argument('--ring-size', type=int, default=DEFAULT_RING_SIZE,
+                        help="receive mode ring buffer capacity in frames")
+    parser.add_argument('-q', '--quiet', action='store_true', help="do not print every frame")
+    parser.add_argument('--log', metavar='DIR', help="write sent and received frames to a binary frame log in DIR")
+    parser.add_argument('--log-segment-mb', type=float, default=DEFAULT_SEGMENT_SIZE / 2**20,
+                        help="frame log segment size in MiB before rotating")
+    parser.add_argument('--log-segment-s', type=float, help="rotate frame log segments after this many seconds")
+    parser.add_argument('--dbc', metavar='FILE',
+                        help="decode received frames with a DBC/KCD database (requires cantools)")
+    parser.add_argument('--capture', metavar='FILE',
+                        help="hold sent and received frames in a columnar store and save it on exit, "
+                        f"format by suffix {CAPTURE_FORMATS}")
+    parser.add_argument('-r', '--record', metavar='FILE',
+                        help=f"record sent and received frames to a capture file, format by suffix {RECORD_FORMATS}")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="playback mode capture: frame log (.k8l or directory) or candump/asc/blf/... file")
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed factor, 0 for max rate")
+    parser.add_argument('--loop', type=int, default=1, help="playback repetitions, 0 to loop forever")
+    parser.add_argument('--ids', type=lambda value: [int(i, 16) for i in value.split(',')],
+                        help="comma-separated hex arbitration IDs to play back, e.g. 123,1a0")
+    parser.add_argument('--shm', nargs='?', const=SHM_NAME, metavar='NAME',
+                        help=f"publish received frames to the shared memory ring NAME (default {SHM_NAME}) "
+                        "that other local processes follow with SharedFrameReader")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve bus load, frame rate and error counters in Prometheus format on 127.0.0.1:PORT/metrics")
+    parser.add_argument('--summary', type=float, metavar='SECONDS',
+                        help="print a bus load and error summary line every SECONDS")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print the time spent importing, discovering, configuring and until the first frame")
+    parser.add_argument('--benchmark', choices=list(BENCHMARKS), help="run an offline benchmark and exit")
+    return parser.parse_args()
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    '''main, implementation of session logic.'''
+    if USE_ARGPARSE:
+        args      = parse_arguments()
+        mode      = args.mode
+        bit_rate  = args.bitrate
+        is_led    = args.leds
+        interface = args.interface
+        fps       = args.fps
+        bus_load  = args.bus_load
+        burst     = args.burst
+        count     = args.count
+        quiet     = args.quiet
+        ring_size = args.ring_size
+        led_pattern = args.led_pattern
+        port_cache  = not args.no_port_cache
+        force_config = args.force_config
+        open_delay   = args.open_delay
+        reconnect    = args.reconnect
+        units       = args.device
+        log_dir     = args.log
+        record_file = args.record
+        replay_file = args.replay
+        can_filters = args.filter
+        hw_filter   = args.hw_filter
+        dbc_file    = args.dbc
+        capture_file = args.capture
+        metrics_port = args.metrics_port
+        summary      = args.summary
+        mgmt_port    = args.mgmt_port
+        vcan_port    = args.vcan_port
+        socket_path  = args.socket
+        socket_group = args.socket_group
+        shm_name     = args.shm
+        profile_startup = args.profile_startup
+    else:
+        mode      = DEFAULT_MODE
+        bit_rate  = DEFAULT_BITRATE
+        is_led    = LED_CHECK
+        interface = DEFAULT_INTERFACE
+        fps       = None
+        bus_load  = None
+        burst     = 1
+        count     = None
+        quiet     = False
+        ring_size = DEFAULT_RING_SIZE
+        led_pattern = 'on'
+        port_cache  = True
+        force_config = False
+        open_delay   = SLCAN_OPEN_DELAY
+        reconnect    = False
+        units       = None
+        log_dir     = None
+        record_file = None
+        replay_file = None
+        can_filters = None
+        hw_filter   = False
+        dbc_file    = None
+        capture_file = None
+        metrics_port = None
+        summary      = None
+        mgmt_port    = None
+        vcan_port    = None
+        socket_path  = DAEMON_SOCKET
+        socket_group = DAEMON_GROUP
+        shm_name     = None
+        profile_startup = False
+
+    STARTUP.mark('startup and arguments')
+
+    # kill and systemctl stop end the session like Ctrl+C, so ports, LEDs, sockets and
+    # shared memory are released by the cleanup below
+    signal.signal(signal.SIGTERM, _terminate)
+
+    if USE_ARGPARSE and args.benchmark:
+        results = BENCHMARKS[args.benchmark]()
+        print(json.dumps(results, indent=2))
+        return
+
+    if USE_ARGPARSE and args.list_devices:
+        for device in DeviceRegistry(MCU_VID_PID).refresh():
+            print(f"{device.unit}\tlocation {device.location}\t"
+                  + ' '.join(f"{num}:{port}" for num, port in device.interfaces.items()))
+        return
+
+    if bit_rate not in valid_bit_rates:
+        print(f"Error: Invalid bit_rate. Please enter a value between 1 and 1000 kbps.")
+        sys.exit(1)
+
+    if mode == 'p' and not (replay_file and os.path.exists(replay_file)):
+        print("Error: playback mode needs an existing capture file, see --replay.")
+        sys.exit(1)
+
+    # synthetic source rate in receive mode is unlimited unless --fps is given
+    synthetic_fps = fps
+    if fps is None and bus_load is None:
+        fps = LATENCY_FPS if mode == 'latency' else DEFAULT_FPS
+
+    if mode == 'latency' and (interface == 'synthetic' or bus_load is not None):
+        print("Error: latency mode needs a real or virtual bus and a probe rate (--fps).")
+        sys.exit(1)
+
+    if mode == 'daemon' and (interface == 'k800d' or (units and len(units) > 1)):
+        print("Error: k800d serves one K800 (or virtual/synthetic bus); run one daemon per unit with its own --socket.")
+        sys.exit(1)
+
+    # every path from here needs python-can, and pyserial for a K800
+    if interface in ('virtual', 'synthetic', 'k800d'):
+        preload(can)
+    else:
+        preload(can, serial, system_ports)
+    STARTUP.mark('import python-can')
+
+    decoder = None
+    if dbc_file:
+        try:
+            decoder = SignalDecoder(load_database(dbc_file))
+        except Exception as e:
+            print(f"Error: cannot load database {dbc_file}: {e}")
+            sys.exit(1)
+        STARTUP.mark('load database')
+
+    # open capture outputs before touching hardware so a bad path fails fast
+    log = None
+    if log_dir:
+        log = FrameLogWriter(log_dir, segment_size=int(args.log_segment_mb * 2**20),
+                             segment_seconds=args.log_segment_s)
+
+    capture = None
+    if capture_file:
+        if os.path.splitext(capture_file)[1].lower() not in CAPTURE_FORMATS:
+            print(f"Error: unknown capture format '{capture_file}', use one of {CAPTURE_FORMATS}")
+            sys.exit(1)
+        if pyarrow is None and not capture_file.lower().endswith('.npy'):
+            print("Error: saving .parquet/.arrow captures requires pyarrow: pip install pyarrow")
+            sys.exit(1)
+        try:
+            capture = CaptureStore()
+        except ImportError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    ring = None
+    if shm_name:
+        try:
+            ring = SharedFrameRing(shm_name)
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot publish to shared memory ring {shm_name}: {e}")
+            sys.exit(1)
+
+    recorder = None
+    if record_file:
+        try:
+            recorder = RecordingWriter(record_file)
+        except Exception as e:
+            print(f"Error: cannot record to {record_file}: {e}")
+            sys.exit(1)
+
+    devices = []
+    if interface in ('virtual', 'synthetic', 'k800d'):
+        # No hardware: skip discovery and MCU configuration entirely
+        if interface == 'synthetic':
+            buses = [synthetic_bus(fps=synthetic_fps, can_filters=can_filters)]
+        elif interface == 'k800d':
+            # the daemon owns the configured K800, only its socket is opened here
+            try:
+                buses = [daemon_bus(channel=socket_path, can_filters=can_filters)]
+            except can.CanError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            bit_rate = buses[0].bit_rate
+        else:
+            buses = [open_bus(interface, channel='k800', bitrate=bit_rate*1000, receive_own_messages=False,
+                             can_filters=can_filters)]
+            if mode == 'latency':
+                # second node on the virtual channel acting as the loopback peer
+                buses.append(open_bus(interface, channel='k800', bitrate=bit_rate*1000))
+        STARTUP.mark('bus open')
+    else:
+        if mgmt_port or vcan_port:
+            # Ports given explicitly, such as those of the MCU emulator
+            devices = [K800Device(None, {MGMT_INTERFACE: mgmt_port, VCAN_INTERFACE: vcan_port})]
+        elif units:
+            # Every selected unit, by USB serial number or location
+            registry = DeviceRegistry(MCU_VID_PID)
+            registry.refresh()
+            try:
+                devices = registry.select(units)
+            except KeyError as e:
+                print(f"Error: {e.args[0]}. Use --list-devices to show attached units.")
+                sys.exit(1)
+        else:
+            # Get the Management port, main serial port at baud 9600
+            # (equivalent to Putty terminal), and the VCAN port in one scan
+            ports = discover_ports(MCU_VID_PID, use_cache=port_cache)
+            if ports.get(MGMT_INTERFACE) and ports.get(VCAN_INTERFACE):
+                devices = [K800Device(None, ports)]
+
+        if not devices:
+            print("Error: K800 MCU not found. Please check configurations and connections.")
+            sys.exit(1)
+        STARTUP.mark('discovery')
+
+        # Configure virtualized CAN port and init bus using slcan interface on the VCAN port
+        print("Configuring CAN port...")
+        open_kwargs = dict(bit_rate=bit_rate, interface=interface, is_led=is_led, led_pattern=led_pattern,
+                           can_filters=can_filters, hw_filter=hw_filter, force_config=force_config,
+                           open_delay=open_delay)
+        try:
+            for device in devices:
+                print(f'Management port: {device.mgmt_port}\nVCAN port: {device.vcan_port}')
+                print('*'*15)
+                device.open(**open_kwargs)
+        except (OSError, TimeoutError, McuError, can.CanError) as e:
+            print(f"Error: {e}")
+            for device in devices:
+                device.close(is_led)
+            for output in (log, recorder, ring):
+                if output:
+                    output.close()
+            sys.exit(1)
+        buses = [device.bus for device in devices]
+        if reconnect:
+            # explicitly given ports (such as the emulator's) are reopened as they are
+            buses = [SupervisedBus(device, open_kwargs, rediscover=not (mgmt_port or vcan_port))
+                     for device in devices]
+
+    # DEFAULT MESSAGE FORMAT: Pass custom data into the data field and use in loop for custom implementations  
+    # message = can.Message(arbitration_id=123, is_extended_id=True, data=[0x12, 0x22, 0x33]) 
+    print (
+        f"Starting CAN bus {({'s': 'transmission', 'p': 'playback', 'monitor': 'monitor', 'latency': 'latency measurement', 'daemon': 'sharing (k800d)'}).get(mode, 'reception')}...\n"
+        "Ctrl+C to exit"
+    )
+
+    # variables for example can bus generation
+    # can be removed/replaced with custom implementaiton
+    global number, is_increment
+    number = 0
+    is_increment = True
+
+    engines  = []
+    receiver = None
+    replays  = []
+    monitor  = None
+    probe    = None
+    daemon   = None
+    metrics  = None
+    if metrics_port is not None or summary:
+        # in send and playback modes nothing else reads the buses
+        metrics = BusMetrics(bit_rate, buses, exclusive=mode in ('s', 'p'))
+        try:
+            metrics.start(summary_interval=summary, port=metrics_port)
+        except OSError as e:
+            print(f"Could not serve metrics on port {metrics_port}: {e}")
+            metrics = None
+    first_frame = [profile_startup]
+    def on_first_frame(direction):
+        if first_frame[0]:
+            first_frame[0] = False
+            STARTUP.mark(f'first frame {direction}')
+    def on_sent(msg):
+        on_first_frame('sent')
+        if metrics:
+            metrics.on_sent(msg)
+        if log:
+            log.write(msg, tx=True)
+        if recorder:
+            recorder.write(msg)
+        if capture is not None:
+            capture.append(msg, tx=True)
+        if not quiet:
+            print(f"Sent: {msg}")
+    # sent frames only go through on_sent when something takes them
+    sent_hook = on_sent if log or recorder or capture is not None or metrics or profile_startup or not quiet else None
+    for bus in buses:
+        if isinstance(bus, SupervisedBus):
+            # queued frames reach the outputs when they are actually sent after reconnecting
+            bus.on_sent = sent_hook
+
+    try:
+        if mode == 's':
+            # pace generated frames at the requested frame rate or bus load, one sender per bus
+            engines = [TransmitEngine(bus, generate_frames(), fps=fps, bus_load=bus_load,
+                                      bitrate=bit_rate, burst=burst,
+                                      on_sent=sent_hook,
+                                      on_error=metrics.on_error if metrics else None)
+                       for bus in buses]
+            if len(engines) == 1:
+                engines[0].run(count=count)
+            else:
+                run_transmitters(engines, count=count)
+        elif mode == 'p':
+            # replay the capture with its original timing (scaled by --speed) on every bus
+            replays = [ReplayEngine(bus, replay_file, speed=args.speed, loops=args.loop, ids=args.ids,
+                                    on_sent=sent_hook,
+                                    on_error=metrics.on_error if metrics else None)
+                       for bus in buses]
+            if len(replays) == 1:
+                replays[0].run()
+            else:
+                run_transmitters(replays)
+        elif mode == 'latency':
+            # the first bus probes; a second unit (or virtual node) echoes, otherwise a node on the bus must
+            peer_bus = buses[1] if len(buses) > 1 else None
+            if peer_bus is None:
+                print(f"No local peer: expecting a node on the bus to echo {LATENCY_PROBE_ID:#x} on {LATENCY_PROBE_ID + 1:#x}")
+            probe = LatencyProbe(buses[0], peer_bus, fps=fps)
+            probe.run(count=count)
+        else:
+            # read each bus on its own thread, print received frames in batches here
+            channels = [device.name for device in devices] if len(devices) > 1 else None
+            receiver = Receiver(buses, capacity=ring_size, channels=channels).start()
+            monitor = BusMonitor() if mode == 'monitor' else None
+            consumers = [monitor] if monitor else [] if quiet else [decoder or print_frames]
+            if profile_startup:
+                consumers.insert(0, lambda batch: on_first_frame('received'))
+            if log:
+                consumers.append(log)
+            if recorder:
+                consumers.append(recorder)
+            if capture is not None:
+                consumers.append(capture)
+            if ring:
+                consumers.append(ring)
+            if metrics:
+                metrics.receiver = receiver
+                consumers.append(metrics)
+            if mode == 'daemon':
+                # forward received frames to the k800d clients, send theirs on the bus
+                daemon = K800Daemon(buses[0], socket_path, bit_rate,
+                                    on_sent=sent_hook, group=socket_group).start()
+                consumers.insert(0, daemon)
+                print(f"k800d listening on {socket_path}")
+            receiver.drain(consumers, count=count, on_tick=monitor.tick if monitor else None)
+    except KeyboardInterrupt:
+        print("\nOperation terminated by user.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        # a second SIGTERM does not cut the cleanup short
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        if profile_startup:
+            print(STARTUP.report())
+        for engine in engines:
+            print(engine.stats.report())
+        for replay in replays:
+            print(replay.stats.report())
+        if probe:
+            print(probe.report(bit_rate, on_wire=bool(devices)))
+        if daemon:
+            daemon.close()
+            print(daemon.report())
+        if receiver:
+            receiver.stop()
+            if monitor:
+                monitor.draw()
+            print(receiver.report())
+        if metrics:
+            metrics.stop()
+            metrics.sample()
+            print(metrics.summary())
+        if log:
+            log.close()
+            print(f"Logged {log.written} frames to {len(log.segments)} segment(s) in {log_dir}")
+        if recorder:
+            recorder.close()
+            print(recorder.report())
+        if ring:
+            ring.close()
+            print(f"Published {ring.count} frames to shared memory ring {shm_name}")
+        if capture is not None:
+            capture.save(capture_file)
+            print(f"Saved {len(capture)} frames ({capture.nbytes} bytes in memory) to {capture_file}")
+        if devices:
+            for bus in buses:
+                if isinstance(bus, SupervisedBus):
+                    bus.close()
+                    print(bus.report())
+            time.sleep(1)
+            for device in devices:
+                device.close(is_led)
+        else:
+            for bus in buses:
+                bus.shutdown()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -89,12 +89,12 @@ cntrl_all_leds() {
     fi 
     sleep 1s
     echo "Setting all LEDs to $state"
-    printf "\r\n" > $emcu_input
+    # write all LED commands in a single batch, the MCU shell queues them
+    local batch="\r\n"
     for i in {0..3}; do
-        printf "dio set LED0 $i $state\r\n" > $emcu_input
-        sleep 1
+        batch+="dio set LED0 $i $state\r\n"
     done
-    printf "\r\n"> $emcu_input
+    printf "$batch" > $emcu_input
 }
 
 # cleanup function to close buffer and shut can down
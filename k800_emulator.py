@@ -0,0 +1,483 @@
+"""
+Author: OnLogic
+For:    K800 Reference Documentation
+Title:  K800 MCU Emulator
+
+Description:
+    Stands in for a Karbon 800 CAN MCU so k800_can_utility.py can be run, benchmarked and
+    regression tested without hardware. Two pseudo-terminals replace the two USB CDC ports:
+
+    Management port: the uart:~$ shell with echo, implementing
+        set can-mode <interface> <mode>
+        set can-baudrate <interface> <kbps>
+        get can-mode <interface>, get can-baudrate <interface>
+        dio set LED0 <index> <true|false>
+        reset
+    VCAN port: the slcan (Lawicel) protocol, O/L/C, S0-S8, M/m acceptance filter, V/N/F and
+        t/T/r/R frames. Every frame occupies the bus for its exact length, stuff bits
+        included, at the configured bitrate; the bounded transmit queue backpressures the
+        host once the bus is saturated. Transmitted frames are optionally looped back, and
+        generated traffic can be mixed in.
+
+    The emulator prints both port paths; pass them to the utility with --mgmt-port and
+    --vcan-port (Linux and macOS, pseudo-terminals are not available on Windows), and
+    --open-delay 0 to skip the settle time meant for real hardware.
+    SIGUSR1 simulates a USB disconnect: both ports close and come back after --outage
+    seconds with the MCU at its power-on configuration, at new paths unless --link is used.
+    The pytest suite in tests/ drives the utility against it: python -m pytest tests
+
+Dependencies:
+    1. python-can (shared with k800_can_utility.py):
+        pip install python-can
+
+Usage:
+    python k800_emulator.py [-h] [-b BITRATE] [--loopback] [--generate FPS] [--ids IDS] [--dlc DLC]
+                            [--link DIR] [--outage SECONDS]
+
+Examples:
+    python k800_emulator.py --loopback
+    python k800_emulator.py --generate 1000 --ids 100,101,7ff -b 500
+    python k800_can_utility.py --mgmt-port /dev/pts/3 --vcan-port /dev/pts/4 --open-delay 0 -m r
+    python k800_emulator.py --loopback --link /tmp/k800 &   # then kill -USR1 $! to unplug it
+    python k800_can_utility.py --mgmt-port /tmp/k800/mgmt --vcan-port /tmp/k800/vcan --open-delay 0 -m s --reconnect
+"""
+import os
+import select
+import signal
+import pty
+import tty
+import sys
+import time
+import queue
+import argparse
+import threading
+import itertools
+
+import can
+
+from k800_can import (MCU_PROMPT, LED_COUNT, valid_bit_rates, STANDARD_ID_MASK,
+                      frame_bit_length, stuff_bit_count)
+
+
+'''---------------- Global Variables ----------------'''
+SHELL_PROMPT   = MCU_PROMPT + b' '
+SHELL_BANNER   = b'*** Booting K800 MCU emulator ***\r\n'
+RESET_DELAY    = 0.5    # seconds the emulated MCU is silent after 'reset'
+TX_QUEUE       = 64     # frames the MCU buffers before the host is backpressured
+POLL           = 0.1    # seconds between checks for close() in the port threads
+UNPLUG_OUTAGE  = 1.0    # seconds the ports stay away on SIGUSR1
+SLCAN_VERSION  = 'V1013'
+SLCAN_SERIAL   = 'NK800'
+SLCAN_OK       = b'\r'
+SLCAN_ERROR    = b'\a'
+
+# slcan 'Sn' commands and the bitrates they select, in kbps
+SLCAN_BITRATES = {'0': 10, '1': 20, '2': 50, '3': 100, '4': 125, '5': 250, '6': 500, '7': 750, '8': 1000}
+'''--------------------------------------------------'''
+
+
+def open_pty():
+    """Raw pseudo-terminal pair, returns the master fd, the slave fd and the slave path."""
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    return master, slave, os.ttyname(slave)
+
+
+class ManagementShell:
+    """
+    Emulated management shell: echoes input, answers the configuration commands the utility
+    sends and prints the prompt after every line. Configuration changes go to `state`.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.master, self._slave, self.port = open_pty()
+        self._stop   = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='k800-shell', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _write(self, data):
+        os.write(self.master, data)
+
+    def _run(self):
+        line = b''
+        previous = b''
+        while not self._stop.is_set():
+            try:
+                if not select.select([self.master], [], [], POLL)[0]:
+                    continue
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            for char in (data[i:i + 1] for i in range(len(data))):
+                if char == b'\n' and previous == b'\r':
+                    # \r\n ends a single line
+                    previous = char
+                    continue
+                previous = char
+                if char in (b'\r', b'\n'):
+                    output = self.execute(line.decode(errors='replace').strip())
+                    self._write(b'\r\n' + b''.join(text.encode() + b'\r\n' for text in output))
+                    if self.state.resetting():
+                        time.sleep(RESET_DELAY)
+                        self._write(SHELL_BANNER)
+                    self._write(SHELL_PROMPT)
+                    line = b''
+                elif char in (b'\x08', b'\x7f'):
+                    line = line[:-1]
+                else:
+                    line += char
+                    self._write(char)
+
+    def execute(self, command):
+        """Run one shell command, returning its output lines."""
+        words = command.split()
+        if not words:
+            return []
+        if words[0] == 'reset' and len(words) == 1:
+            self.state.reset()
+            return []
+        if words[:2] == ['set', 'can-mode']:
+            if len(words) != 4:
+                return ['set can-mode: wrong parameter count']
+            self.state.can_mode[words[2]] = words[3]
+            self.state.config_writes += 1
+            return []
+        if words[:2] == ['set', 'can-baudrate']:
+            if len(words) != 4:
+                return ['set can-baudrate: wrong parameter count']
+            if not words[3].isdigit() or int(words[3]) not in valid_bit_rates:
+                return [f'error: invalid value {words[3]}']
+            self.state.bit_rate = int(words[3])
+            self.state.config_writes += 1
+            return []
+        if words[:2] == ['get', 'can-mode']:
+            if len(words) != 3:
+                return ['get can-mode: wrong parameter count']
+            return [self.state.can_mode.get(words[2], 'none')]
+        if words[:2] == ['get', 'can-baudrate']:
+            if len(words) != 3:
+                return ['get can-baudrate: wrong parameter count']
+            return [str(self.state.bit_rate)]
+        if words[:3] == ['dio', 'set', 'LED0']:
+            if len(words) != 5:
+                return ['dio set: wrong parameter count']
+            if not words[3].isdigit() or int(words[3]) >= LED_COUNT or words[4] not in ('true', 'false'):
+                return [f'error: invalid argument {" ".join(words[3:])}']
+            self.state.leds[int(words[3])] = words[4] == 'true'
+            return []
+        return [f'{words[0]}: command not found']
+
+    def close(self):
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+        os.close(self._slave)
+        os.close(self.master)
+
+
+class McuState:
+    """Configuration shared by the shell and the slcan port, reset by the shell's 'reset'."""
+
+    def __init__(self, bit_rate=1000):
+        self.default_bit_rate = bit_rate
+        self.config_writes    = 0  # set can-mode/can-baudrate commands received, kept across resets
+        self.reset()
+        self._reset_pending   = False
+
+    def reset(self):
+        self.bit_rate = self.default_bit_rate
+        self.can_mode = {}
+        self.leds     = [False] * LED_COUNT
+        self.is_open  = False
+        self.listen_only = False
+        self.acceptance  = (0, 0xFFFFFFFF)
+        self.status      = 0  # slcan 'F' status flags, set by tests to fake bus errors
+        self._reset_pending = True
+
+    def resetting(self):
+        pending, self._reset_pending = self._reset_pending, False
+        return pending
+
+    def accepts(self, msg):
+        """SJA1000 single filter: mask bits set to 1 are don't care."""
+        code, mask = self.acceptance
+        shift = 3 if msg.is_extended_id else 21
+        return ((msg.arbitration_id << shift) ^ code) & ~mask & 0xFFFFFFFF == 0
+
+
+class SlcanPort:
+    """
+    Emulated slcan port. A reader thread parses host commands and queues transmitted
+    frames; a wire thread owns the bus, sending queued and generated frames back to back
+    at the bitrate and writing received frames (loopback and generated) to the host.
+    """
+
+    def __init__(self, state, loopback=False, generate=None, ids=(0x123,), dlc=8):
+        self.state    = state
+        self.loopback = loopback
+        self.interval = 1.0 / generate if generate else None
+        self._ids     = itertools.cycle(ids)
+        self._dlc     = dlc
+        self._counter = 0
+        self.master, self._slave, self.port = open_pty()
+        self.transmitted = 0
+        self.received    = 0
+        self.dropped     = 0
+        self._tx      = queue.Queue(TX_QUEUE)
+        self._lock    = threading.Lock()
+        self._bits    = {}
+        self._stop    = threading.Event()
+        self._threads = [threading.Thread(target=self._read, name='k800-slcan', daemon=True),
+                         threading.Thread(target=self._wire, name='k800-wire', daemon=True)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _write(self, data):
+        with self._lock:
+            os.write(self.master, data)
+
+    def _read(self):
+        buffer = b''
+        while not self._stop.is_set():
+            try:
+                if not select.select([self.master], [], [], POLL)[0]:
+                    continue
+                buffer += os.read(self.master, 4096)
+            except OSError:
+                return
+            *lines, buffer = buffer.split(b'\r')
+            for line in lines:
+                self._write(self.execute(line.decode('ascii', errors='replace')))
+
+    def execute(self, command):
+        """Run one slcan command, returning the reply bytes."""
+        state = self.state
+        if not command:
+            return SLCAN_OK
+        kind, args = command[0], command[1:]
+        try:
+            if kind in 'tTrR':
+                if not state.is_open or state.listen_only:
+                    return SLCAN_ERROR
+                # blocks while the queue is full, which stops reading and backpressures the host
+                msg = self.decode(command)
+                while not self._stop.is_set():
+                    try:
+                        self._tx.put(msg, timeout=POLL)
+                        break
+                    except queue.Full:
+                        pass
+                return b'z\r' if kind in 'tr' else b'Z\r'
+            if kind == 'S' and args in SLCAN_BITRATES and not state.is_open:
+                state.bit_rate = SLCAN_BITRATES[args]
+            elif kind in 'OL' and not args:
+                state.is_open, state.listen_only = True, kind == 'L'
+            elif kind == 'C' and not args:
+                state.is_open = False
+            elif kind == 'M' and len(args) == 8 and not state.is_open:
+                state.acceptance = (int(args, 16), state.acceptance[1])
+            elif kind == 'm' and len(args) == 8 and not state.is_open:
+                state.acceptance = (state.acceptance[0], int(args, 16))
+            elif kind == 'V':
+                return SLCAN_VERSION.encode() + SLCAN_OK
+            elif kind == 'N':
+                return SLCAN_SERIAL.encode() + SLCAN_OK
+            elif kind == 'F':
+                return f'F{state.status:02X}'.encode() + SLCAN_OK
+            else:
+                return SLCAN_ERROR
+        except ValueError:
+            return SLCAN_ERROR
+        return SLCAN_OK
+
+    @staticmethod
+    def decode(command):
+        """can.Message from a t/T/r/R slcan frame command, ValueError if malformed."""
+        kind = command[0]
+        extended = kind in 'TR'
+        id_end = 9 if extended else 4
+        dlc = int(command[id_end])
+        if dlc > 8:
+            raise ValueError(command)
+        remote = kind in 'rR'
+        data = b'' if remote else bytes.fromhex(command[id_end + 1:id_end + 1 + 2 * dlc])
+        if not remote and len(data) != dlc:
+            raise ValueError(command)
+        return can.Message(arbitration_id=int(command[1:id_end], 16), is_extended_id=extended,
+                           is_remote_frame=remote, dlc=dlc, data=data)
+
+    @staticmethod
+    def encode(msg):
+        """slcan command reporting a received frame to the host."""
+        kind = ('R' if msg.is_extended_id else 'r') if msg.is_remote_frame else ('T' if msg.is_extended_id else 't')
+        can_id = f'{msg.arbitration_id:08X}' if msg.is_extended_id else f'{msg.arbitration_id:03X}'
+        data = '' if msg.is_remote_frame else msg.data.hex().upper()
+        return f'{kind}{can_id}{msg.dlc}{data}\r'.encode()
+
+    def _generated(self):
+        self._counter += 1
+        can_id = next(self._ids)
+        return can.Message(arbitration_id=can_id, is_extended_id=can_id > STANDARD_ID_MASK,
+                           data=(self._counter % 2**64).to_bytes(8, 'little')[:self._dlc])
+
+    def _frame_bits(self, msg):
+        # exact stuffing depends on ID and data only, so cache it per frame content
+        key = (msg.arbitration_id, msg.is_extended_id, msg.is_remote_frame, msg.dlc, bytes(msg.data))
+        bits = self._bits.get(key)
+        if bits is None:
+            if len(self._bits) > 65536:
+                self._bits.clear()
+            dlc = 0 if msg.is_remote_frame else msg.dlc
+            bits = self._bits[key] = frame_bit_length(dlc, msg.is_extended_id) + stuff_bit_count(msg)
+        return bits
+
+    def _wire(self):
+        state = self.state
+        next_free = next_generated = time.perf_counter()
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            timeout = 0.05 if self.interval is None else min(0.05, max(0.0, next_generated - now))
+            try:
+                msg, echo = self._tx.get(timeout=timeout), self.loopback
+            except queue.Empty:
+                if self.interval is None or time.perf_counter() < next_generated:
+                    continue
+                msg, echo = self._generated(), True
+                next_generated = max(next_generated + self.interval, time.perf_counter() - 1.0)
+            # the frame holds the bus for its length once the previous one has finished; plain
+            # sleeps keep the host's CPU free, the absolute deadlines keep the average rate exact
+            next_free = max(next_free, time.perf_counter()) + self._frame_bits(msg) / (state.bit_rate * 1000)
+            delay = next_free - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not state.is_open:
+                self.dropped += 1
+                continue
+            self.transmitted += 1
+            if echo and state.accepts(msg):
+                self._write(self.encode(msg))
+                self.received += 1
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            if thread.ident is not None:
+                thread.join()
+        os.close(self._slave)
+        os.close(self.master)
+
+
+class K800Emulator:
+    """
+    Management shell and slcan port of one emulated K800 sharing one McuState.
+
+    With `link_dir`, the ports are also reachable as the symlinks mgmt and vcan in that
+    directory, which keep their path when unplug() re-creates the ports.
+    """
+
+    def __init__(self, bit_rate=1000, loopback=False, generate=None, ids=(0x123,), dlc=8, link_dir=None):
+        self.state = McuState(bit_rate)
+        self.link_dir = link_dir
+        self._slcan_kwargs = dict(loopback=loopback, generate=generate, ids=ids, dlc=dlc)
+        self.shell = ManagementShell(self.state)
+        self.slcan = SlcanPort(self.state, **self._slcan_kwargs)
+        self.unplugged = 0
+
+    @property
+    def mgmt_port(self):
+        return os.path.join(self.link_dir, 'mgmt') if self.link_dir else self.shell.port
+
+    @property
+    def vcan_port(self):
+        return os.path.join(self.link_dir, 'vcan') if self.link_dir else self.slcan.port
+
+    def _link(self):
+        if not self.link_dir:
+            return
+        os.makedirs(self.link_dir, exist_ok=True)
+        for link, target in ((self.mgmt_port, self.shell.port), (self.vcan_port, self.slcan.port)):
+            os.symlink(target, link + '.new')
+            os.replace(link + '.new', link)
+
+    def start(self):
+        self._link()
+        self.shell.start()
+        self.slcan.start()
+        return self
+
+    def unplug(self, outage=UNPLUG_OUTAGE):
+        """
+        Close both ports like a USB disconnect, then after `outage` s bring up new ones with
+        the MCU back at its power-on configuration, as after a reset or cable hiccup.
+        """
+        old = self.slcan
+        self.slcan.close()
+        self.shell.close()
+        time.sleep(outage)
+        self.state.reset()
+        self.state.resetting()  # power-on, no 'reset' banner pending
+        self.shell = ManagementShell(self.state)
+        self.slcan = SlcanPort(self.state, **self._slcan_kwargs)
+        self.slcan.transmitted, self.slcan.received, self.slcan.dropped = old.transmitted, old.received, old.dropped
+        self.unplugged += 1
+        self.start()
+
+    def report(self):
+        return (f"Bus {self.state.bit_rate} kbps: {self.slcan.transmitted} frames on the wire, "
+                f"{self.slcan.received} sent to the host, {self.slcan.dropped} dropped while closed; "
+                f"LEDs {''.join('1' if led else '0' for led in self.state.leds)}, "
+                f"{self.state.config_writes} configuration writes, unplugged {self.unplugged} times")
+
+    def close(self):
+        self.slcan.close()
+        self.shell.close()
+        if self.link_dir:
+            for link in (self.mgmt_port, self.vcan_port):
+                if os.path.islink(link):
+                    os.unlink(link)
+
+
+def parse_arguments():
+    """Receive and parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="K800 MCU Emulator")
+    parser.add_argument('-b', '--bitrate', type=int, choices=valid_bit_rates, default=1000,
+                        help="bitrate in kbps until the host configures one")
+    parser.add_argument('--loopback', action='store_true', help="send every transmitted frame back to the host")
+    parser.add_argument('--generate', type=float, metavar='FPS', help="generate received traffic at FPS frames/s")
+    parser.add_argument('--ids', type=lambda value: [int(i, 16) for i in value.split(',')], default=[0x123],
+                        help="comma separated hex IDs of generated frames (default 123)")
+    parser.add_argument('--dlc', type=int, choices=range(9), default=8, help="data length of generated frames")
+    parser.add_argument('--link', metavar='DIR',
+                        help="also expose the ports as DIR/mgmt and DIR/vcan, paths that survive an unplug")
+    parser.add_argument('--outage', type=float, default=UNPLUG_OUTAGE,
+                        help="seconds the ports stay away when SIGUSR1 simulates a USB disconnect")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    emulator = K800Emulator(args.bitrate, loopback=args.loopback, generate=args.generate,
+                            ids=args.ids, dlc=args.dlc, link_dir=args.link).start()
+    print(f"Management port: {emulator.mgmt_port}\nVCAN port: {emulator.vcan_port}", flush=True)
+    # kill -USR1 <pid> unplugs the emulated K800 for --outage seconds
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+        target=emulator.unplug, args=(args.outage,), daemon=True).start())
+    print("Ctrl+C to exit", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(emulator.report(), file=sys.stderr)
+        emulator.close()
+
+if __name__ == '__main__':
+    main()
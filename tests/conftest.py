@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# the utility and the emulator are plain modules in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import k800_emulator
+
+
+@pytest.fixture
+def emulator(tmp_path):
+    """Looped-back emulated K800, its ports reachable as symlinks that survive unplug()."""
+    emulator = k800_emulator.K800Emulator(500, loopback=True, link_dir=str(tmp_path / 'k800')).start()
+    yield emulator
+    emulator.close()
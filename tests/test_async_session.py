@@ -0,0 +1,51 @@
+import asyncio
+
+import can
+import pytest
+
+import k800_can
+
+pytest.importorskip('serial_asyncio')
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10.0))
+
+
+def test_session_configures_and_loops_back(emulator):
+    async def session():
+        async with k800_can.AsyncK800Session(bit_rate=250, is_led='on', mgmt_port=emulator.mgmt_port,
+                                             vcan_port=emulator.vcan_port, open_delay=0) as session:
+            assert emulator.state.can_mode == {'VCAN0': 'slcan'}
+            assert emulator.state.bit_rate == 250
+            assert all(emulator.state.leds)
+            await session.send(can.Message(arbitration_id=0x123, is_extended_id=False, data=b'K800'))
+            return await session.recv()
+
+    msg = run(session())
+    assert (msg.arbitration_id, bytes(msg.data)) == (0x123, b'K800')
+    assert not any(emulator.state.leds)
+
+
+def test_session_sends_only_the_difference(emulator):
+    async def open_close(**kwargs):
+        async with k800_can.AsyncK800Session(bit_rate=500, is_led='off', mgmt_port=emulator.mgmt_port,
+                                             vcan_port=emulator.vcan_port, open_delay=0, **kwargs):
+            pass
+
+    run(open_close())
+    assert emulator.state.config_writes == 1  # the emulator starts at 500 kbps, only the mode is set
+    run(open_close())
+    assert emulator.state.config_writes == 1
+    run(open_close(force_config=True))
+    assert emulator.state.config_writes == 3
+
+
+def test_virtual_session():
+    async def session():
+        async with k800_can.AsyncK800Session(interface='virtual') as session:
+            with pytest.raises(RuntimeError):
+                await session.command('get can-mode VCAN0')
+            await session.send(can.Message(arbitration_id=0x7FF, is_extended_id=False))
+
+    run(session())
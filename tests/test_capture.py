@@ -0,0 +1,47 @@
+import can
+import pytest
+
+import k800_can
+
+np = pytest.importorskip('numpy')
+
+
+def frames(count):
+    return [can.Message(timestamp=1000.0 + i, arbitration_id=0x100 + i, is_extended_id=bool(i % 2),
+                        data=bytes(range(i % 9))) for i in range(count)]
+
+
+def test_append_matches_extend():
+    batch = frames(20)
+    appended, extended = k800_can.CaptureStore(capacity=4), k800_can.CaptureStore(capacity=4)
+    for msg in batch:
+        appended.append(msg, tx=True)
+    extended.extend(batch, tx=True)
+    assert len(appended) == 20
+    assert appended.frames.tobytes() == extended.frames.tobytes()
+    assert all(appended.frames['flags'] & k800_can.FLAG_TX)
+
+
+def test_save_rejects_unknown_suffix(tmp_path):
+    store = k800_can.CaptureStore()
+    store.extend(frames(3))
+    with pytest.raises(ValueError):
+        store.save(str(tmp_path / 'capture.csv'))
+    assert not (tmp_path / 'capture.csv').exists()
+
+
+def test_save_npy(tmp_path):
+    store = k800_can.CaptureStore()
+    store.extend(frames(5))
+    store.save(str(tmp_path / 'capture.npy'))
+    assert np.load(tmp_path / 'capture.npy').tobytes() == store.frames.tobytes()
+
+
+def test_save_parquet(tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    store = k800_can.CaptureStore()
+    store.extend(frames(5))
+    store.save(str(tmp_path / 'capture.parquet'))
+    table = parquet.read_table(tmp_path / 'capture.parquet')
+    assert table.num_rows == 5
+    assert table.column('id').to_pylist() == [0x100 + i for i in range(5)]
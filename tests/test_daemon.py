@@ -0,0 +1,110 @@
+import grp
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+import can
+import pytest
+
+import k800_can
+
+
+@pytest.fixture
+def bus():
+    bus = can.Bus(interface='virtual', channel='k800-test-daemon')
+    yield bus
+    bus.shutdown()
+
+
+def test_socket_mode_and_group(bus, tmp_path):
+    path = str(tmp_path / 'k800d.sock')
+    group = grp.getgrgid(os.getegid()).gr_name
+    daemon = k800_can.K800Daemon(bus, path, 500, group=group).start()
+    try:
+        st = os.stat(path)
+        assert stat.S_IMODE(st.st_mode) == k800_can.DAEMON_MODE
+        assert st.st_gid == os.getegid()
+        with k800_can.K800Client(path) as client:
+            assert client.bit_rate == 500
+    finally:
+        daemon.close()
+    assert not os.path.exists(path)
+
+
+def test_refuses_a_file_it_did_not_create(bus, tmp_path):
+    path = tmp_path / 'k800d.sock'
+    path.write_text('not a socket')
+    with pytest.raises(OSError, match='not a k800d socket'):
+        k800_can.K800Daemon(bus, str(path), 500, group=None).start()
+    assert path.read_text() == 'not a socket'
+
+
+def test_replaces_a_stale_socket(bus, tmp_path):
+    path = str(tmp_path / 'k800d.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    daemon = k800_can.K800Daemon(bus, path, 500, group=None).start()
+    try:
+        with k800_can.K800Client(path) as client:
+            assert client.bit_rate == 500
+        with pytest.raises(OSError, match='already running'):
+            k800_can.K800Daemon(bus, path, 500, group=None).start()
+    finally:
+        daemon.close()
+
+
+def test_unknown_group(bus, tmp_path):
+    with pytest.raises(OSError, match='does not exist'):
+        k800_can.K800Daemon(bus, str(tmp_path / 'k800d.sock'), 500, group='k800-no-such-group').start()
+
+
+def test_sigterm_cleans_up(tmp_path):
+    path = str(tmp_path / 'k800d.sock')
+    group = grp.getgrgid(os.getegid()).gr_name
+    utility = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'k800_can_utility.py')
+    daemon = subprocess.Popen([sys.executable, utility, '-i', 'virtual', '-m', 'daemon', '-q',
+                               '--socket', path, '--socket-group', group],
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        deadline = time.monotonic() + 10.0
+        while not os.path.exists(path) and time.monotonic() < deadline and daemon.poll() is None:
+            time.sleep(0.05)
+        assert os.path.exists(path)
+        daemon.send_signal(signal.SIGTERM)
+        output, _ = daemon.communicate(timeout=10.0)
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+            daemon.wait()
+    assert 'k800d served' in output
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize('kind, payload', [
+    (k800_can.MSG_FRAME, b'\x00' * 3),
+    (k800_can.MSG_FRAME, k800_can.FRAME_RECORD.pack(0.0, 0x800, 0, 8, bytes(8))),
+    (k800_can.MSG_FILTER, b'\x00' * 5),
+    (k800_can.MSG_FILTER, k800_can.FILTER_ENTRY.pack(0x123, 0x7FF, 9)),
+])
+def test_drops_a_malformed_client(bus, tmp_path, kind, payload):
+    path = str(tmp_path / 'k800d.sock')
+    daemon = k800_can.K800Daemon(bus, path, 500, group=None).start()
+    try:
+        with k800_can.K800Client(path) as bad, k800_can.K800Client(path) as good:
+            bad.stream.write(kind, payload)
+            with pytest.raises(ConnectionError):
+                deadline = time.monotonic() + 2.0
+                while time.monotonic() < deadline:
+                    bad.stream.read(0.1)
+            good.send(can.Message(arbitration_id=0x123, is_extended_id=False, data=b'K800'))
+            deadline = time.monotonic() + 2.0
+            while daemon.sent == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert daemon.sent == 1
+    finally:
+        daemon.close()
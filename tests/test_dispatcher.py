@@ -0,0 +1,67 @@
+import can
+import pytest
+
+import k800_can
+
+
+def frame(can_id, extended=False):
+    return can.Message(arbitration_id=can_id, is_extended_id=extended)
+
+
+def recorder(calls, name):
+    def handler(msg):
+        calls.append((name, msg.arbitration_id))
+    handler.__name__ = name
+    return handler
+
+
+def test_exact_range_and_mask_routes():
+    calls = []
+    dispatcher = k800_can.Dispatcher(default=recorder(calls, 'default'))
+    dispatcher.add(recorder(calls, 'exact'), can_id=0x7E8)
+    dispatcher.add(recorder(calls, 'range'), id_range=(0x7E0, 0x7EF))
+    dispatcher.add(recorder(calls, 'mask'), can_id=0x00FEF100, mask=0x00FFFF00)
+    dispatcher([frame(0x7E8), frame(0x7E0), frame(0x7EF), frame(0x7F0),
+                frame(0x18FEF117, True), frame(0x18FEF200, True)])
+    assert calls == [('exact', 0x7E8), ('range', 0x7E8), ('range', 0x7E0), ('range', 0x7EF),
+                     ('default', 0x7F0), ('mask', 0x18FEF117), ('default', 0x18FEF200)]
+    assert [stats.calls for stats in dispatcher.stats] == [1, 3, 1]
+
+
+def test_handlers_of_one_id_run_in_registration_order():
+    calls = []
+    dispatcher = k800_can.Dispatcher()
+    dispatcher.add(recorder(calls, 'range'), id_range=(0x100, 0x1FF))
+    dispatcher.add(recorder(calls, 'mask'), can_id=0x100, mask=0x700)
+    dispatcher.add(recorder(calls, 'exact'), can_id=0x123)
+    dispatcher.dispatch(frame(0x123))
+    assert [name for name, _ in calls] == ['range', 'mask', 'exact']
+
+
+def test_add_and_remove_recompile():
+    calls = []
+    dispatcher = k800_can.Dispatcher(default=recorder(calls, 'default'))
+    first = dispatcher.add(recorder(calls, 'first'), can_id=0x123)
+    dispatcher.dispatch(frame(0x123))
+    second = dispatcher.add(recorder(calls, 'second'), id_range=(0x120, 0x12F))
+    dispatcher.dispatch(frame(0x123))
+    dispatcher.remove(first)
+    dispatcher.dispatch(frame(0x123))
+    dispatcher.remove(second)
+    dispatcher.dispatch(frame(0x123))
+    assert [name for name, _ in calls] == ['first', 'first', 'second', 'second', 'default']
+    assert dispatcher.stats == []
+    with pytest.raises(ValueError):
+        dispatcher.remove(first)
+
+
+def test_rejects_ambiguous_registrations():
+    dispatcher = k800_can.Dispatcher()
+    with pytest.raises(ValueError):
+        dispatcher.add(print)
+    with pytest.raises(ValueError):
+        dispatcher.add(print, can_id=0x100, id_range=(0x100, 0x1FF))
+    with pytest.raises(ValueError):
+        dispatcher.add(print, id_range=(0x100, 0x1FF), mask=0x700)
+    with pytest.raises(ValueError):
+        dispatcher.add(print, id_range=(0x1FF, 0x100))
@@ -0,0 +1,71 @@
+import os
+
+import can
+import pytest
+
+import k800_can
+
+
+def message(index):
+    return can.Message(timestamp=1000.0 + index, arbitration_id=0x100 + index % 16,
+                       is_extended_id=bool(index % 2), data=bytes([index % 256] * (index % 9)))
+
+
+def segment_size(records):
+    return k800_can.LOG_HEADER.size + records * k800_can.FRAME_RECORD.size
+
+
+def test_rotates_when_a_segment_is_full(tmp_path):
+    with k800_can.FrameLogWriter(str(tmp_path), segment_size=segment_size(10)) as writer:
+        writer([message(i) for i in range(25)])
+    assert [os.path.basename(path) for path in writer.segments] == [
+        'k800_000000.k8l', 'k800_000001.k8l', 'k800_000002.k8l']
+    # closed segments are truncated to the records they hold
+    assert os.path.getsize(writer.segments[-1]) == segment_size(5)
+    with k800_can.FrameLogReader(str(tmp_path)) as reader:
+        assert len(reader) == 25
+        for i, msg in enumerate(reader.messages()):
+            expected = message(i)
+            assert (msg.timestamp, msg.arbitration_id, msg.is_extended_id, bytes(msg.data)) == (
+                expected.timestamp, expected.arbitration_id, expected.is_extended_id, bytes(expected.data))
+        assert [record[0] for record in reader[8:12]] == [1008.0, 1009.0, 1010.0, 1011.0]
+        assert [record[0] for record in reader.between(1019.0, 1021.0)] == [1019.0, 1020.0]
+
+
+def test_rotates_by_age(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(k800_can.time, 'monotonic', lambda: now[0])
+    with k800_can.FrameLogWriter(str(tmp_path), segment_seconds=60) as writer:
+        writer.write(message(0))
+        now[0] = 59.0
+        writer.write(message(1))
+        now[0] = 61.0
+        writer.write(message(2))
+    assert len(writer.segments) == 2
+    with k800_can.FrameLogReader(str(tmp_path)) as reader:
+        assert len(reader) == 3
+
+
+def test_tx_flag_round_trips(tmp_path):
+    with k800_can.FrameLogWriter(str(tmp_path)) as writer:
+        writer.write(message(1), tx=True)
+        writer.write(message(2))
+    with k800_can.FrameLogReader(str(tmp_path)) as reader:
+        assert [msg.is_rx for msg in reader.messages()] == [False, True]
+
+
+def test_rejects_tiny_segments(tmp_path):
+    with pytest.raises(ValueError):
+        k800_can.FrameLogWriter(str(tmp_path), segment_size=k800_can.LOG_HEADER.size)
+
+
+def test_continues_after_the_highest_existing_index(tmp_path):
+    for index in (0, 3):
+        with k800_can.FrameLogWriter(str(tmp_path), prefix='run') as writer:
+            writer.write(message(index))
+        os.rename(writer.segments[0], tmp_path / f'run_{index:06d}.k8l')
+    with k800_can.FrameLogWriter(str(tmp_path), prefix='run') as writer:
+        writer.write(message(9))
+    assert os.path.basename(writer.segments[0]) == 'run_000004.k8l'
+    with k800_can.FrameLogReader(str(tmp_path), prefix='run') as reader:
+        assert [record[0] for record in reader] == [1000.0, 1003.0, 1009.0]
@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+import k800_can
+
+
+def test_histogram_error_under_one_percent():
+    histogram = k800_can.LatencyHistogram()
+    for value in range(1, 200000, 7):
+        histogram.counts.clear()
+        histogram.total = histogram.max = 0
+        histogram.record((value + 0.5) / 1e6)  # recorded in whole microseconds
+        histogram.record(1.0)
+        assert value <= histogram.percentile(50) < value * 1.01
+
+
+def test_histogram_percentiles():
+    random.seed(1)
+    samples = sorted(random.randint(50, 50000) for _ in range(10000))
+    histogram = k800_can.LatencyHistogram()
+    for sample in samples:
+        histogram.record(sample / 1e6)
+    for percent in (50, 90, 99):
+        exact = samples[len(samples) * percent // 100 - 1]
+        assert histogram.percentile(percent) == pytest.approx(exact, rel=0.01)
+    assert histogram.percentile(100) == histogram.max == samples[-1]
+    assert sum(n for low, high, n in histogram.distribution()) == len(samples)
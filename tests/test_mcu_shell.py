@@ -0,0 +1,109 @@
+import pytest
+import serial
+
+import k800_can
+from k800_can import McuError, McuShell
+
+
+class SilentPort:
+    """Serial port stand-in whose MCU never answers."""
+
+    def __init__(self, data=b''):
+        self.data    = data
+        self.timeout = None
+        self.written = b''
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        self.written += data
+
+    def read_until(self, expected):
+        data, self.data = self.data, b''
+        return data
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def shell(emulator):
+    shell = McuShell(serial.Serial(emulator.mgmt_port))
+    shell.sync()
+    yield shell
+    shell.close()
+
+
+def test_parse_mcu_response():
+    raw = b'get can-mode VCAN0\r\n\x1b[1;32mslcan\x1b[m\r\nuart:~$'
+    assert k800_can.parse_mcu_response('get can-mode VCAN0', raw) == 'slcan'
+    with pytest.raises(McuError):
+        k800_can.parse_mcu_response('foo', b'foo\r\nfoo: command not found\r\nuart:~$')
+
+
+def test_command_strips_echo_and_prompt(shell, emulator):
+    assert shell.command('set can-mode VCAN0 slcan') == ''
+    assert shell.command('get can-mode VCAN0') == 'slcan'
+    assert emulator.state.can_mode == {'VCAN0': 'slcan'}
+
+
+def test_batch_returns_one_response_per_command(shell, emulator):
+    commands = [k800_can.led_command(i, True) for i in range(k800_can.LED_COUNT)]
+    commands += k800_can.query_commands('VCAN0')
+    responses = shell.batch(commands)
+    assert responses == [''] * k800_can.LED_COUNT + ['none', '500']
+    assert all(emulator.state.leds)
+
+
+def test_error_response_raises(shell):
+    with pytest.raises(McuError):
+        shell.command('set can-baudrate VCAN0 123')
+    # the shell is back at its prompt afterwards
+    assert shell.command('get can-baudrate VCAN0') == '500'
+
+
+def test_missing_prompt_times_out():
+    shell = McuShell(SilentPort(b'get can-mode VCAN0\r\nslcan\r\n'), timeout=0.05)
+    with pytest.raises(TimeoutError):
+        shell.command('get can-mode VCAN0')
+
+
+def test_configure_can_sends_only_the_difference(shell, emulator, tmp_path):
+    cache = str(tmp_path / 'config.json')
+    assert k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', cache_path=cache) == ['set can-mode VCAN0 slcan']
+    assert k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', cache_path=cache) == []
+    assert len(k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', force=True, cache_path=cache)) == 2
+    assert emulator.state.config_writes == 3
+
+
+class NoReadBackShell:
+    """McuShell stand-in for firmware without the 'get' commands."""
+
+    def __init__(self):
+        self.sent = []
+
+    def batch(self, commands, timeout=None):
+        if any(command.startswith('get ') for command in commands):
+            raise McuError("'get' failed: get: command not found")
+        self.sent += commands
+        return [''] * len(commands)
+
+
+def test_configure_can_without_read_back_sends_everything(tmp_path):
+    cache = str(tmp_path / 'config.json')
+    k800_can._store_config('K800A', 'VCAN0', 'slcan', '500', cache)
+    shell = NoReadBackShell()
+    assert len(k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', unit='K800A', cache_path=cache)) == 2
+    assert len(k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', unit='K800A', cache_path=cache)) == 2
+
+
+def test_configure_can_notices_a_reset(shell, emulator, tmp_path, capsys):
+    cache = str(tmp_path / 'config.json')
+    k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', unit='K800A', cache_path=cache)
+    assert k800_can._load_config_cache(cache) == {'K800A': {'VCAN0': ['slcan', '500']}}
+    emulator.state.reset()
+    emulator.state.resetting()
+    assert k800_can.configure_can(shell, 'VCAN0', 'slcan', '500', unit='K800A',
+                                  cache_path=cache) == ['set can-mode VCAN0 slcan']
+    assert 'VCAN0 changed to none 500' in capsys.readouterr().out
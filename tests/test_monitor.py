@@ -0,0 +1,68 @@
+import io
+import math
+import statistics
+
+import can
+import pytest
+
+import k800_can
+
+
+def frames(can_id, timestamps, data=lambda i: [i]):
+    return [can.Message(timestamp=t, arbitration_id=can_id, is_extended_id=can_id > 0x7FF, data=data(i))
+            for i, t in enumerate(timestamps)]
+
+
+def test_period_statistics():
+    stats = k800_can.IdStats(False)
+    timestamps = [10.0, 10.010, 10.020, 10.040, 10.060, 10.065]
+    for t in timestamps:
+        stats.update(t, b'\x00')
+    periods = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    assert stats.count == 6
+    assert stats.period_mean == pytest.approx(statistics.fmean(periods))
+    assert stats.period_min == pytest.approx(0.005)
+    assert stats.period_max == pytest.approx(0.020)
+    assert stats.jitter == pytest.approx(statistics.stdev(periods))
+
+
+def test_single_frame_has_no_period():
+    stats = k800_can.IdStats(False)
+    stats.update(1.0, b'\x01')
+    assert (stats.period_mean, stats.jitter, stats.period_min) == (0.0, 0.0, math.inf)
+
+
+def test_changed_bytes():
+    stats = k800_can.IdStats(False)
+    stats.update(0.0, b'\x01\x02')
+    stats.update(0.1, b'\x01\x03\x04')
+    assert stats.changed == 0b110
+
+
+def test_render_rates_since_the_last_draw(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(k800_can.time, 'perf_counter', lambda: clock[0])
+    out = io.StringIO()
+    monitor = k800_can.BusMonitor(out=out, ansi=False)
+    monitor(frames(0x123, [0.0, 0.01, 0.02, 0.03, 0.04]))
+    monitor(frames(0x18FEF100, [0.0, 0.5], data=lambda i: [0xAB, i]))
+    clock[0] = 102.0
+    monitor.draw()
+    lines = out.getvalue().splitlines()
+    assert lines[1].split() == ['123', '5', '2.5', '10.00', '10.00', '10.00', '0.000', '04']
+    assert lines[2].split() == ['18FEF100', '2', '1.0', '500.00', '500.00', '500.00', '0.000', 'AB', '01']
+    assert lines[-1] == '2 IDs, 7 frames'
+
+    # the next rate only counts frames since this draw
+    monitor(frames(0x123, [0.05, 0.06]))
+    clock[0] = 103.0
+    assert monitor.render().splitlines()[1].split()[:3] == ['123', '7', '2.0']
+
+
+def test_first_frame_has_no_period_columns(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(k800_can.time, 'perf_counter', lambda: clock[0])
+    monitor = k800_can.BusMonitor(out=io.StringIO(), ansi=False)
+    monitor(frames(0x7FF, [1.0]))
+    clock[0] = 101.0
+    assert monitor.render().splitlines()[1].split() == ['7FF', '1', '1.0', '-', '-', '-', '-', '00']
@@ -0,0 +1,79 @@
+import time
+
+import can
+import pytest
+
+import k800_can
+
+
+def frame(i):
+    return can.Message(arbitration_id=0x100, is_extended_id=False, data=i.to_bytes(2, 'little'))
+
+
+def number(msg):
+    return int.from_bytes(msg.data, 'little')
+
+
+def test_overfilled_ring_keeps_the_newest_frames():
+    ring = k800_can.FrameRing(8)
+    for i in range(20):
+        ring.put(frame(i))
+    assert (len(ring), ring.overruns) == (8, 12)
+    assert [number(msg) for msg in ring.get_batch(5)] == [12, 13, 14, 15, 16]
+    assert [number(msg) for msg in ring.get_batch(10)] == [17, 18, 19]
+    assert ring.get_batch(10, timeout=0) == []
+
+
+def test_batches_wrap_around_the_ring():
+    ring = k800_can.FrameRing(8)
+    kept = []
+    for start in range(0, 30, 6):
+        for i in range(start, start + 6):
+            ring.put(frame(i))
+        kept += ring.get_batch(6)
+    assert [number(msg) for msg in kept] == list(range(30))
+    assert ring.overruns == 0
+    assert all(slot is None for slot in ring._slots)
+
+
+def test_ring_capacity():
+    with pytest.raises(ValueError):
+        k800_can.FrameRing(0)
+
+
+def test_receiver_counts_overruns_of_a_slow_consumer():
+    sender   = can.Bus(interface='virtual', channel='k800-test-receiver')
+    listener = can.Bus(interface='virtual', channel='k800-test-receiver')
+    receiver = k800_can.Receiver(listener, capacity=16, poll=0.01).start()
+    try:
+        for i in range(50):
+            sender.send(frame(i))
+        deadline = time.monotonic() + 2.0
+        while receiver.received < 50 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        batches = []
+        receiver.drain([batches.append], count=16)
+    finally:
+        receiver.stop()
+        sender.shutdown()
+        listener.shutdown()
+    assert (receiver.received, receiver.overruns, receiver.consumed) == (50, 34, 16)
+    assert [number(msg) for batch in batches for msg in batch] == list(range(34, 50))
+    assert '34 overruns' in receiver.report()
+
+
+def test_receiver_tags_channels():
+    senders   = [can.Bus(interface='virtual', channel=f'k800-test-unit-{i}') for i in range(2)]
+    listeners = [can.Bus(interface='virtual', channel=f'k800-test-unit-{i}') for i in range(2)]
+    receiver  = k800_can.Receiver(listeners, channels=['A', 'B'], poll=0.01).start()
+    try:
+        senders[0].send(frame(0))
+        senders[1].send(frame(1))
+        batches = []
+        receiver.drain([batches.append], count=2)
+    finally:
+        receiver.stop()
+        for bus in senders + listeners:
+            bus.shutdown()
+    assert sorted((msg.channel, number(msg)) for batch in batches for msg in batch) == [('A', 0), ('B', 1)]
+    assert receiver.received_by == [1, 1]
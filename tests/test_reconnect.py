@@ -0,0 +1,144 @@
+import threading
+import time
+import types
+
+import can
+import pytest
+from serial.tools.list_ports_common import ListPortInfo
+
+import k800_can
+
+OPEN_KWARGS = dict(bit_rate=500, interface='slcan', is_led='off', open_delay=0)
+
+
+@pytest.fixture
+def supervised(emulator):
+    device = k800_can.K800Device(None, {k800_can.MGMT_INTERFACE: emulator.mgmt_port,
+                                        k800_can.VCAN_INTERFACE: emulator.vcan_port})
+    device.open(**OPEN_KWARGS)
+    bus = k800_can.SupervisedBus(device, OPEN_KWARGS, rediscover=False, delay=0.05, max_delay=0.2)
+    yield bus
+    bus.close()
+    device.close(lost=True)
+
+
+def recv_until(bus, arbitration_id, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        msg = bus.recv(0.1)
+        if msg is not None and msg.arbitration_id == arbitration_id:
+            return msg
+    return None
+
+
+def test_open_configures_the_emulator(supervised, emulator):
+    assert emulator.state.can_mode == {'VCAN0': 'slcan'}
+    supervised.send(can.Message(arbitration_id=0x321, is_extended_id=False, data=b'\x01'))
+    assert recv_until(supervised, 0x321) is not None
+    assert supervised.report().endswith('no connection loss')
+
+
+def test_survives_unplug(supervised, emulator):
+    writes = emulator.state.config_writes
+    unplug = threading.Thread(target=emulator.unplug, args=(0.3,))
+    unplug.start()
+    # recv() notices the closed port and starts the supervisor, sends are queued meanwhile
+    deadline = time.monotonic() + 2.0
+    while supervised.bus is not None and time.monotonic() < deadline:
+        supervised.recv(0.05)
+    assert supervised.bus is None
+    with pytest.raises(k800_can.FrameQueued):
+        supervised.send(can.Message(arbitration_id=0x42, is_extended_id=False, data=b'\x02'))
+    unplug.join()
+    assert supervised._up.wait(3.0)
+    # the MCU came back at its power-on configuration and was configured again, in full
+    assert emulator.state.can_mode == {'VCAN0': 'slcan'}
+    assert emulator.state.config_writes == writes + 2
+    assert emulator.unplugged == 1
+    assert recv_until(supervised, 0x42) is not None
+    assert len(supervised.outages) == 1
+    assert supervised.outages[0][2:] == (1, 0)  # the queued frame was sent, none lost
+    assert '1 reconnect(s)' in supervised.report()
+
+
+class DroppingBus:
+    """Bus whose connection drops on the first send."""
+
+    def send(self, msg, timeout=None):
+        raise can.CanOperationError("Could not write to serial device") from OSError(5, 'Input/output error')
+
+    def shutdown(self):
+        pass
+
+
+class UnpluggedDevice:
+    """K800Device stand-in that stays away once its bus has dropped."""
+
+    name = unit = serial_number = 'K800A'
+
+    def __init__(self):
+        self.bus = DroppingBus()
+
+    def open(self, **kwargs):
+        raise OSError(2, 'No such file or directory')
+
+    def close(self, is_led=None, lost=False):
+        self.bus = None
+
+
+def test_sent_only_when_written_to_a_live_bus():
+    sent = []
+    device = UnpluggedDevice()
+    supervised = k800_can.SupervisedBus(device, {}, rediscover=False, backlog=2, delay=0.05, on_sent=sent.append)
+    frames = [can.Message(arbitration_id=i, is_extended_id=False) for i in range(4)]
+    try:
+        # the frame in flight when the connection drops is lost, not queued
+        with pytest.raises(can.CanOperationError):
+            supervised.send(frames[0])
+        stats = k800_can.TransmitEngine(supervised, frames[1:], fps=1000).run()
+    finally:
+        supervised.close()
+    assert (stats.sent, stats.failed, stats.queued) == (0, 0, 3)
+    assert "queued while reconnecting" in stats.report()
+    # one in flight and one pushed out of the full backlog
+    assert (supervised.lost, list(supervised.backlog), sent) == (2, frames[2:], [])
+
+
+class ReturningDevice(UnpluggedDevice):
+    """K800Device stand-in that reopens once its ports are back."""
+
+    def __init__(self):
+        super().__init__()
+        self.interfaces = {}
+
+    def open(self, **kwargs):
+        if not self.interfaces:
+            raise OSError(2, 'No such file or directory')
+        self.bus = can.Bus(interface='virtual', channel='k800-test-reconnect')
+        return self.bus
+
+    def close(self, is_led=None, lost=False):
+        if self.bus:
+            self.bus.shutdown()
+        self.bus = None
+
+
+def test_port_attach_cuts_the_backoff_short(monkeypatch):
+    ports = []
+    monkeypatch.setattr(k800_can, 'system_ports', types.SimpleNamespace(comports=lambda: list(ports)))
+    device = ReturningDevice()
+    supervised = k800_can.SupervisedBus(device, {}, delay=60, max_delay=60)
+    try:
+        with pytest.raises(can.CanOperationError):
+            supervised.send(can.Message(arbitration_id=0x1))
+        for device_path, location in (('/dev/ttyACM0', '1-4:1.0'), ('/dev/ttyACM1', '1-4:1.2')):
+            port = ListPortInfo(device_path, skip_link_detection=True)
+            port.serial_number, port.location = 'K800A', location
+            port.hwid = f'USB VID:PID={k800_can.MCU_VID_PID} SER=K800A LOCATION={location}'
+            ports.append(port)
+        # the watcher polls every second; the backoff alone would wait a minute
+        assert supervised._up.wait(5.0)
+        assert device.interfaces == {0: '/dev/ttyACM0', 2: '/dev/ttyACM1'}
+    finally:
+        supervised.close()
+        device.close()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import can
+
+import k800_can
+
+
+def frames(count):
+    return [can.Message(timestamp=1000.0 + i / 1000, arbitration_id=0x100 + i % 8, is_extended_id=False,
+                        data=bytes([i % 256])) for i in range(count)]
+
+
+def logged(path):
+    with can.LogReader(path) as reader:
+        return [(msg.arbitration_id, bytes(msg.data)) for msg in reader]
+
+
+def test_sent_frames_are_batched_not_dropped(tmp_path):
+    path = str(tmp_path / 'sent.csv')
+    recorder = k800_can.RecordingWriter(path, queue_size=4)
+    sent = frames(1000)
+    for msg in sent:
+        recorder.write(msg)
+    recorder.close()
+    assert (recorder.written, recorder.dropped) == (1000, 0)
+    assert logged(path) == [(msg.arbitration_id, bytes(msg.data)) for msg in sent]
+
+
+def test_partial_batch_is_written_on_flush(tmp_path):
+    path = str(tmp_path / 'sent.csv')
+    recorder = k800_can.RecordingWriter(path, flush_interval=0.05)
+    try:
+        for msg in frames(3):
+            recorder.write(msg)
+        deadline = time.monotonic() + 2.0
+        while recorder.written < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert recorder.written == 3
+    finally:
+        recorder.close()
+
+
+class StalledLogger:
+    """can.Logger stand-in that blocks on the first frame until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.frames  = 0
+
+    def on_message_received(self, msg):
+        self.release.wait()
+        self.frames += 1
+
+    def stop(self):
+        pass
+
+
+def test_overflow_is_counted_and_reported(tmp_path, capsys, monkeypatch):
+    logger = StalledLogger()
+    monkeypatch.setattr(k800_can.can, 'Logger', lambda filename: logger)
+    recorder = k800_can.RecordingWriter(str(tmp_path / 'received.csv'), queue_size=1)
+    recorder(frames(1))
+    while not recorder._queue.empty():
+        time.sleep(0.01)
+    # the writer thread is stuck on the first batch: one more fits the queue, two are dropped
+    for _ in range(3):
+        recorder(frames(10))
+    logger.release.set()
+    recorder.close()
+    assert (recorder.written, recorder.dropped, logger.frames) == (11, 20, 11)
+    assert 'dropping frames' in capsys.readouterr().out
+    assert '20 dropped' in recorder.report()
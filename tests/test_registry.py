@@ -0,0 +1,77 @@
+import types
+
+import pytest
+from serial.tools.list_ports_common import ListPortInfo
+
+import k800_can
+
+
+def port_info(device, serial_number, location, vid_pid=k800_can.MCU_VID_PID):
+    port = ListPortInfo(device, skip_link_detection=True)
+    port.serial_number = serial_number
+    port.location = location
+    port.hwid = f'USB VID:PID={vid_pid} SER={serial_number} LOCATION={location}'
+    return port
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    ports = [
+        port_info('/dev/ttyACM0', 'K800A', '1-4:1.0'),
+        port_info('/dev/ttyACM1', 'K800A', '1-4:1.2'),
+        port_info('/dev/ttyACM2', 'K800B', '1-5:1.0'),
+        port_info('/dev/ttyACM3', 'K800B', '1-5:1.2'),
+        port_info('/dev/ttyACM4', None, '1-6:1.0'),
+        port_info('/dev/ttyACM5', None, '1-6:1.2'),
+        port_info('/dev/ttyUSB0', 'OTHER', '1-7:1.0', vid_pid='0403:6001'),
+    ]
+    monkeypatch.setattr(k800_can, 'system_ports', types.SimpleNamespace(comports=lambda: list(ports)))
+    return ports
+
+
+def test_usb_interface():
+    assert k800_can.usb_interface('1-4:1.2') == 2
+    assert k800_can.usb_interface('1-4') is None
+    assert k800_can.usb_interface(None) is None
+
+
+def test_scan_groups_ports_by_unit(ports):
+    units = k800_can.scan_k800_ports()
+    assert list(units) == ['K800A', 'K800B', '1-6']
+    assert {num: port.device for num, port in units['K800A'].items()} == {0: '/dev/ttyACM0', 2: '/dev/ttyACM1'}
+
+
+def test_registry_select_by_serial_number_and_location(ports):
+    registry = k800_can.DeviceRegistry()
+    registry.refresh()
+    (device,) = registry.select(['K800B'])
+    assert (device.mgmt_port, device.vcan_port, device.location) == ('/dev/ttyACM2', '/dev/ttyACM3', '1-5')
+    assert registry.select(['1-4']) == registry.select(['K800A'])
+    assert registry.select(['1-6'])[0].serial_number is None
+    assert len(registry.select()) == 3
+    with pytest.raises(KeyError):
+        registry.select(['K800C'])
+
+
+def test_refresh_keeps_open_devices(ports):
+    registry = k800_can.DeviceRegistry()
+    registry.refresh()
+    device = registry.devices['K800A']
+    device.bus = object()
+    ports[:2] = [port_info('/dev/ttyACM8', 'K800A', '1-4:1.0'), port_info('/dev/ttyACM9', 'K800A', '1-4:1.2')]
+    registry.refresh()
+    assert registry.devices['K800A'] is device
+    del ports[2:4]
+    registry.refresh()
+    assert 'K800B' not in registry.devices
+
+
+def test_port_watcher_reports_changes(ports):
+    events = []
+    watcher = k800_can.PortWatcher(lambda *event: events.append(event))
+    watcher._known = watcher._snapshot()
+    removed = ports.pop(3)
+    watcher.check()
+    ports.append(port_info('/dev/ttyACM7', 'K800B', '1-5:1.2'))
+    watcher.check()
+    assert events == [('detach', 'K800B', 2, removed.device), ('attach', 'K800B', 2, '/dev/ttyACM7')]
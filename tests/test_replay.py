@@ -0,0 +1,74 @@
+import time
+
+import can
+import pytest
+
+import k800_can
+
+
+@pytest.fixture
+def capture(tmp_path):
+    """candump log of 0x100, 0x200 and 0x300, 50 ms apart, twice."""
+    path = str(tmp_path / 'capture.log')
+    with can.Logger(path) as log:
+        for i in range(6):
+            log(can.Message(timestamp=1000.0 + 0.05 * i, arbitration_id=0x100 * (i % 3 + 1),
+                            is_extended_id=False, data=[i]))
+    return path
+
+
+@pytest.fixture
+def buses():
+    sender = can.Bus(interface='virtual', channel='k800-test-replay')
+    listener = can.Bus(interface='virtual', channel='k800-test-replay')
+    yield sender, listener
+    sender.shutdown()
+    listener.shutdown()
+
+
+def received(bus):
+    frames = []
+    while (msg := bus.recv(0)) is not None:
+        frames.append(msg)
+    return frames
+
+
+def test_replays_with_original_timing(capture, buses):
+    sender, listener = buses
+    stats = k800_can.ReplayEngine(sender, capture).run()
+    frames = received(listener)
+    assert [msg.data[0] for msg in frames] == list(range(6))
+    assert stats.sent == 6
+    # 250 ms of capture, each frame sent at its scheduled time
+    assert 0.24 <= frames[-1].timestamp - frames[0].timestamp < 0.35
+    assert max(stats.jitter) < 0.05
+
+
+def test_speed_scales_the_timing(capture, buses):
+    sender, listener = buses
+    k800_can.ReplayEngine(sender, capture, speed=5).run()
+    frames = received(listener)
+    assert len(frames) == 6
+    assert 0.045 <= frames[-1].timestamp - frames[0].timestamp < 0.15
+
+
+def test_loops_and_id_filter(capture, buses):
+    sender, listener = buses
+    stats = k800_can.ReplayEngine(sender, capture, speed=0, loops=3, ids=[0x100, 0x300]).run()
+    frames = received(listener)
+    assert [msg.arbitration_id for msg in frames] == [0x100, 0x300] * 6
+    assert (stats.sent, stats.skipped) == (12, 6)
+
+
+def test_time_origin_excludes_opening_the_capture(capture, buses, monkeypatch):
+    open_capture = k800_can.open_capture
+
+    def slow_open(path):
+        time.sleep(0.2)  # a large capture being opened and parsed
+        yield from open_capture(path)
+
+    monkeypatch.setattr(k800_can, 'open_capture', slow_open)
+    sender, _ = buses
+    stats = k800_can.ReplayEngine(sender, capture).run()
+    assert stats.sent == 6
+    assert stats.jitter[0] < 0.05
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+
+import can
+import pytest
+
+import k800_can
+
+
+@pytest.fixture
+def name():
+    return f'k800-test-{os.getpid()}'
+
+
+def frames(start, count):
+    return [can.Message(timestamp=float(i), arbitration_id=i & 0x7FF, is_extended_id=False, data=[i & 0xFF])
+            for i in range(start, start + count)]
+
+
+def test_reader_follows_the_writer(name):
+    with k800_can.SharedFrameRing(name, capacity=1024, guard=64) as ring, \
+         k800_can.SharedFrameReader(name) as reader:
+        ring.write(frames(0, 300))
+        records = []
+        while reader.published != reader.cursor:
+            records += reader.read_records()
+        assert [record[0] for record in records] == [float(i) for i in range(300)]
+        assert (reader.read, reader.lost) == (300, 0)
+
+
+def test_lapped_reader_counts_lost_frames(name):
+    with k800_can.SharedFrameRing(name, capacity=1024, guard=64) as ring, \
+         k800_can.SharedFrameReader(name) as reader:
+        ring.write(frames(0, 5000))
+        records = []
+        while reader.published != reader.cursor:
+            records += reader.read_records()
+        # the reader resumes half a window behind the producer and keeps every frame from there
+        kept = (ring.capacity - ring.guard) // 2
+        assert reader.lost == 5000 - kept
+        assert reader.read == kept == len(records)
+        assert [record[0] for record in records] == [float(i) for i in range(5000 - kept, 5000)]
+
+
+def test_closed_ring_ends_iteration(name):
+    ring = k800_can.SharedFrameRing(name, capacity=1024, guard=64)
+    with k800_can.SharedFrameReader(name, from_start=True) as reader:
+        ring.write(frames(0, 10))
+        ring.close()
+        assert [msg.arbitration_id for msg in reader] == list(range(10))
+
+
+def writer(name, *, exit):
+    """Process publishing a ring under `name`, which exits without closing it or keeps running."""
+    code = (f"import os, sys, time, k800_can; ring = k800_can.SharedFrameRing({name!r}, capacity=1024, guard=64); "
+            # as if the resource tracker had died with the producer, so the segment stays behind
+            f"k800_can.resource_tracker.unregister(ring.segment._name, 'shared_memory'); "
+            f"print('ready', flush=True); " + ("os._exit(0)" if exit else "time.sleep(30)"))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=root, stdout=subprocess.PIPE, text=True)
+    assert process.stdout.readline() == 'ready\n'
+    return process
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='stale segments are only detected on POSIX')
+def test_replaces_the_ring_of_a_dead_writer(name):
+    writer(name, exit=True).wait()
+    with k800_can.SharedFrameRing(name, capacity=1024, guard=64) as ring:
+        assert ring.count == 0
+        with k800_can.SharedFrameReader(name) as reader:
+            assert reader.pid == os.getpid()
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='stale segments are only detected on POSIX')
+def test_keeps_the_ring_of_a_live_writer(name):
+    process = writer(name, exit=False)
+    try:
+        with pytest.raises(FileExistsError, match=str(process.pid)):
+            k800_can.SharedFrameRing(name, capacity=1024, guard=64)
+    finally:
+        process.kill()
+        process.wait()
+    # the ring the killed writer left behind is taken over now
+    with k800_can.SharedFrameRing(name, capacity=1024, guard=64):
+        pass
@@ -0,0 +1,72 @@
+import can
+import pytest
+
+import k800_can
+
+cantools = pytest.importorskip('cantools')
+
+DBC = '''VERSION ""
+
+NS_ :
+
+BS_:
+
+BU_: ECU
+
+BO_ 256 Engine: 8 ECU
+ SG_ Speed : 0|16@1+ (0.1,0) [0|6553.5] "km/h" Vector__XXX
+ SG_ Temperature : 16|8@1- (1,-40) [-168|87] "degC" Vector__XXX
+ SG_ Gear : 24|4@1+ (1,0) [0|15] "" Vector__XXX
+
+BO_ 2147484160 Battery: 4 ECU
+ SG_ Voltage : 7|16@0+ (0.01,0) [0|655.35] "V" Vector__XXX
+ SG_ Current : 23|16@0- (0.1,0) [-3276.8|3276.7] "A" Vector__XXX
+'''
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / 'vehicle.dbc'
+    path.write_text(DBC)
+    return k800_can.load_database(str(path), cache_dir=str(tmp_path / 'cache'))
+
+
+def frames():
+    return [
+        can.Message(arbitration_id=0x100, is_extended_id=False, data=bytes([0x10, 0x27, 0xF6, 0x03, 0, 0, 0, 0])),
+        can.Message(arbitration_id=0x200, is_extended_id=True, data=bytes([0x04, 0xD2, 0xFF, 0x9C])),
+        can.Message(arbitration_id=0x7FF, is_extended_id=False, data=bytes(8)),
+    ]
+
+
+def test_decode_matches_cantools(database):
+    decoder = k800_can.SignalDecoder(database)
+    for msg in frames()[:2]:
+        name, values = decoder.decode(msg)
+        expected = database.decode_message(msg.arbitration_id, msg.data, decode_choices=False,
+                                           force_extended_id=msg.is_extended_id)
+        assert name == {0x100: 'Engine', 0x200: 'Battery'}[msg.arbitration_id]
+        assert values == pytest.approx(expected)
+    assert decoder.decode(frames()[2]) is None
+
+
+def test_decoded_values(database):
+    name, values = k800_can.SignalDecoder(database).decode(frames()[0])
+    assert name == 'Engine'
+    assert values == pytest.approx({'Speed': 1000.0, 'Temperature': -50, 'Gear': 3})
+
+
+def test_decode_batch_columns(database):
+    pytest.importorskip('numpy')
+    batch = frames() * 3
+    columns = k800_can.SignalDecoder(database).decode_batch(batch)
+    assert set(columns) == {'Engine', 'Battery'}
+    assert list(columns['Battery']['Voltage']) == pytest.approx([12.34] * 3)
+    assert list(columns['Battery']['Current']) == pytest.approx([-10.0] * 3)
+
+
+def test_parsed_database_is_cached(tmp_path, database):
+    path = tmp_path / 'vehicle.dbc'
+    cached = k800_can.load_database(str(path), cache_dir=str(tmp_path / 'cache'))
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+    assert [message.name for message in cached.messages] == [message.name for message in database.messages]
@@ -0,0 +1,115 @@
+import time
+
+import can
+import pytest
+from can.interfaces.slcan import slcanBus
+
+import k800_can
+import k800_emulator
+
+
+def test_emulator_speed_codes_match_python_can():
+    for code, kbps in k800_emulator.SLCAN_BITRATES.items():
+        assert slcanBus._BITRATES[kbps * 1000] == 'S' + code
+    assert set(k800_emulator.SLCAN_BITRATES.values()) == set(k800_can.valid_bit_rates)
+
+
+def test_emulator_applies_speed_code():
+    state = k800_emulator.McuState(1000)
+    port = k800_emulator.SlcanPort(state)
+    try:
+        assert port.execute('S7') == k800_emulator.SLCAN_OK
+        assert state.bit_rate == 750
+    finally:
+        port.close()
+
+
+def test_kernel_slcan_speed_codes_match_python_can():
+    assert set(k800_can.SLCAN_SPEEDS) == set(k800_can.valid_bit_rates)
+    for kbps, command in k800_can.SLCAN_SPEEDS.items():
+        assert slcanBus._BITRATES[kbps * 1000] == command
+
+
+def test_push_acceptance_filter(emulator):
+    bus = k800_can.open_bus('slcan', channel=emulator.vcan_port, bitrate=500000, sleep_after_open=0)
+    try:
+        acceptance = k800_can.push_acceptance_filter(bus, [{'can_id': 0x123, 'can_mask': 0x7FF}])
+        assert acceptance == ('24600000', '001FFFFF')
+        # the emulator applies the commands on its own thread
+        deadline = time.monotonic() + 2.0
+        while emulator.state.acceptance != (0x24600000, 0x001FFFFF) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert emulator.state.acceptance == (0x24600000, 0x001FFFFF)
+        assert emulator.state.is_open
+    finally:
+        bus.shutdown()
+
+
+def test_push_acceptance_filter_needs_slcan():
+    bus = can.Bus(interface='virtual', channel='k800-test-filter')
+    try:
+        with pytest.raises(TypeError):
+            k800_can.push_acceptance_filter(bus, [{'can_id': 0x123, 'can_mask': 0x7FF}])
+    finally:
+        bus.shutdown()
+
+
+def test_slcan_bus_state_follows_status_flags(emulator):
+    bus = k800_can.open_bus('slcan', channel=emulator.vcan_port, bitrate=500000, sleep_after_open=0)
+    try:
+        assert bus.state == can.BusState.ACTIVE
+        emulator.state.status = 0
+        assert bus.poll_status(1.0) == 0
+        assert bus.state == can.BusState.ACTIVE
+        emulator.state.status = 0x24
+        assert bus.poll_status(1.0) == 0x24
+        assert bus.state == can.BusState.PASSIVE
+        assert k800_can.slcan_status_flags(bus.status) == ['error_warning', 'error_passive']
+        emulator.state.status = 0x80
+        bus.poll_status(1.0)
+        assert bus.state == can.BusState.ERROR
+    finally:
+        bus.shutdown()
+
+
+def test_metrics_poll_slcan_status(emulator):
+    bus = k800_can.open_bus('slcan', channel=emulator.vcan_port, bitrate=500000, sleep_after_open=0)
+    try:
+        emulator.state.status = 0x20
+        metrics = k800_can.BusMetrics(500, buses=[bus], interval=0.5, exclusive=True)
+        metrics.sample()
+        assert metrics.bus_state == 'PASSIVE'
+        assert 'error_passive' in metrics.summary()
+        assert 'k800_slcan_status{flag="error_passive"} 1' in metrics.prometheus()
+    finally:
+        bus.shutdown()
+
+
+def test_metrics_classify_send_timeouts():
+    import serial
+    metrics = k800_can.BusMetrics(500)
+    msg = can.Message(arbitration_id=0x123)
+    try:
+        raise can.CanOperationError('write failed') from serial.SerialTimeoutException('Write timeout')
+    except can.CanOperationError as e:
+        metrics.on_error(msg, e)
+    metrics.on_error(msg, can.CanOperationError('transmit buffer full, timeout flag cleared'))
+    assert metrics.counters['tx_errors'] == 2
+    assert metrics.counters['tx_timeouts'] == 1
+
+
+def test_metrics_leave_reading_to_the_receiver(emulator):
+    bus = k800_can.open_bus('slcan', channel=emulator.vcan_port, bitrate=500000, sleep_after_open=0)
+    receiver = k800_can.Receiver(bus).start()
+    try:
+        emulator.state.status = 0x20
+        metrics = k800_can.BusMetrics(500, buses=[bus], receiver=receiver)
+        metrics.sample()
+        # the reply reaches the status through the receiver's reads
+        deadline = time.monotonic() + 2.0
+        while bus.status is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert metrics.bus_state == 'PASSIVE'
+    finally:
+        receiver.stop()
+        bus.shutdown()
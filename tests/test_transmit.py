@@ -0,0 +1,97 @@
+import time
+
+import can
+import pytest
+
+import k800_can
+
+
+def frames(count, dlc=8, extended=False):
+    return [can.Message(arbitration_id=0x123, is_extended_id=extended, data=bytes(dlc)) for _ in range(count)]
+
+
+@pytest.fixture
+def bus():
+    bus = can.Bus(interface='virtual', channel='k800-test-transmit')
+    yield bus
+    bus.shutdown()
+
+
+def test_frame_bit_length():
+    assert k800_can.frame_bit_length(8) == 111
+    assert k800_can.frame_bit_length(8, is_extended_id=True) == 131
+    assert k800_can.frame_bit_length(0) == 47
+
+
+def test_rejects_ambiguous_pacing(bus):
+    with pytest.raises(ValueError):
+        k800_can.TransmitEngine(bus, frames(1))
+    with pytest.raises(ValueError):
+        k800_can.TransmitEngine(bus, frames(1), fps=10, bus_load=10)
+    with pytest.raises(ValueError):
+        k800_can.TransmitEngine(bus, frames(1), bus_load=150)
+
+
+def test_fps_pacing(bus):
+    # the bucket starts with one token, so 21 frames at 200 fps take 20 intervals
+    engine = k800_can.TransmitEngine(bus, frames(21), fps=200)
+    start = time.perf_counter()
+    stats = engine.run()
+    elapsed = time.perf_counter() - start
+    assert stats.sent == 21 and stats.failed == 0
+    assert 0.095 <= elapsed < 0.2
+
+
+def test_bus_load_pacing(bus):
+    # 50 % of 125 kbps is 62500 bit/s; the first frame is covered by the initial tokens
+    engine = k800_can.TransmitEngine(bus, frames(30), bus_load=50, bitrate=125)
+    start = time.perf_counter()
+    stats = engine.run()
+    elapsed = time.perf_counter() - start
+    assert stats.bits == 30 * 111
+    assert 29 * 111 / 62500 * 0.95 <= elapsed < 0.15
+
+
+def test_count_and_burst(bus):
+    sent = []
+    engine = k800_can.TransmitEngine(bus, frames(100), fps=1000, burst=8, on_sent=sent.append)
+    stats = engine.run(count=20)
+    assert stats.sent == len(sent) == 20
+
+
+def test_send_errors_are_counted():
+    class FailingBus:
+        def send(self, msg, timeout=None):
+            raise can.CanOperationError("TX buffer full")
+
+    errors = []
+    stats = k800_can.TransmitEngine(FailingBus(), frames(3), fps=1000,
+                                    on_error=lambda msg, e: errors.append(e)).run()
+    assert stats.sent == 0 and stats.failed == len(errors) == 3
+
+
+def test_achieved_rate_counts_intervals(bus):
+    # 5 frames at 10 fps span 4 intervals, 0.4 s
+    stats = k800_can.TransmitEngine(bus, frames(5), fps=10, bitrate=125).run()
+    assert stats.achieved_fps == pytest.approx(10, rel=0.05)
+    assert stats.achieved_load == pytest.approx(100 * 10 * 111 / 125000, rel=0.05)
+    assert '10.0 fps' in stats.report() or '9.9 fps' in stats.report()
+
+
+def test_single_frame_reports_no_rate(bus):
+    stats = k800_can.TransmitEngine(bus, frames(1), fps=10).run()
+    assert stats.sent == 1 and stats.achieved_fps == 0.0
+    assert stats.report().startswith('Sent 1 frames (0 failed) in ')
+    assert 'bus load at' not in stats.report()
+
+
+def test_registry_transmit_uses_each_device_bitrate():
+    registry = k800_can.DeviceRegistry()
+    registry.devices = {unit: k800_can.K800Device(unit, {}) for unit in ('k800-test-a', 'k800-test-b')}
+    registry.open(['k800-test-a'], interface='virtual', bit_rate=250)
+    registry.open(['k800-test-b'], interface='virtual', bit_rate=125)
+    try:
+        stats = registry.transmit(lambda device: frames(2), fps=1000)
+    finally:
+        registry.close()
+    assert {unit: stat.bitrate for unit, stat in stats.items()} == {'k800-test-a': 250, 'k800-test-b': 125}